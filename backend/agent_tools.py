@@ -1,53 +1,191 @@
 ﻿# backend/agent_tools.py
 import re
-from typing import List, Dict, Any, Optional
+import bisect
+from typing import List, Dict, Any, Optional, Tuple
 from bs4 import BeautifulSoup
 
+from backend.tracing import traced
+
 # -----------------------------
-# Extraction helpers (unchanged)
+# Fact extraction rules
 # -----------------------------
-def extract_discount_info_from_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    findings = []
-    code_re = re.compile(r'(?:code|coupon|promo)\s*(?:[:\-]?\s*)?([A-Z0-9]{3,20})', re.I)
-    percent_re = re.compile(r'(\d{1,2})\s*%\s*(?:off|discount)?', re.I)
-    min_order_re = re.compile(r'(?:orders?)\s*(?:above|over|>=)\s*\$?(\d+)', re.I)
-    for c in chunks:
-        text = (c.get("document") or "")
+# Each rule is one regex with a single named group, named after the rule, that captures the value.
+# "anchor" rules start a fact of their kind; "attribute" rules give their value to the nearest
+# anchor of the same kind in the same chunk (see _bind).
+# Rules are tried in order at each position, so put a rule before any rule matching a prefix
+# of its text. "first" is a character class body of the characters a match can start with
+# (case-insensitive); when every rule has one, positions starting with anything else are
+# skipped without trying the rules. A new fact type is a new rule, not another scan.
+FACT_RULES: List[Dict[str, Any]] = [
+    {"name": "free_over", "kind": "shipping", "role": "anchor", "type": int, "first": "f",
+     "pattern": r'free\s+for\s+orders\s+(?:over|above|>=)\s*\$?(?P<free_over>\d+)'},
+    # the code itself must be upper case ("SAVE15"), so "Coupon code" or "code: Apply" are not codes
+    {"name": "code", "kind": "discount", "role": "anchor", "type": str, "first": "cp",
+     "pattern": r'(?:code|coupon|promo)\s*(?:[:\-]?\s*)?\b(?P<code>(?-i:[A-Z0-9]{3,20}))\b'},
+    {"name": "percent", "kind": "discount", "role": "attribute", "type": int, "first": "0-9",
+     "pattern": r'(?<!\d)(?P<percent>100|[1-9]?\d)\s*%\s*(?:off|discount)?'},
+    {"name": "min_order", "kind": "discount", "role": "attribute", "type": int, "first": "o",
+     "pattern": r'(?:orders?)\s*(?:above|over|>=)\s*\$?(?P<min_order>\d+)'},
+]
+# Separates chunks in a batch; no rule can match across it
+CHUNK_SEPARATOR = "\x00"
+# Only searched between an anchor and a candidate value, not over the whole text
+SENTENCE_BREAK_RE = re.compile(r'[.!?](?=\s|$)|\n')
+
+
+def compile_fact_rules(rules: List[Dict[str, Any]]) -> Tuple[re.Pattern, Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+    """
+    Combine the rules into one alternation pattern, matched in a single pass over the text.
+    Returns the rule set (pattern, rule by name, attribute names by kind) for extract_facts_batch.
+    """
+    by_name: Dict[str, Dict[str, Any]] = {}
+    attributes: Dict[str, List[str]] = {}
+    for rule in rules:
+        name = rule["name"]
+        if name in by_name:
+            raise ValueError(f"duplicate fact rule {name!r}")
+        if rule["role"] not in ("anchor", "attribute"):
+            raise ValueError(f"fact rule {name!r}: role must be 'anchor' or 'attribute'")
+        if re.compile(rule["pattern"], re.I).groupindex.keys() != {name}:
+            raise ValueError(f"fact rule {name!r}: pattern must have exactly one named group, (?P<{name}>...)")
+        by_name[name] = rule
+        attributes.setdefault(rule["kind"], [])
+        if rule["role"] == "attribute":
+            attributes[rule["kind"]].append(name)
+    prefilter = "(?=[" + "".join(rule["first"] for rule in rules) + "])" if all(r.get("first") for r in rules) else ""
+    pattern = re.compile(prefilter + "(?:" + "|".join(f"(?:{rule['pattern']})" for rule in rules) + ")", re.I)
+    return pattern, by_name, attributes
+
+FACT_RULESET = compile_fact_rules(FACT_RULES)
+
+
+def _crosses_sentence(text: str, lo: int, hi: int) -> bool:
+    return lo < hi and SENTENCE_BREAK_RE.search(text, lo, hi) is not None
+
+def _bind(text: str, anchor: Tuple[int, int], values: List[Tuple[int, int, Any]],
+          other_anchors: List[Tuple[int, int]]) -> Any:
+    """
+    The value nearest to the anchor span, preferring values in the same sentence. A value in
+    another sentence is skipped when it shares a sentence with another anchor of the same kind
+    ("Code SAVE10: 10% off. Code SAVE20 applies too." leaves SAVE20 without a percent
+    instead of giving it SAVE10's 10).
+    """
+    best, best_cost = None, None
+    a_start, a_end = anchor
+    for v_start, v_end, value in values:
+        lo, hi = (v_end, a_start) if v_end <= a_start else (a_end, v_start)
+        crosses = _crosses_sentence(text, lo, hi)
+        if crosses and any(not _crosses_sentence(text, min(v_end, o_end), max(v_start, o_start))
+                           for o_start, o_end in other_anchors):
+            continue
+        cost = (crosses, hi - lo, v_end <= a_start)   # ties go to the later value
+        if best_cost is None or cost < best_cost:
+            best, best_cost = value, cost
+    return best
+
+def _bind_chunk(text: str, matches: List[Tuple[str, int, int, Any]], ruleset) -> Dict[str, List[Dict[str, Any]]]:
+    """Facts of one chunk from its (rule name, start, end, value) matches, in text order."""
+    _, by_name, attributes_by_kind = ruleset
+    facts: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in attributes_by_kind}
+    values: Dict[str, List[Tuple[int, int, Any]]] = {}
+    anchors: Dict[str, List[Tuple[int, int]]] = {}
+    if not matches:
+        return facts
+    for name, start, end, value in matches:
+        rule = by_name[name]
+        if rule["role"] == "attribute":
+            values.setdefault(name, []).append((start, end, value))
+        else:
+            anchors.setdefault(rule["kind"], []).append((start, end))
+    for name, start, end, value in matches:
+        rule = by_name[name]
+        if rule["role"] != "anchor":
+            continue
+        others = [a for a in anchors[rule["kind"]] if a != (start, end)]
+        fact = {name: value}
+        for attr in attributes_by_kind[rule["kind"]]:
+            fact[attr] = _bind(text, (start, end), values[attr], others) if attr in values else None
+        if fact not in facts[rule["kind"]]:   # a code repeated with the same values is one fact
+            facts[rule["kind"]].append(fact)
+    return facts
+
+def extract_facts_batch(texts: List[str], ruleset=None) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Facts of many chunks at once: {"discount": [{"code", "percent", "min_order"}, ...],
+    "shipping": [{"free_over"}, ...]} per text. The texts are joined and scanned with the
+    combined rule pattern in one pass; each match is mapped back to its chunk by offset.
+    `ruleset` defaults to FACT_RULESET (see compile_fact_rules).
+    """
+    ruleset = ruleset or FACT_RULESET
+    pattern, by_name, _ = ruleset
+    texts = [(t or "").replace(CHUNK_SEPARATOR, " ") for t in texts]
+    offsets, pos = [], 0
+    for t in texts:
+        offsets.append(pos)
+        pos += len(t) + len(CHUNK_SEPARATOR)
+    joined = CHUNK_SEPARATOR.join(texts)
+    per_chunk: List[List[Tuple[str, int, int, Any]]] = [[] for _ in texts]
+    for m in pattern.finditer(joined):
+        name = m.lastgroup
+        i = bisect.bisect_right(offsets, m.start()) - 1
+        per_chunk[i].append((name, m.start(), m.end(), by_name[name]["type"](m.group(name))))
+    return [_bind_chunk(joined, matches, ruleset) for matches in per_chunk]
+
+def extract_facts(text: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Facts of one chunk of text (see extract_facts_batch)."""
+    return extract_facts_batch([text])[0]
+
+def extract_discount_facts(text: str) -> List[Dict[str, Any]]:
+    """Discount codes in one chunk of text, each with its nearest percent and minimum order."""
+    return extract_facts(text)["discount"]
+
+def extract_shipping_facts(text: str) -> List[Dict[str, Any]]:
+    """Free-shipping thresholds in one chunk of text."""
+    return extract_facts(text)["shipping"]
+
+def extract_facts_from_chunks(chunks: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Facts of retrieved chunks by kind, each tagged with its chunk's source."""
+    findings: Dict[str, List[Dict[str, Any]]] = {kind: [] for kind in FACT_RULESET[2]}
+    extracted = extract_facts_batch([c.get("document") or "" for c in chunks])
+    for c, facts in zip(chunks, extracted):
         source = c.get("metadata", {}).get("source", "unknown")
-        codes = code_re.findall(text)
-        percents = percent_re.findall(text)
-        mins = min_order_re.findall(text)
-        for code in codes:
-            percent = int(percents[0]) if percents else None
-            min_order = int(mins[0]) if mins else None
-            findings.append({"code": code.strip(), "percent": percent, "min_order": min_order, "source": source})
+        for kind, items in facts.items():
+            findings[kind].extend(dict(fact, source=source) for fact in items)
     return findings
 
+def extract_discount_info_from_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return extract_facts_from_chunks(chunks)["discount"]
+
 def extract_shipping_info_from_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    findings = []
-    free_ship_re = re.compile(r'free\s+for\s+orders\s+(?:over|above|>=)\s*\$?(\d+)', re.I)
-    for c in chunks:
-        text = (c.get("document") or "")
-        source = c.get("metadata", {}).get("source", "unknown")
-        m = free_ship_re.search(text)
-        if m:
-            findings.append({"free_over": int(m.group(1)), "source": source})
-    return findings
+    return extract_facts_from_chunks(chunks)["shipping"]
 
 # -----------------------------
 # Testcase generation
 # -----------------------------
+@traced("generate_test_cases_from_context",
+        attributes=lambda query, retrieved_chunks: {"chunks": len(retrieved_chunks), "query_chars": len(query)},
+        result_attributes=lambda testcases: {"testcases": len(testcases)})
 def generate_test_cases_from_context(query: str, retrieved_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    facts = extract_facts_from_chunks(retrieved_chunks)
+    return generate_test_cases_from_facts(facts["discount"], facts["shipping"])
+
+@traced("generate_test_cases_from_facts",
+        result_attributes=lambda testcases: {"testcases": len(testcases)})
+def generate_test_cases_from_facts(discount_facts: List[Dict[str, Any]],
+                                   shipping_facts: List[Dict[str, Any]],
+                                   discount_start: int = 1, shipping_start: int = 1) -> List[Dict[str, Any]]:
+    """Testcases for extracted facts: {"code", "percent", "min_order", "source"} discounts and
+       {"free_over", "source"} shipping thresholds; "sources" (all files stating the fact)
+       is used for Grounded_In when present. Test IDs are numbered from discount_start and
+       shipping_start, so facts can be passed in pages."""
     testcases = []
-    discount_facts = extract_discount_info_from_chunks(retrieved_chunks)
-    shipping_facts = extract_shipping_info_from_chunks(retrieved_chunks)
-    for i, fact in enumerate(discount_facts, 1):
+    for i, fact in enumerate(discount_facts, discount_start):
         if not fact.get("code"):
             continue
         code = fact["code"]
         pct = fact.get("percent")
         min_order = fact.get("min_order")
-        src = fact["source"]
+        grounded = fact.get("sources") or [fact["source"]]
         tid = f"TC-DISCOUNT-{i:03d}"
         steps = [
             "Open the checkout page.",
@@ -65,7 +203,7 @@ def generate_test_cases_from_context(query: str, retrieved_chunks: List[Dict[str
             "Preconditions": pre,
             "Expected_Result": expected,
             "Type": "Positive",
-            "Grounded_In": [src]
+            "Grounded_In": list(grounded)
         })
         tid2 = f"TC-DISCOUNT-{i:03d}-NEG"
         steps2 = [
@@ -82,11 +220,11 @@ def generate_test_cases_from_context(query: str, retrieved_chunks: List[Dict[str
             "Preconditions": "Cart subtotal valid",
             "Expected_Result": "An error message is shown and no discount is applied.",
             "Type": "Negative",
-            "Grounded_In": [src]
+            "Grounded_In": list(grounded)
         })
-    for j, sf in enumerate(shipping_facts, 1):
+    for j, sf in enumerate(shipping_facts, shipping_start):
         free_over = sf["free_over"]
-        src = sf["source"]
+        grounded = sf.get("sources") or [sf["source"]]
         tid = f"TC-SHIP-{j:03d}"
         steps = [
             "Open the checkout page.",
@@ -101,7 +239,7 @@ def generate_test_cases_from_context(query: str, retrieved_chunks: List[Dict[str
             "Preconditions": "Cart subtotal meets threshold",
             "Expected_Result": "Shipping cost is $0 (free).",
             "Type": "Positive",
-            "Grounded_In": [src]
+            "Grounded_In": list(grounded)
         })
         tid2 = f"TC-SHIP-{j:03d}-NEG"
         steps2 = [
@@ -117,7 +255,7 @@ def generate_test_cases_from_context(query: str, retrieved_chunks: List[Dict[str
             "Preconditions": "Cart subtotal below threshold",
             "Expected_Result": "Shipping cost is greater than $0.",
             "Type": "Negative",
-            "Grounded_In": [src]
+            "Grounded_In": list(grounded)
         })
     return testcases
 
@@ -194,6 +332,9 @@ def extract_coupon_code_from_testcase(test_case: Dict[str, Any]) -> Optional[str
 # -----------------------------
 # Selenium script generator
 # -----------------------------
+@traced("generate_selenium_script_html",
+        attributes=lambda test_case, checkout_html, html_path: {"html_chars": len(checkout_html or "")},
+        result_attributes=lambda script: {"script_chars": len(script)})
 def generate_selenium_script_html(test_case: Dict[str, Any], checkout_html: str, html_path: str) -> str:
     """
     Generates a Python Selenium script (string) given a test_case dict and the checkout HTML (string).
@@ -1,49 +1,301 @@
 # backend/app.py
 import os
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from backend.retrieval import retrieve_topk, build_rag_prompt, call_llm
-from pydantic import BaseModel
-from backend.agent_tools import generate_test_cases_from_context, generate_selenium_script_html
+import json
+import time
+import asyncio
+import threading
+from typing import Annotated, Any, Dict, List, Literal, Optional, TypeVar, Union
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from backend.retrieval import (retrieve_topk_batch, retrieve_with_stages, build_rag_prompt, acall_llm,
+                               cached_llm_answer, store_llm_answer, get_collection, retrieval_cache,
+                               get_llm_cache, semantic_cache, semantic_cached_answer, store_semantic_answer,
+                               record_llm_usage)
+from backend import llm_client
+from backend.llm_client import astream_llm
+from backend.agent_tools import (generate_test_cases_from_context, generate_test_cases_from_facts,
+                                 generate_selenium_script_html)
+from backend.fact_index import facts_for_query
+from backend.bulk_testcases import BULK_PAGE_SIZE, iter_testcases
+from backend.vector_store import warmup, get_index_generation
+from backend.encoder import is_model_loaded, query_vector_cache, EMBED_BACKEND
+from backend.metadata_filter import build_where
+from backend.context_packer import pack_context, context_report
+from backend.reranker import RERANK_ENABLED, warmup_reranker, score_cache
+from backend.tracing import span, shutdown as shutdown_tracing
+from backend.metrics import (METRICS_ENABLED, SERVER_TIMING_ENABLED, stage, record_stage, record_llm_call,
+                             begin_request, end_request, request_latency, requests_in_flight, server_timing,
+                             render as render_metrics)
 
+# Load the embedding model in a background thread at startup so the server accepts
+# connections immediately; /ready reports when it is done. Set WARMUP_ON_STARTUP=0 to
+# load lazily on the first request (or via POST /warmup) instead.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") not in ("0", "false", "False")
 
+_warmup_state = {"error": None}
 
+def _run_warmup():
+    try:
+        warmup()
+        if RERANK_ENABLED:
+            warmup_reranker()
+        _warmup_state["error"] = None
+    except Exception as e:
+        _warmup_state["error"] = str(e)
+        print(f"Warm-up failed: {e}")
 
-app = FastAPI(title="RAG QA Agent - Simple API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=_run_warmup, name="warmup", daemon=True).start()
+    yield
+    await llm_client.aclose()
+    shutdown_tracing()
+
+
+app = FastAPI(title="RAG QA Agent - Simple API", lifespan=lifespan)
+
+_route_paths = set()
+
+def _endpoint_label(path: str) -> str:
+    # label by route, never by raw URL, so unknown paths cannot blow up the series count
+    if not _route_paths:
+        _route_paths.update(getattr(r, "path", None) for r in app.routes)
+    return path if path in _route_paths else "other"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Per-endpoint latency histogram and in-flight gauge; stage timings recorded while the
+       request is handled are returned in a Server-Timing header. For streamed responses
+       both cover the time until the response starts."""
+    if not METRICS_ENABLED:
+        return await call_next(request)
+    endpoint = _endpoint_label(request.url.path)
+    token = begin_request(endpoint)
+    requests_in_flight.inc((endpoint,))
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - t0
+        requests_in_flight.dec((endpoint,))
+        request_latency.observe((endpoint, str(status)), elapsed)
+        timings = end_request(token)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Root span of a request; retrieval, LLM and generator spans are its children."""
+    with span(f"{request.method} {_endpoint_label(request.url.path)}") as current:
+        response = await call_next(request)
+        current.set_attribute("http.status_code", response.status_code)
+        return response
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the embedding model is loaded, 503 before."""
+    body = {
+        "ready": is_model_loaded(),
+        "model_loaded": is_model_loaded(),
+        "embed_backend": EMBED_BACKEND,
+        "collection_available": get_collection() is not None,
+        "query_vector_cache": query_vector_cache.info(),
+        "warmup_error": _warmup_state["error"],
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/cache_stats")
+def cache_stats():
+    """Hit/miss counters of the in-process caches."""
+    return {
+        "index_generation": get_index_generation(),
+        "retrieval_cache": retrieval_cache.info(),
+        "query_vector_cache": query_vector_cache.info(),
+        "llm_cache": get_llm_cache().info(),
+        "semantic_cache": semantic_cache.info(),
+        "rerank_score_cache": score_cache.info(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: request and per-stage latency histograms, in-flight requests,
+       LLM calls and tokens, and the cache counters of /cache_stats."""
+    return PlainTextResponse(render_metrics(cache_stats()), media_type="text/plain; version=0.0.4")
+
+@app.post("/warmup")
+def warmup_endpoint():
+    """Load the model and open the vector store now (blocking)."""
+    _run_warmup()
+    if _warmup_state["error"]:
+        raise HTTPException(status_code=500, detail={"error": _warmup_state["error"]})
+    return {"status": "ok", "model_loaded": is_model_loaded(), "embed_backend": EMBED_BACKEND}
+
+RetrievalMode = Literal["dense", "lexical", "hybrid"]
+
+# Filter lists must not be empty (422): "any of" nothing would match no chunk
+T = TypeVar("T")
+NonEmptyList = Annotated[List[T], Field(min_length=1)]
+
+class RetrievalFilter(BaseModel):
+    """Restrict retrieval to matching chunks; a list means "any of". Applied before top-k."""
+    source: Optional[Union[str, NonEmptyList[str]]] = None          # file name, e.g. "checkout.html"
+    file_type: Optional[Union[str, NonEmptyList[str]]] = None       # "html", "md", "txt", "json"
+    ingest_batch: Optional[Union[int, NonEmptyList[int]]] = None    # index generation of the ingest run
+
+def _where(payload) -> Optional[Dict[str, Any]]:
+    return build_where(**payload.where.model_dump()) if payload.where else None
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 3
     use_llm: bool = True   # if false, only return retrieved chunks without calling LLM
+    mode: Optional[RetrievalMode] = None   # retrieval mode; defaults to RETRIEVAL_MODE
+    where: Optional[RetrievalFilter] = None
+    mmr: Optional[bool] = None             # diversify results (MMR); defaults to MMR_ENABLED
+    rerank: Optional[bool] = None          # cross-encoder rerank; defaults to RERANK_ENABLED
 
+# Query-path handlers are async: retrieval and other CPU-bound work run in the threadpool,
+# LLM calls go through the pooled, concurrency-limited async client, so slow LLM calls
+# never hold a worker thread.
 @app.post("/query_agent")
-def query_agent(payload: QueryRequest):
-    # 1) retrieve top-k chunks
-    retrieved = retrieve_topk(payload.query, top_k=payload.top_k)
+async def query_agent(payload: QueryRequest):
+    # 1) retrieve top-k chunks (optionally reranked)
+    retrieved, stages = await run_in_threadpool(retrieve_with_stages, payload.query, top_k=payload.top_k,
+                                                mode=payload.mode, where=_where(payload), mmr=payload.mmr,
+                                                rerank=payload.rerank)
 
     if not retrieved:
         return {"status": "no_context", "message": "No relevant documents found in the knowledge base.", "retrieved": []}
 
     # 2) if user requested only retrieval, return the chunks
     if not payload.use_llm:
-        return {"status": "ok", "retrieved": retrieved}
+        return {"status": "ok", "retrieved": retrieved, **stages}
+
+    # 3) a paraphrase of an earlier query grounded in the same chunks reuses its answer
+    semantic = await run_in_threadpool(semantic_cached_answer, payload.query, retrieved)
+    if semantic:
+        return {"status": "ok", "answer": semantic["answer"], "retrieved": retrieved, **stages,
+                "cache": {"type": "semantic", "matched_query": semantic["query"], "distance": semantic["distance"]}}
 
-    # 3) build RAG prompt
-    prompt = build_rag_prompt(payload.query, retrieved)
+    # 4) build RAG prompt (retrieved chunks packed into the context token budget)
+    packed, prompt = await run_in_threadpool(_build_prompt, payload.query, retrieved)
 
-    # 4) call LLM
-    llm_res = call_llm(prompt)
+    # 5) call LLM
+    llm_res = await acall_llm(prompt)
     if not llm_res.get("ok"):
         raise HTTPException(status_code=500, detail={"error": llm_res.get("error"), "retrieved": retrieved})
 
-    return {"status": "ok", "answer": llm_res.get("answer"), "retrieved": retrieved}
-# in backend/app.py (add imports at top)
+    await run_in_threadpool(store_semantic_answer, payload.query, retrieved, llm_res.get("answer"))
+    return {"status": "ok", "answer": llm_res.get("answer"), "retrieved": retrieved, "context": context_report(packed),
+            **stages}
+
+def _build_prompt(query: str, retrieved: List[Dict[str, Any]]):
+    """(packed context, RAG prompt); tokenizer work, so handlers run it in the threadpool."""
+    with stage("build_rag_prompt"):
+        packed = pack_context(retrieved)
+        return packed, build_rag_prompt(query, retrieved, packed=packed)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant of /query_agent (server-sent events):
+#   event: retrieved  -> {"retrieved": [...]}            sent as soon as retrieval finishes
+#   event: token      -> {"text": "..."}                 one per LLM delta
+#   event: done       -> {"status", "answer", "timings_ms", ["rerank"], ["cache" | "cached"]}
+#   event: error      -> {"error", "partial_answer"}   instead of done when the LLM fails
+@app.post("/query_agent_stream")
+async def query_agent_stream(payload: QueryRequest):
+    async def events():
+        t0 = time.perf_counter()
+        retrieved, stages = await run_in_threadpool(retrieve_with_stages, payload.query, top_k=payload.top_k,
+                                                    mode=payload.mode, where=_where(payload), mmr=payload.mmr,
+                                                    rerank=payload.rerank)
+        timings = stages["timings_ms"]          # retrieval (+ rerank) stage times
+        rerank_info = {"rerank": stages["rerank"]} if "rerank" in stages else {}
+        yield _sse("retrieved", {"retrieved": retrieved})
+        if not retrieved:
+            yield _sse("done", {"status": "no_context", "message": "No relevant documents found in the knowledge base.",
+                                "timings_ms": timings, **rerank_info})
+            return
+        if not payload.use_llm:
+            yield _sse("done", {"status": "ok", "timings_ms": timings, **rerank_info})
+            return
+
+        # a paraphrase of an earlier query grounded in the same chunks reuses its answer (as in /query_agent)
+        semantic = await run_in_threadpool(semantic_cached_answer, payload.query, retrieved)
+        if semantic:
+            yield _sse("token", {"text": semantic["answer"]})
+            yield _sse("done", {"status": "ok", "answer": semantic["answer"],
+                                "cache": {"type": "semantic", "matched_query": semantic["query"],
+                                          "distance": semantic["distance"]},
+                                "timings_ms": {**timings, "total": round(1000 * (time.perf_counter() - t0), 1)},
+                                **rerank_info})
+            return
+
+        packed, prompt = await run_in_threadpool(_build_prompt, payload.query, retrieved)
+        cached = await run_in_threadpool(cached_llm_answer, prompt)
+        if cached is not None:
+            record_llm_call("cached")
+            yield _sse("token", {"text": cached})
+            yield _sse("done", {"status": "ok", "answer": cached, "cached": True, "context": context_report(packed),
+                                "timings_ms": {**timings, "total": round(1000 * (time.perf_counter() - t0), 1)},
+                                **rerank_info})
+            return
+
+        parts = []
+        first_token_ms = None
+        t_llm = time.perf_counter()
+        try:
+            with span("call_llm", prompt_chars=len(prompt), stream=True):
+                async for delta in astream_llm(prompt):
+                    if first_token_ms is None:
+                        first_token_ms = round(1000 * (time.perf_counter() - t0), 1)
+                    parts.append(delta)
+                    yield _sse("token", {"text": delta})
+        except llm_client.LLMError as e:
+            # missing key, HTTP failure, interrupted or malformed stream: the message says which
+            record_llm_usage(prompt, {"ok": False})
+            yield _sse("error", {"error": str(e), "partial_answer": "".join(parts)})
+            return
+        except Exception as e:
+            record_llm_usage(prompt, {"ok": False})
+            yield _sse("error", {"error": f"unexpected {type(e).__name__} while streaming: {e}",
+                                 "partial_answer": "".join(parts)})
+            return
+        answer = "".join(parts).strip()
+        record_stage("llm", time.perf_counter() - t_llm)
+        record_llm_usage(prompt, {"ok": True, "answer": answer})
+        await run_in_threadpool(store_llm_answer, prompt, answer)
+        await run_in_threadpool(store_semantic_answer, payload.query, retrieved, answer)
+        yield _sse("done", {
+            "status": "ok",
+            "answer": answer,
+            "context": context_report(packed),
+            "timings_ms": {**timings, "first_token": first_token_ms,
+                           "total": round(1000 * (time.perf_counter() - t0), 1)},
+            **rerank_info,
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 
 # Add Pydantic models
 class TestcaseRequest(BaseModel):
     query: str
     top_k: int = 3
+    mode: Optional[RetrievalMode] = None
+    where: Optional[RetrievalFilter] = None
+    mmr: Optional[bool] = None
+    rerank: Optional[bool] = None
 
 class ScriptRequest(BaseModel):
     test_case: dict
@@ -52,12 +304,113 @@ class ScriptRequest(BaseModel):
 
 # Endpoint to generate test cases (deterministic, grounded)
 @app.post("/generate_testcases")
-def generate_testcases(payload: TestcaseRequest):
-    retrieved = retrieve_topk(payload.query, top_k=payload.top_k)
+async def generate_testcases(payload: TestcaseRequest):
+    retrieved, stages = await run_in_threadpool(retrieve_with_stages, payload.query, top_k=payload.top_k,
+                                                mode=payload.mode, where=_where(payload), mmr=payload.mmr,
+                                                rerank=payload.rerank)
     if not retrieved:
         return {"status": "no_context", "retrieved": []}
-    testcases = generate_test_cases_from_context(payload.query, retrieved)
-    return {"status": "ok", "testcases": testcases, "retrieved": retrieved}
+    t0 = time.perf_counter()
+    with stage("generate_testcases"):
+        testcases, facts_from = await run_in_threadpool(_generate_testcases, payload.query, retrieved,
+                                                        _where(payload))
+    stages["timings_ms"]["testcases"] = round(1000 * (time.perf_counter() - t0), 2)
+    return {"status": "ok", "testcases": testcases, "facts_from": facts_from, "retrieved": retrieved, **stages}
+
+def _generate_testcases(query: str, retrieved: List[Dict[str, Any]], where: Optional[Dict[str, Any]] = None):
+    """Testcases from the ingest-time fact index (the facts of the retrieved chunks' files, of
+       the kinds the query asks about), or from the retrieved chunks if the index has not
+       been built yet. Returns (testcases, "index" | "retrieved")."""
+    facts = facts_for_query(query, retrieved, where)
+    if facts is None:
+        return generate_test_cases_from_context(query, retrieved), "retrieved"
+    return generate_test_cases_from_facts(facts["discount"], facts["shipping"]), "index"
+
+class QueryBatchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 3
+    use_llm: bool = True
+    mode: Optional[RetrievalMode] = None
+    where: Optional[RetrievalFilter] = None
+    mmr: Optional[bool] = None
+
+class TestcaseBatchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 3
+    mode: Optional[RetrievalMode] = None
+    where: Optional[RetrievalFilter] = None
+    mmr: Optional[bool] = None
+
+# Batch endpoints: all queries are embedded in one encoder call and searched with one
+# multi-query collection.query. Failures are reported per query instead of failing the batch.
+@app.post("/query_batch")
+async def query_batch(payload: QueryBatchRequest):
+    batch = await run_in_threadpool(retrieve_topk_batch, payload.queries, top_k=payload.top_k, mode=payload.mode,
+                                    where=_where(payload), mmr=payload.mmr)
+
+    async def _answer(query, retrieved):
+        if not retrieved:
+            return {"query": query, "status": "no_context", "retrieved": []}
+        if not payload.use_llm:
+            return {"query": query, "status": "ok", "retrieved": retrieved}
+        semantic = await run_in_threadpool(semantic_cached_answer, query, retrieved)
+        if semantic:
+            return {"query": query, "status": "ok", "answer": semantic["answer"], "retrieved": retrieved,
+                    "cache": {"type": "semantic", "matched_query": semantic["query"], "distance": semantic["distance"]}}
+        packed, prompt = await run_in_threadpool(_build_prompt, query, retrieved)
+        llm_res = await acall_llm(prompt)
+        if not llm_res.get("ok"):
+            return {"query": query, "status": "error", "error": llm_res.get("error"), "retrieved": retrieved}
+        await run_in_threadpool(store_semantic_answer, query, retrieved, llm_res.get("answer"))
+        return {"query": query, "status": "ok", "answer": llm_res.get("answer"), "retrieved": retrieved,
+                "context": context_report(packed)}
+
+    # LLM calls for the batch run concurrently, bounded by LLM_MAX_CONCURRENCY
+    results = await asyncio.gather(*(_answer(q, r) for q, r in zip(payload.queries, batch)))
+    return {"status": "ok", "results": list(results)}
+
+@app.post("/generate_testcases_batch")
+async def generate_testcases_batch(payload: TestcaseBatchRequest):
+    return await run_in_threadpool(_generate_testcases_batch, payload.queries, payload.top_k, payload.mode,
+                                   _where(payload), payload.mmr)
+
+def _generate_testcases_batch(queries: List[str], top_k: int, mode: Optional[str] = None,
+                              where: Optional[Dict[str, Any]] = None, mmr: Optional[bool] = None):
+    results = []
+    batch = retrieve_topk_batch(queries, top_k=top_k, mode=mode, where=where, mmr=mmr)
+    for query, retrieved in zip(queries, batch):
+        if not retrieved:
+            results.append({"query": query, "status": "no_context", "retrieved": []})
+            continue
+        with stage("generate_testcases"):
+            testcases, facts_from = _generate_testcases(query, retrieved, where)
+        results.append({"query": query, "status": "ok", "testcases": testcases, "facts_from": facts_from,
+                        "retrieved": retrieved})
+    return {"status": "ok", "results": results}
+
+class BulkTestcaseRequest(BaseModel):
+    where: Optional[RetrievalFilter] = None
+    page_size: int = BULK_PAGE_SIZE
+
+# Testcases for every fact in the knowledge base (or the `where` slice), streamed as NDJSON:
+# one testcase object per line while the corpus is paged through, then a last line
+# {"status": "done", "testcases", "discount_facts", "shipping_facts", "duplicates", ...},
+# or {"status": "error", "error": "..."} if the scan fails part way.
+@app.post("/generate_testcases_all")
+def generate_testcases_all(payload: BulkTestcaseRequest):
+    if payload.page_size < 1:
+        raise HTTPException(status_code=422, detail="page_size must be at least 1")
+    where = _where(payload)
+
+    def lines():
+        try:
+            for item in iter_testcases(where, payload.page_size):
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            yield json.dumps({"status": "error", "error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Endpoint to generate a selenium script template for a selected test case
 @app.post("/generate_script")
@@ -0,0 +1,76 @@
+# backend/bulk_testcases.py
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+from backend.agent_tools import extract_facts_batch, generate_test_cases_from_facts
+from backend.fact_index import get_fact_index
+from backend.retrieval import get_collection
+
+# Configuration
+BULK_PAGE_SIZE = int(os.getenv("BULK_PAGE_SIZE", "500"))   # facts (or chunks) read per page
+
+
+def iter_chunk_fact_pages(where: Optional[Dict[str, Any]] = None,
+                          page_size: int = BULK_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Facts extracted on the fly from the collection's chunks (or the slice matching `where`),
+    one page of chunks at a time, in the layout of FactIndex.iter_pages. Used while the
+    fact index has not been built yet.
+    """
+    collection = get_collection()
+    if collection is None:
+        return
+    offset = 0
+    while True:
+        page = collection.get(where=where or None, include=["documents", "metadatas"],
+                              limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        offset += len(page["ids"])
+        facts = []
+        for chunk_id, meta, extracted in zip(page["ids"], page["metadatas"],
+                                             extract_facts_batch(page["documents"])):
+            source = (meta or {}).get("source", "unknown")
+            for kind, items in extracted.items():
+                facts.extend(dict(f, kind=kind, source=source, chunk_id=chunk_id) for f in items)
+        yield facts
+
+def iter_testcases(where: Optional[Dict[str, Any]] = None,
+                   page_size: int = BULK_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Testcases for every distinct discount and shipping fact in scope, yielded page by page
+    as they are generated, then one summary {"status": "done", ...}. A fact stated in
+    several chunks is generated once, grounded in the first source that states it. Only
+    the keys of the facts already seen are kept, so memory grows with the number of
+    distinct facts, not with the size of the corpus.
+    """
+    index = get_fact_index()
+    if index.count() > 0:
+        facts_from, pages = "index", index.iter_pages(where, page_size)
+    else:
+        facts_from, pages = "chunks", iter_chunk_fact_pages(where, page_size)
+    seen = set()
+    n_discount = n_shipping = n_testcases = duplicates = chunk_facts = 0
+    for page in pages:
+        discount, shipping = [], []
+        for fact in page:
+            chunk_facts += 1
+            key = (fact["kind"], fact.get("code"), fact.get("percent"), fact.get("min_order"), fact.get("free_over"))
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            if fact["kind"] == "discount" and fact.get("code"):
+                discount.append(fact)
+            elif fact["kind"] == "shipping":
+                shipping.append(fact)
+        if not discount and not shipping:
+            continue
+        for testcase in generate_test_cases_from_facts(discount, shipping, discount_start=n_discount + 1,
+                                                       shipping_start=n_shipping + 1):
+            n_testcases += 1
+            yield testcase
+        n_discount += len(discount)
+        n_shipping += len(shipping)
+    yield {"status": "done", "facts_from": facts_from, "testcases": n_testcases, "discount_facts": n_discount,
+           "shipping_facts": n_shipping, "chunk_facts": chunk_facts, "duplicates": duplicates}
@@ -0,0 +1,153 @@
+# backend/context_packer.py
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.vector_store import CHUNK_OVERLAP
+from backend.llm_client import OPENAI_MODEL
+
+# Configuration
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))  # tokens of retrieved context per prompt
+MIN_TRUNCATED_TOKENS = 64   # a block cut down to fewer tokens than this is left out instead
+
+_token_counter: Optional[Callable[[str], int]] = None
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with OpenAI's BPE vocabularies
+    return (len(text) + 3) // 4
+
+
+def _get_token_counter() -> Callable[[str], int]:
+    """tiktoken's encoder for OPENAI_MODEL (tiktoken is in requirements.txt). Falls back to a
+       character-based estimate only if tiktoken cannot be imported or its vocabulary cannot
+       be loaded (e.g. offline on first use)."""
+    global _token_counter
+    if _token_counter is None:
+        try:
+            import tiktoken
+            try:
+                encoding = tiktoken.encoding_for_model(OPENAI_MODEL)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            _token_counter = lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            print(f"tiktoken unavailable ({e}); estimating prompt tokens at ~4 characters per token")
+            _token_counter = _estimate_tokens
+    return _token_counter
+
+
+def count_tokens(text: str) -> int:
+    return _get_token_counter()(text)
+
+
+def merge_overlap(first: str, second: str, max_overlap: int = CHUNK_OVERLAP) -> str:
+    """Join two consecutive chunks, dropping the prefix of `second` that repeats the end of `first`."""
+    for k in range(min(max_overlap, len(first), len(second)), 0, -1):
+        if first.endswith(second[:k]):
+            return first + second[k:]
+    return first + "\n" + second
+
+
+def _runs(chunks: Dict[Any, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Split one source's selected chunks ({chunk_index: chunk}) into runs of consecutive
+       indexes, each with its merged text."""
+    runs, current = [], None
+    for idx in sorted(chunks):
+        c = chunks[idx]
+        if current is not None and idx == current["last_index"] + 1:
+            current["text"] = merge_overlap(current["text"], c["document"])
+            current["chunks"].append(c)
+            current["last_index"] = idx
+            continue
+        current = {"chunks": [c], "text": c["document"], "last_index": idx}
+        runs.append(current)
+    return runs
+
+
+def _source_tokens(chunks: Dict[Any, Dict[str, Any]]) -> int:
+    return sum(count_tokens(run["text"]) for run in _runs(chunks))
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    # shrink proportionally, then step down until it fits
+    cut = max(1, int(len(text) * max_tokens / max(count_tokens(text), 1)))
+    while cut > 1 and count_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut]
+
+
+def pack_context(retrieved_chunks: List[Dict[str, Any]], token_budget: int = PROMPT_TOKEN_BUDGET) -> Dict[str, Any]:
+    """
+    Select and merge retrieved chunks into prompt blocks that fit `token_budget` tokens.
+
+    Chunks are taken in relevance order. A chunk next to an already selected chunk of the
+    same file (consecutive chunk_index) is merged into it with the CHUNK_OVERLAP removed,
+    so it only costs its new text; a chunk that does not fit is skipped in favour of later,
+    smaller ones; repeated texts are skipped. If not even the most relevant chunk fits, it
+    is truncated. Blocks are returned in the order of their most relevant chunk:
+      {"blocks": [{"source", "chunk_indexes", "doc_ids", "text", "tokens"}, ...],
+       "tokens": int, "budget": int, "used": [doc_id, ...], "dropped": [doc_id, ...]}
+    """
+    selected: Dict[Any, Dict[Any, Dict[str, Any]]] = {}   # source -> {chunk_index: chunk}
+    source_tokens: Dict[Any, int] = {}
+    ranks: Dict[int, int] = {}
+    seen_texts = set()
+    used_tokens = 0
+    for rank, c in enumerate(retrieved_chunks):
+        text = c.get("document") or ""
+        if not text or text in seen_texts:
+            continue
+        meta = c.get("metadata") or {}
+        idx = meta.get("chunk_index")
+        if isinstance(idx, int):
+            source = meta.get("origin_path") or meta.get("source", "unknown_source")
+        else:
+            # no position in its file: a block of its own
+            source, idx = ("__standalone__", rank), 0
+        trial = dict(selected.get(source, {}))
+        if idx in trial:
+            continue
+        trial[idx] = c
+        tokens = _source_tokens(trial)
+        if used_tokens - source_tokens.get(source, 0) + tokens > token_budget:
+            if selected or token_budget < MIN_TRUNCATED_TOKENS:
+                continue
+            c = dict(c, document=_truncate_to_tokens(text, token_budget))
+            trial = {idx: c}
+            tokens = _source_tokens(trial)
+        seen_texts.add(text)
+        used_tokens += tokens - source_tokens.get(source, 0)
+        selected[source], source_tokens[source] = trial, tokens
+        ranks[id(c)] = rank
+
+    blocks = []
+    for chunks in selected.values():
+        for run in _runs(chunks):
+            meta = run["chunks"][0].get("metadata") or {}
+            blocks.append({
+                "source": meta.get("source", "unknown_source"),
+                "chunk_indexes": [(c.get("metadata") or {}).get("chunk_index", "") for c in run["chunks"]],
+                "doc_ids": [c.get("doc_id") for c in run["chunks"]],
+                "text": run["text"],
+                "tokens": count_tokens(run["text"]),
+                "_rank": min(ranks[id(c)] for c in run["chunks"]),
+            })
+    blocks.sort(key=lambda b: b["_rank"])
+    for b in blocks:
+        del b["_rank"]
+    used = [doc_id for b in blocks for doc_id in b["doc_ids"]]
+    used_set = set(used)
+    return {
+        "blocks": blocks,
+        "tokens": used_tokens,
+        "budget": token_budget,
+        "used": used,
+        "dropped": [c.get("doc_id") for c in retrieved_chunks if c.get("doc_id") not in used_set],
+    }
+
+
+def context_report(packed: Dict[str, Any]) -> Dict[str, Any]:
+    """The citation/usage part of pack_context's result, for API responses."""
+    return {k: packed[k] for k in ("tokens", "budget", "used", "dropped")}
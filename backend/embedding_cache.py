@@ -0,0 +1,137 @@
+# backend/embedding_cache.py
+import os
+import sqlite3
+import threading
+import time
+import hashlib
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+# Configuration
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./chroma_db/embedding_cache.sqlite3")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache stored in SQLite.
+    Rows are keyed by (model name, sha256 of the text) and hold the float32 vector bytes.
+    Every hit refreshes `last_used`; once the table grows past `max_entries` the least
+    recently used rows are evicted.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model_name: str, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return {key: vector} for every key present in the cache."""
+        found: Dict[str, np.ndarray] = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            # stay well below SQLite's host-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model_name] + batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND key IN ({placeholders})",
+                        [now, model_name] + batch,
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model_name: str, items: Dict[str, np.ndarray]) -> None:
+        """Insert or refresh vectors, then evict LRU rows above the size cap."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vec in items.items():
+            arr = np.asarray(vec, dtype=np.float32).ravel()
+            rows.append((model_name, key, int(arr.shape[0]), arr.tobytes(), now))
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, key, dim, vec, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                overflow = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def encode_with_cache(
+    texts: List[str],
+    encode_fn: Callable[[List[str]], np.ndarray],
+    model_name: str,
+    cache: EmbeddingCache,
+) -> np.ndarray:
+    """
+    Embed `texts`, calling `encode_fn` only for texts that are not already cached under
+    `model_name`. Duplicate texts inside one call are encoded once.
+    Returns a float32 matrix with one row per input text, in input order.
+    """
+    keys = [text_hash(t) for t in texts]
+    cached = cache.get_many(model_name, list(dict.fromkeys(keys)))
+
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        fresh = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+        new_items = dict(zip(missing.keys(), fresh))
+        cache.put_many(model_name, new_items)
+        cached.update(new_items)
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([cached[k] for k in keys]).astype(np.float32, copy=False)
@@ -0,0 +1,158 @@
+# backend/encoder.py
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+from backend.embedding_cache import EmbeddingCache, encode_with_cache
+from backend.metrics import stage
+
+# Configuration
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+# Embedding backend: "torch" (PyTorch fp32), "onnx" (ONNX Runtime fp32) or "onnx-int8" (quantized ONNX).
+# The ONNX backends need optimum[onnxruntime]. int8 vectors differ from fp32 ones, so the backend
+# is recorded per file in the ingest manifest and changing it re-embeds every chunk on the next ingest.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+EMBED_BATCH_SIZE = 32       # encoder forward-pass batch size
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))  # in-memory query vectors kept (LRU)
+
+# This module is the single embedding stack of the process: ingestion (vector_store.ingest_files)
+# and retrieval (retrieval.retrieve_topk, which sends query_embeddings to Chroma) both go through it,
+# so documents and queries are always embedded by the same model.
+# The model and the on-disk cache are created lazily, so importing this module does not pull in torch.
+_model = None
+_embedding_cache = None
+_model_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+
+def load_embedding_model(backend: str = EMBED_BACKEND):
+    """Load EMBED_MODEL_NAME on the requested backend (see EMBED_BACKENDS)."""
+    # imported here so that importing this module does not pull in torch
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        return SentenceTransformer(EMBED_MODEL_NAME)
+    if backend == "onnx":
+        return SentenceTransformer(EMBED_MODEL_NAME, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(EMBED_MODEL_NAME, backend="onnx",
+                                   model_kwargs={"file_name": EMBED_ONNX_INT8_FILE})
+    raise ValueError(f"Unsupported embedding backend: {backend} (expected one of {EMBED_BACKENDS})")
+
+def embedding_cache_key(backend: str = EMBED_BACKEND) -> str:
+    """Model key used in the embedding cache; backends are cached separately."""
+    return EMBED_MODEL_NAME if backend == "torch" else f"{EMBED_MODEL_NAME}/{backend}"
+
+def get_model():
+    """Return the shared embedding model, loading it on first call (thread-safe)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_embedding_model(EMBED_BACKEND)
+    return _model
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the shared on-disk embedding cache, opening it on first call (thread-safe)."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+def is_model_loaded() -> bool:
+    return _model is not None
+
+def warmup_encoder() -> Dict:
+    """Load the model and open the embedding cache, and run one encode. Safe to call more than once."""
+    get_model().encode(["warmup"], convert_to_numpy=True)
+    get_embedding_cache()
+    return {"model_loaded": True, "backend": EMBED_BACKEND}
+
+def embed_texts(texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+    """Embed texts with EMBED_MODEL_NAME on EMBED_BACKEND, reusing vectors from the on-disk embedding cache."""
+    def _encode(batch: List[str]) -> np.ndarray:
+        return get_model().encode(batch, batch_size=EMBED_BATCH_SIZE, show_progress_bar=show_progress_bar,
+                                  convert_to_numpy=True)
+    return encode_with_cache(texts, _encode, embedding_cache_key(), get_embedding_cache())
+
+
+# -----------------------------
+# Query embeddings (in-memory LRU)
+# -----------------------------
+class QueryVectorCache:
+    """Thread-safe LRU map of normalized query -> embedding, with hit/miss counters."""
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+query_vector_cache = QueryVectorCache()
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace. all-MiniLM-L6-v2 uses an uncased tokenizer,
+       so this does not change the embedding, only makes more repeats hit the cache."""
+    return " ".join(query.lower().split())
+
+def encode_query(query: str) -> np.ndarray:
+    """Embed a single query, skipping the encoder entirely on a repeat query."""
+    key = normalize_query(query)
+    vec = query_vector_cache.get(key)
+    if vec is None:
+        with stage("embed_query"):
+            vec = embed_texts([key])[0]
+        query_vector_cache.put(key, vec)
+    return vec
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """Embed many queries in one batched encoder call; cached queries are not re-encoded."""
+    keys = [normalize_query(q) for q in queries]
+    found = {}
+    for k in dict.fromkeys(keys):
+        vec = query_vector_cache.get(k)
+        if vec is not None:
+            found[k] = vec
+    missing = [k for k in dict.fromkeys(keys) if k not in found]
+    if missing:
+        with stage("embed_query"):
+            vectors = embed_texts(missing)
+        for k, vec in zip(missing, vectors):
+            query_vector_cache.put(k, vec)
+            found[k] = vec
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([found[k] for k in keys])
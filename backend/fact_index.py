@@ -0,0 +1,310 @@
+# backend/fact_index.py
+import os
+import re
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from backend.agent_tools import extract_facts_batch
+from backend.metadata_filter import where_to_sql
+
+# Configuration
+FACT_INDEX_PATH = os.getenv("FACT_INDEX_PATH", "./chroma_db/fact_index.sqlite3")
+FACT_EXTRACTOR_VERSION = 3   # bump when the extraction patterns change, to re-extract at next ingest
+QUERY_TOKEN_RE = re.compile(r"[A-Z0-9]+")
+QUERY_WORD_RE = re.compile(r"[a-z]+")
+# Words that mark a query as asking about one kind of fact
+QUERY_KIND_TERMS = {
+    "discount": {"discount", "discounts", "coupon", "coupons", "promo", "promotion", "code", "codes",
+                 "voucher", "percent", "off"},
+    "shipping": {"shipping", "ship", "ships", "delivery", "postage", "freight"},
+}
+
+
+class FactIndex:
+    """
+    Structured facts extracted from chunk text at ingest time: discount codes (with percent
+    and minimum order) and free-shipping thresholds. Rows are keyed by chunk id and written
+    in the same batches as the vector store and the BM25 index, so the facts always match
+    the ingested chunks. /generate_testcases reads them instead of re-running the
+    extraction regexes over retrieved chunks.
+    """
+
+    def __init__(self, path: str = FACT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # in-memory view of the whole index, reloaded when the version (write generation) changes
+        self._snapshot: Dict[str, Any] = {"version": -1}
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            # chunks holds every indexed chunk, with or without facts, so coverage is known
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY, origin_path TEXT, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_chunks_origin ON chunks(origin_path);"
+            "CREATE TABLE IF NOT EXISTS facts ("
+            " chunk_id TEXT NOT NULL, kind TEXT NOT NULL, code TEXT, percent INTEGER,"
+            " min_order INTEGER, free_over INTEGER);"
+            "CREATE INDEX IF NOT EXISTS idx_facts_chunk ON facts(chunk_id);"
+            "CREATE INDEX IF NOT EXISTS idx_facts_code ON facts(code);"
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO info (key, value) VALUES ('version', 0);"
+        )
+        self._conn.commit()
+
+    # -----------------------------
+    # Writes (ingest pipeline)
+    # -----------------------------
+    def _delete_ids_locked(self, ids: Sequence[str]) -> None:
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM facts WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+
+    def _bump_version_locked(self) -> None:
+        # readers compare this to their snapshot, so writes from another process are seen too
+        self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        chunk_rows, fact_rows = [], []
+        # one pass of the combined rule pattern over the whole batch
+        for doc_id, facts, meta in zip(ids, extract_facts_batch(list(documents)), metadatas):
+            chunk_rows.append((doc_id, meta.get("origin_path"), json.dumps(meta)))
+            for f in facts["discount"]:
+                fact_rows.append((doc_id, "discount", f["code"], f["percent"], f["min_order"], None))
+            for f in facts["shipping"]:
+                fact_rows.append((doc_id, "shipping", None, None, None, f["free_over"]))
+        with self._lock:
+            self._delete_ids_locked(ids)
+            self._conn.executemany("INSERT INTO chunks (id, origin_path, metadata) VALUES (?, ?, ?)", chunk_rows)
+            self._conn.executemany(
+                "INSERT INTO facts (chunk_id, kind, code, percent, min_order, free_over) VALUES (?, ?, ?, ?, ?, ?)",
+                fact_rows)
+            self._bump_version_locked()
+            self._conn.commit()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete_ids_locked(ids)
+            self._bump_version_locked()
+            self._conn.commit()
+
+    def delete_origin(self, origin_path: str) -> None:
+        """Remove the facts of every chunk of one source file."""
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute("SELECT id FROM chunks WHERE origin_path = ?", (origin_path,))]
+            self._delete_ids_locked(ids)
+            self._bump_version_locked()
+            self._conn.commit()
+
+    def set_extractor_version(self, version: int = FACT_EXTRACTOR_VERSION) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('extractor_version', ?)", (version,))
+            self._conn.commit()
+
+    def extractor_version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM info WHERE key = 'extractor_version'").fetchone()
+        return row[0] if row else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM facts")
+            self._conn.execute("DELETE FROM chunks")
+            self._bump_version_locked()
+            self._conn.commit()
+
+    # -----------------------------
+    # Lookups
+    # -----------------------------
+    def _rows_locked(self, where: Optional[Dict[str, Any]]) -> List[tuple]:
+        """(chunk_id, kind, code, percent, min_order, free_over, origin_path, metadata) of the facts
+           in scope of `where`, in file and chunk order."""
+        condition, params = where_to_sql(where)
+        rows = self._conn.execute(
+            "SELECT f.chunk_id, f.kind, f.code, f.percent, f.min_order, f.free_over, c.origin_path, c.metadata"
+            " FROM facts f JOIN chunks c ON c.id = f.chunk_id"
+            f" WHERE {condition}"
+            " ORDER BY c.origin_path, json_extract(c.metadata, '$.chunk_index'), f.rowid", params).fetchall()
+        return [row[:7] + (json.loads(row[7]),) for row in rows]
+
+    @staticmethod
+    def _merge(rows: List[tuple]) -> Dict[str, List[Dict[str, Any]]]:
+        """Facts merged across chunks: one entry per distinct (code, percent, min_order) or
+           threshold, in row order, with every chunk and source file that states it."""
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for chunk_id, kind, code, percent, min_order, free_over, _, meta in rows:
+            source = meta.get("source", "unknown")
+            key = (kind, code, percent, min_order, free_over)
+            fact = merged.get(key)
+            if fact is None:
+                fact = {"code": code, "percent": percent, "min_order": min_order} if kind == "discount" \
+                    else {"free_over": free_over}
+                fact.update(kind=kind, source=source, sources=[], chunk_ids=[])
+                merged[key] = fact
+            if source not in fact["sources"]:
+                fact["sources"].append(source)
+            fact["chunk_ids"].append(chunk_id)
+        out: Dict[str, List[Dict[str, Any]]] = {"discount": [], "shipping": []}
+        for fact in merged.values():
+            out[fact.pop("kind")].append(fact)
+        return out
+
+    def _snapshot_locked(self) -> Dict[str, Any]:
+        """The chunk count, all merged facts and the fact rows of each file, as of the current
+           version. Only the version row is read while nothing has been written."""
+        version = self._conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()[0]
+        if self._snapshot["version"] != version:
+            rows = self._rows_locked(None)
+            by_file: Dict[str, List[tuple]] = {}
+            files_by_source: Dict[str, List[str]] = {}
+            for row in rows:
+                path = row[6] or ""
+                if path not in by_file:
+                    by_file[path] = []
+                    files_by_source.setdefault(row[7].get("source"), []).append(path)
+                by_file[path].append(row)
+            self._snapshot = {
+                "version": version,
+                "count": self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0],
+                "all": self._merge(rows),
+                "by_file": by_file,
+                "files_by_source": files_by_source,
+            }
+        return self._snapshot
+
+    @staticmethod
+    def _copy(facts: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        return {kind: [dict(f, sources=list(f["sources"]), chunk_ids=list(f["chunk_ids"])) for f in items]
+                for kind, items in facts.items()}
+
+    def facts(self, where: Optional[Dict[str, Any]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        {"discount": [{"code", "percent", "min_order", "source", "sources", "chunk_ids"}, ...],
+         "shipping": [{"free_over", "source", "sources", "chunk_ids"}, ...]}
+        over the whole index (or the chunks matching a Chroma-style `where`). Unfiltered
+        lookups are served from an in-memory snapshot that is reloaded after every write.
+        """
+        with self._lock:
+            result = self._merge(self._rows_locked(where)) if where else self._snapshot_locked()["all"]
+        return self._copy(result)
+
+    def facts_in_files(self, field: str, values: Sequence[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        facts({field: {"$in": values}}) for field "origin_path" or "source", merged from the
+        snapshot's per-file rows instead of a json_extract query.
+        """
+        with self._lock:
+            snapshot = self._snapshot_locked()
+            if field == "origin_path":
+                paths = set(values)
+            else:
+                paths = {p for v in values for p in snapshot["files_by_source"].get(v, [])}
+            rows = [row for path in sorted(paths) for row in snapshot["by_file"].get(path, [])]
+            return self._copy(self._merge(rows))
+
+    def iter_pages(self, where: Optional[Dict[str, Any]] = None,
+                   page_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Unmerged facts in scope of `where`, `page_size` rows at a time, in insertion order:
+        {"kind", "code", "percent", "min_order"} or {"kind", "free_over"}, plus "source" and
+        "chunk_id". Pages are keyed on rowid, so each page is one range scan and the lock is
+        only held while a page is read.
+        """
+        condition, params = where_to_sql(where)
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT f.rowid, f.chunk_id, f.kind, f.code, f.percent, f.min_order, f.free_over, c.metadata"
+                    " FROM facts f JOIN chunks c ON c.id = f.chunk_id"
+                    f" WHERE f.rowid > ? AND ({condition}) ORDER BY f.rowid LIMIT ?",
+                    [last, *params, page_size]).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            page = []
+            for _, chunk_id, kind, code, percent, min_order, free_over, meta_json in rows:
+                fact = {"code": code, "percent": percent, "min_order": min_order} if kind == "discount" \
+                    else {"free_over": free_over}
+                fact.update(kind=kind, source=json.loads(meta_json).get("source", "unknown"), chunk_id=chunk_id)
+                page.append(fact)
+            yield page
+
+    def count(self) -> int:
+        """Chunks indexed (with or without facts), from the snapshot."""
+        with self._lock:
+            return self._snapshot_locked()["count"]
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = dict(self._conn.execute("SELECT kind, COUNT(*) FROM facts GROUP BY kind").fetchall())
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"chunks": chunks, "discount_facts": kinds.get("discount", 0),
+                "shipping_facts": kinds.get("shipping", 0)}
+
+
+_index: Optional[FactIndex] = None
+_index_lock = threading.Lock()
+
+def get_fact_index() -> FactIndex:
+    """Return the shared fact index, opening it on first call (thread-safe)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FactIndex()
+    return _index
+
+def _retrieved_files(retrieved: List[Dict[str, Any]]) -> Optional[Tuple[str, List[str]]]:
+    """(field, values) naming the files the retrieved chunks come from."""
+    metas = [r.get("metadata") or {} for r in retrieved]
+    # origin_path tells apart files with the same name; older chunks may only have source
+    field = "origin_path" if metas and all(m.get("origin_path") for m in metas) else "source"
+    values = sorted({m[field] for m in metas if m.get(field)})
+    if not values:
+        return None
+    return field, values
+
+def _query_kinds(query: str) -> Tuple[str, ...]:
+    """Fact kinds the query asks about; both when it names neither or both."""
+    words = set(QUERY_WORD_RE.findall(query.lower()))
+    kinds = tuple(kind for kind, terms in QUERY_KIND_TERMS.items() if words & terms or
+                  (kind == "discount" and "%" in query))
+    return kinds or tuple(QUERY_KIND_TERMS)
+
+def facts_for_query(query: str, retrieved: List[Dict[str, Any]],
+                    where: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Facts to generate testcases for a query: the facts stated anywhere in the files the
+    retrieved chunks come from (not just in the top-k chunks), of the kinds the query asks
+    about ("shipping" -> shipping thresholds only). A query naming indexed discount codes
+    ("SAVE15 at checkout") gets exactly those codes, from any file in scope of `where`.
+    None while the index holds no chunks (nothing ingested since it was introduced).
+    The chunk count and the per-file facts come from the index's in-memory snapshot, so
+    only a `where` filter costs an SQL lookup.
+    """
+    index = get_fact_index()
+    if index.count() == 0:
+        return None
+    named = set(QUERY_TOKEN_RE.findall(query.upper()))
+    if named:
+        matching = [f for f in index.facts(where)["discount"] if (f["code"] or "").upper() in named]
+        if matching:
+            return {"discount": matching, "shipping": []}
+    files = _retrieved_files(retrieved)
+    if files is None:
+        return {"discount": [], "shipping": []}
+    field, values = files
+    if where:
+        facts = index.facts({"$and": [where, {field: values[0] if len(values) == 1 else {"$in": values}}]})
+    else:
+        facts = index.facts_in_files(field, values)
+    kinds = _query_kinds(query)
+    return {kind: (items if kind in kinds else []) for kind, items in facts.items()}
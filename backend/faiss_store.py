@@ -0,0 +1,449 @@
+# backend/faiss_store.py
+import os
+import glob
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.metadata_filter import where_to_sql
+
+# Configuration
+FAISS_DIRECTORY = os.getenv("FAISS_DIRECTORY", "./faiss_index")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "hnsw")   # "flat", "ivf" or "hnsw"
+FAISS_INDEX_TYPES = ("flat", "ivf", "hnsw")
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))    # 0 = about 4 * sqrt(n) lists
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "8"))
+FAISS_IVF_MIN_TRAIN = 2048  # below this many vectors an IVF store is searched exactly
+# Filtered queries matching at most this many vectors are answered by exact search over them;
+# larger matches search the ANN index restricted to the matching positions.
+FAISS_FILTER_EXACT_MAX = 20000
+# Rewrite the vector file without deleted rows once they make up this fraction of it.
+FAISS_COMPACT_RATIO = 0.25
+
+
+def _faiss():
+    import faiss  # imported lazily: only needed when VECTOR_STORE=faiss
+    return faiss
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    arr = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(arr / norms)
+
+
+class FaissStore:
+    """
+    Vector store on FAISS with the subset of the Chroma collection API used by the ingest
+    pipeline and retrieval (upsert, delete, query, get, count), so either can be plugged in.
+
+    On-disk layout (one directory):
+      vectors.<epoch>.f32   unit-normalized float32 vectors, appended row by row
+      rowids.<epoch>.i64    sidecar row id of every vector position (ascending)
+      index.<epoch>.faiss   IVF or HNSW index over the first `index_pos` positions
+      meta.sqlite3          metadata sidecar: ids, documents, metadata, tombstones, counters
+
+    Vector files are opened with np.memmap and the index with FAISS's mmap flags, so
+    several uvicorn workers reading one store share a single copy through the page cache.
+    Writes append vectors and tombstone replaced/deleted rows; persist() brings the index
+    up to date and compacts the files when too many rows are tombstoned. Positions past
+    the index (appended since the last persist) are searched exactly, so every committed
+    write is visible to readers straight away.
+    """
+
+    def __init__(self, directory: str = FAISS_DIRECTORY, index_type: str = FAISS_INDEX_TYPE):
+        if index_type not in FAISS_INDEX_TYPES:
+            raise ValueError(f"Unsupported FAISS index type: {index_type} (expected one of {FAISS_INDEX_TYPES})")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "meta.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL, origin_path TEXT,"
+            " document TEXT, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0);"
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_rows_live_id ON rows(id) WHERE deleted = 0;"
+            "CREATE INDEX IF NOT EXISTS idx_rows_origin ON rows(origin_path);"
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        defaults = {"index_type": index_type, "dim": 0, "epoch": 0, "n_pos": 0, "index_pos": 0,
+                    "n_deleted": 0, "version": 0}
+        self._conn.executemany("INSERT OR IGNORE INTO info (key, value) VALUES (?, ?)",
+                               [(k, str(v)) for k, v in defaults.items()])
+        self._conn.commit()
+        stored_type = self._info()["index_type"]
+        if stored_type != index_type:
+            print(f"FAISS store at {directory} was built as '{stored_type}'; using that instead of '{index_type}'")
+        self.index_type = stored_type
+        # read view, refreshed whenever the sidecar version changes
+        self._view_version = None
+        self._view: Dict[str, Any] = {}
+
+    @classmethod
+    def exists(cls, directory: str = FAISS_DIRECTORY) -> bool:
+        return os.path.exists(os.path.join(directory, "meta.sqlite3"))
+
+    # -----------------------------
+    # Sidecar helpers
+    # -----------------------------
+    def _info(self) -> Dict[str, Any]:
+        info = dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+        return {k: (v if k == "index_type" else int(v)) for k, v in info.items()}
+
+    def _set_info(self, **values) -> None:
+        self._conn.executemany("UPDATE info SET value = ? WHERE key = ?", [(str(v), k) for k, v in values.items()])
+
+    def _path(self, kind: str, epoch: int) -> str:
+        ext = {"vectors": "f32", "rowids": "i64", "index": "faiss"}[kind]
+        return os.path.join(self.directory, f"{kind}.{epoch}.{ext}")
+
+    # -----------------------------
+    # Writes (ingest pipeline)
+    # -----------------------------
+    def _tombstone_locked(self, condition: str, params: Sequence[Any]) -> int:
+        cur = self._conn.execute(f"UPDATE rows SET deleted = 1 WHERE deleted = 0 AND ({condition})", params)
+        if cur.rowcount:
+            self._conn.execute("UPDATE info SET value = value + ? WHERE key = 'n_deleted'", (cur.rowcount,))
+        return cur.rowcount
+
+    def _tombstone_ids_locked(self, ids: Sequence[str]) -> int:
+        removed = 0
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            removed += self._tombstone_locked(f"id IN ({','.join('?' * len(batch))})", batch)
+        return removed
+
+    def upsert(self, ids: Sequence[str], embeddings, documents: Sequence[str],
+               metadatas: Sequence[Dict[str, Any]]) -> None:
+        vectors = _unit_rows(embeddings)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError("ids and embeddings must have the same length")
+        if not len(ids):
+            return
+        with self._lock:
+            info = self._info()
+            dim = info["dim"] or vectors.shape[1]
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({dim})")
+            self._tombstone_ids_locked(ids)
+            first_row = (self._conn.execute("SELECT COALESCE(MAX(row), -1) FROM rows").fetchone()[0]) + 1
+            rows = np.arange(first_row, first_row + len(ids), dtype=np.int64)
+            # vectors reach the files before the sidecar commit that makes them visible
+            epoch = info["epoch"]
+            with open(self._path("vectors", epoch), "ab") as fh:
+                fh.write(vectors.tobytes())
+            with open(self._path("rowids", epoch), "ab") as fh:
+                fh.write(rows.tobytes())
+            self._conn.executemany(
+                "INSERT INTO rows (row, id, origin_path, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(int(r), doc_id, (meta or {}).get("origin_path"), doc, json.dumps(meta or {}))
+                 for r, doc_id, doc, meta in zip(rows, ids, documents, metadatas)])
+            self._set_info(dim=dim, n_pos=info["n_pos"] + len(ids), version=info["version"] + 1)
+            self._conn.commit()
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            removed = 0
+            if ids:
+                removed += self._tombstone_ids_locked(ids)
+            if where:
+                condition, params = where_to_sql(where)
+                removed += self._tombstone_locked(condition, params)
+            if removed:
+                self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+            self._conn.commit()
+
+    def persist(self) -> None:
+        """Compact if needed and bring the ANN index up to date with the vector file."""
+        with self._lock:
+            info = self._info()
+            if info["n_pos"] and info["n_deleted"] > FAISS_COMPACT_RATIO * info["n_pos"]:
+                self._compact_locked(info)
+            elif self.index_type != "flat" and info["index_pos"] < info["n_pos"]:
+                self._update_index_locked(info)
+
+    def _build_index(self, vectors: np.ndarray):
+        """New IVF/HNSW index over `vectors`, or None when it should be searched exactly."""
+        faiss = _faiss()
+        n, dim = vectors.shape
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        elif self.index_type == "ivf":
+            if n < FAISS_IVF_MIN_TRAIN:
+                return None
+            # ~4 * sqrt(n) lists, with enough training points per list for k-means
+            nlist = FAISS_IVF_NLIST or max(1, min(int(4 * np.sqrt(n)), n // 39))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            sample = vectors[np.random.default_rng(0).permutation(n)[:nlist * 256]]
+            index.train(np.ascontiguousarray(sample))
+        else:
+            return None
+        return index
+
+    def _add_in_pages(self, index, vectors: np.ndarray, start: int, page: int = 65536) -> None:
+        for offset in range(start, vectors.shape[0], page):
+            index.add(np.ascontiguousarray(vectors[offset:offset + page]))
+
+    def _write_index(self, index, epoch: int) -> None:
+        path = self._path("index", epoch)
+        tmp_path = path + ".tmp"
+        _faiss().write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _update_index_locked(self, info: Dict[str, Any]) -> None:
+        faiss = _faiss()
+        epoch, n_pos, index_pos = info["epoch"], info["n_pos"], info["index_pos"]
+        vectors = np.memmap(self._path("vectors", epoch), dtype=np.float32, mode="r", shape=(n_pos, info["dim"]))
+        index_path = self._path("index", epoch)
+        if index_pos and os.path.exists(index_path):
+            index = faiss.read_index(index_path)
+        else:
+            index, index_pos = self._build_index(vectors), 0
+            if index is None:
+                return
+        print(f"Adding {n_pos - index_pos} vectors to the FAISS {self.index_type} index ...")
+        self._add_in_pages(index, vectors, index_pos)
+        self._write_index(index, epoch)
+        self._set_info(index_pos=n_pos, version=info["version"] + 1)
+        self._conn.commit()
+
+    def _compact_locked(self, info: Dict[str, Any]) -> None:
+        """Rewrite live vectors into a new epoch of files and rebuild the index over them."""
+        epoch, n_pos, dim = info["epoch"], info["n_pos"], info["dim"]
+        new_epoch = epoch + 1
+        old_vectors = np.memmap(self._path("vectors", epoch), dtype=np.float32, mode="r", shape=(n_pos, dim))
+        old_rowids = np.memmap(self._path("rowids", epoch), dtype=np.int64, mode="r", shape=(n_pos,))
+        live = np.array([r[0] for r in self._conn.execute("SELECT row FROM rows WHERE deleted = 0 ORDER BY row")],
+                        dtype=np.int64)
+        positions = np.searchsorted(old_rowids, live)
+        print(f"Compacting FAISS store: keeping {len(live)} of {n_pos} vectors ...")
+        with open(self._path("vectors", new_epoch), "wb") as vf, open(self._path("rowids", new_epoch), "wb") as rf:
+            for start in range(0, len(positions), 65536):
+                vf.write(np.ascontiguousarray(old_vectors[positions[start:start + 65536]]).tobytes())
+            rf.write(live.tobytes())
+        index_pos = 0
+        if len(live) and self.index_type != "flat":
+            vectors = np.memmap(self._path("vectors", new_epoch), dtype=np.float32, mode="r", shape=(len(live), dim))
+            index = self._build_index(vectors)
+            if index is not None:
+                self._add_in_pages(index, vectors, 0)
+                self._write_index(index, new_epoch)
+                index_pos = len(live)
+        self._conn.execute("DELETE FROM rows WHERE deleted = 1")
+        self._set_info(epoch=new_epoch, n_pos=len(live), index_pos=index_pos, n_deleted=0,
+                       version=info["version"] + 1)
+        self._conn.commit()
+        del old_vectors, old_rowids
+        # readers still on the old epoch keep their mappings; on Windows removal can fail until they move on
+        for kind in ("vectors", "rowids", "index"):
+            for path in glob.glob(os.path.join(self.directory, f"{kind}.*")):
+                if not path.startswith(self._path(kind, new_epoch)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    # -----------------------------
+    # Reads (API workers)
+    # -----------------------------
+    def _refresh_view(self) -> Dict[str, Any]:
+        """Re-map the files if the sidecar changed since the last call (cheap otherwise)."""
+        version = int(self._conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()[0])
+        if version == self._view_version:
+            return self._view
+        info = self._info()
+        epoch, n_pos, dim, index_pos = info["epoch"], info["n_pos"], info["dim"], info["index_pos"]
+        view = {"n_pos": n_pos, "dim": dim, "index_pos": 0, "vectors": None, "rowids": None, "index": None,
+                "n_deleted": info["n_deleted"]}
+        if n_pos:
+            view["vectors"] = np.memmap(self._path("vectors", epoch), dtype=np.float32, mode="r", shape=(n_pos, dim))
+            view["rowids"] = np.memmap(self._path("rowids", epoch), dtype=np.int64, mode="r", shape=(n_pos,))
+        old = self._view
+        if index_pos and old.get("index") is not None and old.get("index_key") == (epoch, index_pos):
+            view["index"], view["index_pos"] = old["index"], index_pos
+        elif index_pos and os.path.exists(self._path("index", epoch)):
+            faiss = _faiss()
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+            try:
+                index = faiss.read_index(self._path("index", epoch), flags)
+            except RuntimeError:
+                index = faiss.read_index(self._path("index", epoch))
+            if self.index_type == "hnsw":
+                index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+            elif self.index_type == "ivf":
+                index.nprobe = FAISS_IVF_NPROBE
+            view["index"], view["index_pos"] = index, index_pos
+        view["index_key"] = (epoch, view["index_pos"])
+        self._view, self._view_version = view, version
+        return view
+
+    def _search_positions(self, view: Dict[str, Any], queries: np.ndarray, k: int,
+                          allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, positions) per query over indexed positions plus the exact-search tail.
+           `allowed` (sorted positions) restricts the search before top-k is taken."""
+        faiss = _faiss()
+        if allowed is not None and (len(allowed) <= FAISS_FILTER_EXACT_MAX or view["index"] is None):
+            if not len(allowed):
+                return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+            d, i = faiss.knn(queries, np.ascontiguousarray(view["vectors"][allowed]), min(k, len(allowed)),
+                             metric=faiss.METRIC_INNER_PRODUCT)
+            return d, np.where(i >= 0, allowed[np.maximum(i, 0)], -1)
+
+        parts_d, parts_i = [], []
+        start = 0
+        if view["index"] is not None:
+            params = None
+            if allowed is not None:
+                indexed = allowed[allowed < view["index_pos"]]
+                selector = faiss.IDSelectorBatch(indexed)
+                params = (faiss.SearchParametersHNSW(sel=selector, efSearch=FAISS_HNSW_EF_SEARCH)
+                          if self.index_type == "hnsw" else
+                          faiss.SearchParametersIVF(sel=selector, nprobe=FAISS_IVF_NPROBE))
+            d, i = view["index"].search(queries, min(k, view["index_pos"]), params=params)
+            parts_d.append(d)
+            parts_i.append(i)
+            start = view["index_pos"]
+        if start < view["n_pos"]:
+            if allowed is None:
+                # a slice of the memmap: searched in place, nothing is copied
+                d, i = faiss.knn(queries, view["vectors"][start:view["n_pos"]], min(k, view["n_pos"] - start),
+                                 metric=faiss.METRIC_INNER_PRODUCT)
+                parts_d.append(d)
+                parts_i.append(np.where(i >= 0, i + start, -1))
+            else:
+                tail = allowed[allowed >= start]
+                if len(tail):
+                    d, i = faiss.knn(queries, np.ascontiguousarray(view["vectors"][tail]), min(k, len(tail)),
+                                     metric=faiss.METRIC_INNER_PRODUCT)
+                    parts_d.append(d)
+                    parts_i.append(np.where(i >= 0, tail[np.maximum(i, 0)], -1))
+        scores, positions = np.hstack(parts_d), np.hstack(parts_i)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(positions, order, axis=1)
+
+    def _allowed_positions(self, view: Dict[str, Any], where: Dict[str, Any]) -> np.ndarray:
+        """Sorted vector positions of the live rows matching `where`."""
+        condition, params = where_to_sql(where)
+        rows = np.array([r[0] for r in self._conn.execute(
+            f"SELECT row FROM rows WHERE deleted = 0 AND ({condition}) ORDER BY row", params)], dtype=np.int64)
+        positions = np.searchsorted(view["rowids"], rows)
+        # rows committed after this view was mapped are not searchable yet
+        keep = positions < view["n_pos"]
+        positions, rows = positions[keep], rows[keep]
+        return positions[view["rowids"][positions] == rows]
+
+    def query(self, query_embeddings, n_results: int = 10, include: Optional[List[str]] = None,
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, List[List[Any]]]:
+        """Nearest neighbours by cosine similarity, in Chroma's result layout. 'distances' are
+           squared L2 between unit vectors (2 - 2 * cosine), the scale Chroma reports by default.
+           Stored (unit) vectors are returned under 'embeddings' when included."""
+        queries = _unit_rows(query_embeddings)
+        with_embeddings = "embeddings" in (include or [])
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if with_embeddings:
+            out["embeddings"] = []
+        with self._lock:
+            view = self._refresh_view()
+            if not view["n_pos"]:
+                return {key: [[] for _ in range(len(queries))] for key in out}
+            # metadata filters are applied before top-k: only matching positions are searched
+            allowed = self._allowed_positions(view, where) if where else None
+            # over-fetch so that tombstoned rows cannot leave a result short
+            k = min(view["n_pos"], n_results + view["n_deleted"])
+            scores, positions = self._search_positions(view, queries, k, allowed)
+            for qi in range(len(queries)):
+                valid = positions[qi] >= 0
+                hit_positions = positions[qi][valid]
+                rowids = [int(r) for r in view["rowids"][hit_positions]]
+                found = {}
+                for start in range(0, len(rowids), 500):
+                    batch = rowids[start:start + 500]
+                    found.update((r[0], r[1:]) for r in self._conn.execute(
+                        f"SELECT row, id, document, metadata FROM rows WHERE deleted = 0"
+                        f" AND row IN ({','.join('?' * len(batch))})", batch))
+                ids, docs, metas, dists, kept = [], [], [], [], []
+                for pos, row, score in zip(hit_positions, rowids, scores[qi][valid]):
+                    if row not in found:
+                        continue
+                    kept.append(pos)
+                    doc_id, doc, meta_json = found[row]
+                    ids.append(doc_id)
+                    docs.append(doc)
+                    metas.append(json.loads(meta_json))
+                    dists.append(float(max(0.0, 2.0 - 2.0 * score)))
+                    if len(ids) >= n_results:
+                        break
+                out["ids"].append(ids)
+                out["documents"].append(docs)
+                out["metadatas"].append(metas)
+                out["distances"].append(dists)
+                if with_embeddings:
+                    out["embeddings"].append(np.asarray(view["vectors"][np.array(kept, dtype=np.int64)]))
+        return out
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """Stored chunks in insertion order (Chroma get() layout); 'embeddings' only when included."""
+        include = include or ["documents", "metadatas"]
+        condition, params = where_to_sql(where)
+        if ids:
+            condition += f" AND id IN ({','.join('?' * len(ids))})"
+            params = list(params) + list(ids)
+        sql = f"SELECT row, id, document, metadata FROM rows WHERE deleted = 0 AND ({condition}) ORDER BY row"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            out: Dict[str, Any] = {"ids": [r[1] for r in rows]}
+            if "documents" in include:
+                out["documents"] = [r[2] for r in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [json.loads(r[3]) for r in rows]
+            if "embeddings" in include:
+                view = self._refresh_view()
+                if rows:
+                    positions = np.searchsorted(view["rowids"], np.array([r[0] for r in rows], dtype=np.int64))
+                    out["embeddings"] = np.asarray(view["vectors"][positions])
+                else:
+                    out["embeddings"] = np.zeros((0, view["dim"]), dtype=np.float32)
+        return out
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()[0]
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            info = self._info()
+        return {"directory": self.directory, "index_type": self.index_type, "dim": info["dim"],
+                "vectors": info["n_pos"], "indexed": info["index_pos"], "deleted": info["n_deleted"],
+                "epoch": info["epoch"]}
+
+
+_store: Optional[FaissStore] = None
+_store_lock = threading.Lock()
+
+def get_faiss_store(create: bool = True) -> Optional[FaissStore]:
+    """Return the shared FaissStore, opening it on first call (thread-safe). With create=False
+       returns None while no store exists on disk yet."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if not create and not FaissStore.exists():
+                    return None
+                _store = FaissStore()
+    return _store
@@ -1,17 +1,27 @@
 # backend/ingest_runner.py
 import sys
+import argparse
 from pathlib import Path
-from vector_store import ingest_files
 
-def main(paths):
+# Allow `python backend/ingest_runner.py ...` from the repo root: make the `backend` package importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from backend.vector_store import ingest_files, INGEST_WORKERS
+
+def main(paths, workers=INGEST_WORKERS):
     abs_paths = [str(Path(p).resolve()) for p in paths]
-    result = ingest_files(abs_paths)
+    result = ingest_files(abs_paths, workers=workers)
     print("Ingest result:", result)
 
 if __name__ == "__main__":
     # Example usage:
     # python backend/ingest_runner.py assets/checkout.html docs/product_specs.md
-    if len(sys.argv) < 2:
-        print("Usage: python backend/ingest_runner.py <file1> [file2 ...]")
+    # python backend/ingest_runner.py --workers 4 assets/*
+    parser = argparse.ArgumentParser(description="Ingest files into the Chroma knowledge base.")
+    parser.add_argument("files", nargs="*", help="files to ingest (.html, .md, .txt, .json)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="number of processes used to parse and chunk files (default: %(default)s)")
+    args = parser.parse_args()
+    if not args.files:
+        print("Usage: python backend/ingest_runner.py [--workers N] <file1> [file2 ...]")
     else:
-        main(sys.argv[1:])
+        main(args.files, workers=args.workers)
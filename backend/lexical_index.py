@@ -0,0 +1,201 @@
+# backend/lexical_index.py
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from backend.metadata_filter import where_to_sql
+
+# Configuration
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./chroma_db/lexical_index.sqlite3")
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms found in more than this fraction of chunks carry almost no BM25 weight but have the
+# longest posting lists; they are skipped when the query has other terms.
+LEXICAL_MAX_DF_RATIO = 0.5
+
+# Lowercased alphanumeric runs: keeps coupon codes (save15), amounts ($50 -> 50) and
+# element ids (coupon_input) as single tokens.
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index stored in SQLite next to the Chroma files.
+
+    Chunks are added/removed by the ingest pipeline in the same batches as the Chroma
+    collection, under the same chunk ids. Because the index lives on disk, the API
+    process always searches the latest state written by ingest_runner.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY, origin_path TEXT, length INTEGER NOT NULL,"
+            " document TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_chunks_origin ON chunks(origin_path);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS idx_postings_id ON postings(id);"
+            "CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO stats (key, value) VALUES ('n_docs', 0), ('total_length', 0);"
+        )
+        self._conn.commit()
+
+    # -----------------------------
+    # Writes (ingest pipeline)
+    # -----------------------------
+    def _delete_ids_locked(self, ids: Sequence[str]) -> None:
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            row = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE id IN ({placeholders})", batch
+            ).fetchone()
+            self._conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._conn.execute("UPDATE stats SET value = value - ? WHERE key = 'n_docs'", (row[0],))
+            self._conn.execute("UPDATE stats SET value = value - ? WHERE key = 'total_length'", (row[1],))
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._delete_ids_locked(ids)
+            chunk_rows, posting_rows, total_length = [], [], 0
+            for doc_id, doc, meta in zip(ids, documents, metadatas):
+                counts = Counter(tokenize(doc))
+                length = sum(counts.values())
+                total_length += length
+                chunk_rows.append((doc_id, meta.get("origin_path"), length, doc, json.dumps(meta)))
+                posting_rows.extend((term, doc_id, tf) for term, tf in counts.items())
+            self._conn.executemany(
+                "INSERT INTO chunks (id, origin_path, length, document, metadata) VALUES (?, ?, ?, ?, ?)", chunk_rows)
+            self._conn.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)", posting_rows)
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'n_docs'", (len(chunk_rows),))
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (total_length,))
+            self._conn.commit()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete_ids_locked(ids)
+            self._conn.commit()
+
+    def delete_origin(self, origin_path: str) -> None:
+        """Remove every chunk of one source file."""
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute("SELECT id FROM chunks WHERE origin_path = ?", (origin_path,))]
+            self._delete_ids_locked(ids)
+            self._conn.commit()
+
+    # -----------------------------
+    # Search
+    # -----------------------------
+    def search(self, query: str, top_k: int = 10, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        BM25 search. Returns up to top_k dicts shaped like retrieve_topk results
+        ({'doc_id', 'document', 'metadata', 'distance': None}) plus 'id' and 'bm25_score'.
+        A Chroma-style `where` filter restricts the postings scored, so only matching
+        chunks compete for the top_k; IDF stays corpus-wide.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT key, value FROM stats").fetchall())
+            n_docs = stats.get("n_docs", 0)
+            if n_docs <= 0:
+                return []
+            avgdl = max(stats.get("total_length", 0) / n_docs, 1.0)
+
+            condition, params = where_to_sql(where)
+            postings, dfs = {}, {}
+            for term in terms:
+                if where:
+                    postings[term] = self._conn.execute(
+                        "SELECT p.id, p.tf FROM postings p JOIN chunks c ON c.id = p.id"
+                        f" WHERE p.term = ? AND ({condition})", [term] + params).fetchall()
+                    dfs[term] = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                else:
+                    postings[term] = self._conn.execute("SELECT id, tf FROM postings WHERE term = ?", (term,)).fetchall()
+                    dfs[term] = len(postings[term])
+            informative = [t for t in terms if postings[t] and dfs[t] <= LEXICAL_MAX_DF_RATIO * n_docs]
+            if informative:
+                terms = informative
+
+            tfs: Dict[str, Dict[str, int]] = {}
+            idf: Dict[str, float] = {}
+            for term in terms:
+                rows = postings[term]
+                if not rows:
+                    continue
+                df = dfs[term]
+                idf[term] = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in rows:
+                    tfs.setdefault(doc_id, {})[term] = tf
+            if not tfs:
+                return []
+
+            lengths = {}
+            doc_ids = list(tfs.keys())
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                lengths.update(self._conn.execute(
+                    f"SELECT id, length FROM chunks WHERE id IN ({placeholders})", batch).fetchall())
+
+            scores = {}
+            for doc_id, term_tfs in tfs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(doc_id, avgdl) / avgdl)
+                scores[doc_id] = sum(idf[t] * tf * (BM25_K1 + 1) / (tf + norm) for t, tf in term_tfs.items())
+
+            best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+            placeholders = ",".join("?" * len(best))
+            rows = {r[0]: r for r in self._conn.execute(
+                f"SELECT id, document, metadata FROM chunks WHERE id IN ({placeholders})", [b[0] for b in best])}
+
+        results = []
+        for doc_id, score in best:
+            _, doc, meta_json = rows[doc_id]
+            meta = json.loads(meta_json)
+            results.append({
+                "id": doc_id,
+                "doc_id": f"{meta.get('source', 'unknown_source')}__{meta.get('chunk_index', 0)}",
+                "document": doc,
+                "metadata": meta,
+                "distance": None,
+                "bm25_score": round(score, 4),
+            })
+        return results
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM stats WHERE key = 'n_docs'").fetchone()[0]
+
+
+_index: Optional[LexicalIndex] = None
+_index_lock = threading.Lock()
+
+def get_lexical_index() -> LexicalIndex:
+    """Return the shared lexical index, opening it on first call (thread-safe)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LexicalIndex()
+    return _index
@@ -0,0 +1,113 @@
+# backend/llm_cache.py
+import os
+import sqlite3
+import threading
+import time
+import hashlib
+from typing import Dict, Optional
+
+# Configuration
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./chroma_db/llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+
+
+def llm_cache_key(model: str, max_tokens: int, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\x1f{max_tokens}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Disk-backed cache of LLM answers stored in SQLite, keyed by llm_cache_key().
+    Entries expire `ttl` seconds after they were written, are tagged with the index
+    generation they were produced under (see invalidate_generation), and the least
+    recently used rows are evicted above `max_entries`.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " answer TEXT NOT NULL,"
+            " generation INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, generation: int) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, generation, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            answer, row_generation, created = row
+            if row_generation != generation or created + self.ttl < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return answer
+
+    def put(self, key: str, answer: str, generation: int) -> None:
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, generation, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, answer, generation, now, now),
+            )
+            if not exists and self._conn.total_changes > before:
+                self._count += 1
+            if self._count > self.max_entries:
+                overflow = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE rowid IN "
+                    "(SELECT rowid FROM responses ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    def invalidate_generation(self, generation: int) -> int:
+        """Drop every answer produced under an index generation other than `generation`."""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM responses WHERE generation != ?", (generation,))
+            self._conn.commit()
+            self._count -= cur.rowcount
+            return cur.rowcount
+
+    def info(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._count,
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
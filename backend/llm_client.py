@@ -0,0 +1,214 @@
+# backend/llm_client.py
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration (any OpenAI-compatible /chat/completions endpoint)
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", None)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))                # seconds per attempt
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # in-flight LLM calls per worker
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))     # seconds, doubled per retry
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Pooled clients, created lazily. The async client and its semaphore are shared by every
+# request handled by this worker, so connections are reused and concurrency is capped.
+_async_client: Optional[httpx.AsyncClient] = None
+_async_semaphore: Optional[asyncio.Semaphore] = None
+_sync_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """Raised by astream_llm when the completion cannot be streamed."""
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY)
+
+def _headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+
+def chat_payload(prompt: str, max_tokens: int = 400) -> Dict[str, Any]:
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [{"role": "system", "content": "You are a helpful assistant."},
+                     {"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0.0,
+    }
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = min(LLM_BACKOFF_BASE * (2 ** attempt), LLM_BACKOFF_MAX)
+    return delay * (0.5 + random.random() / 2)  # jitter
+
+def _answer_from(data: Dict[str, Any]) -> str:
+    return data["choices"][0]["message"]["content"].strip()
+
+def _ok_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    # `usage` ({"prompt_tokens", "completion_tokens", ...}) feeds the token metrics
+    return {"ok": True, "answer": _answer_from(data), "usage": data.get("usage")}
+
+def _missing_key_error() -> Dict[str, Any]:
+    return {"ok": False, "error": "OPENAI_API_KEY not configured. Set it in .env to get LLM answers."}
+
+
+# -----------------------------
+# Async client (request path)
+# -----------------------------
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(base_url=OPENAI_BASE_URL, timeout=_timeout(), limits=_limits())
+    return _async_client
+
+def get_semaphore() -> asyncio.Semaphore:
+    global _async_semaphore
+    if _async_semaphore is None:
+        _async_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _async_semaphore
+
+async def acall_llm(prompt: str, max_tokens: int = 400) -> Dict[str, Any]:
+    """
+    Async chat completion. Returns {'ok': True, 'answer': str, 'usage': dict or None} or
+    {'ok': False, 'error': str}.
+    At most LLM_MAX_CONCURRENCY calls run at once; timeouts, connection errors and
+    429/5xx responses are retried with exponential backoff.
+    """
+    if not OPENAI_API_KEY:
+        return _missing_key_error()
+    client = get_async_client()
+    payload = chat_payload(prompt, max_tokens)
+    last_error = "unknown error"
+    async with get_semaphore():
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                resp = await client.post("/chat/completions", json=payload, headers=_headers())
+                if resp.status_code == 200:
+                    return _ok_result(resp.json())
+                last_error = f"LLM HTTP {resp.status_code}: {resp.text[:300]}"
+                if resp.status_code not in RETRY_STATUS_CODES:
+                    break
+                retry_after = resp.headers.get("retry-after")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                return {"ok": False, "error": str(e)}
+            if attempt < LLM_MAX_RETRIES:
+                await asyncio.sleep(_backoff(attempt, retry_after))
+    return {"ok": False, "error": last_error}
+
+async def astream_llm(prompt: str, max_tokens: int = 400) -> AsyncIterator[str]:
+    """
+    Stream a chat completion, yielding text deltas as the endpoint produces them.
+    Retries follow acall_llm's policy but only until the first token has been yielded;
+    failures raise LLMError.
+    """
+    if not OPENAI_API_KEY:
+        raise LLMError(_missing_key_error()["error"])
+    client = get_async_client()
+    payload = dict(chat_payload(prompt, max_tokens), stream=True)
+    last_error = "unknown error"
+    async with get_semaphore():
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            retry_after = None
+            started = False
+            try:
+                async with client.stream("POST", "/chat/completions", json=payload, headers=_headers()) as resp:
+                    if resp.status_code == 200:
+                        async for line in resp.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                return
+                            try:
+                                chunk = json.loads(data)
+                                choices = chunk.get("choices") or [{}]
+                                delta = (choices[0].get("delta") or {}).get("content")
+                            except (ValueError, AttributeError, IndexError) as e:
+                                # a malformed event ends the stream with an error, not a raw exception
+                                raise LLMError(f"malformed stream event: {type(e).__name__}: {data[:200]}")
+                            if delta:
+                                started = True
+                                yield delta
+                        return
+                    body = (await resp.aread()).decode("utf-8", "replace")
+                    last_error = f"LLM HTTP {resp.status_code}: {body[:300]}"
+                    if resp.status_code not in RETRY_STATUS_CODES:
+                        break
+                    retry_after = resp.headers.get("retry-after")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if started:
+                    raise LLMError(f"stream interrupted: {type(e).__name__}: {e}")
+                last_error = f"{type(e).__name__}: {e}"
+            if attempt < LLM_MAX_RETRIES:
+                await asyncio.sleep(_backoff(attempt, retry_after))
+    raise LLMError(last_error)
+
+async def aclose() -> None:
+    """Close the pooled async client (called on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+# -----------------------------
+# Sync client (scripts, sync callers)
+# -----------------------------
+def get_sync_client() -> httpx.Client:
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(base_url=OPENAI_BASE_URL, timeout=_timeout(), limits=_limits())
+    return _sync_client
+
+def call_llm_sync(prompt: str, max_tokens: int = 400) -> Dict[str, Any]:
+    """Blocking counterpart of acall_llm with the same timeout and retry policy."""
+    if not OPENAI_API_KEY:
+        return _missing_key_error()
+    client = get_sync_client()
+    payload = chat_payload(prompt, max_tokens)
+    last_error = "unknown error"
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            resp = client.post("/chat/completions", json=payload, headers=_headers())
+            if resp.status_code == 200:
+                return _ok_result(resp.json())
+            last_error = f"LLM HTTP {resp.status_code}: {resp.text[:300]}"
+            if resp.status_code not in RETRY_STATUS_CODES:
+                break
+            retry_after = resp.headers.get("retry-after")
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            last_error = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        if attempt < LLM_MAX_RETRIES:
+            time.sleep(_backoff(attempt, retry_after))
+    return {"ok": False, "error": last_error}
@@ -0,0 +1,77 @@
+# backend/metadata_filter.py
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# Chunk metadata written by ingest_files that retrieval can be scoped by
+FILTER_FIELDS = ("source", "file_type", "ingest_batch", "origin_path")
+
+
+def _as_list(value) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def build_where(source: Union[str, Sequence[str], None] = None,
+                file_type: Union[str, Sequence[str], None] = None,
+                ingest_batch: Union[int, Sequence[int], None] = None,
+                origin_path: Union[str, Sequence[str], None] = None) -> Optional[Dict[str, Any]]:
+    """
+    Chroma-style `where` filter from per-field values; a list means "any of". Fields
+    left as None are not filtered. File types are matched without the leading dot and
+    case-insensitively ("HTML", ".html" -> "html"). Returns None when nothing is filtered;
+    an empty list raises ValueError.
+    """
+    clauses = []
+    for field, value in (("source", source), ("file_type", file_type),
+                         ("ingest_batch", ingest_batch), ("origin_path", origin_path)):
+        if value is None:
+            continue
+        values = _as_list(value)
+        if not values:
+            # Chroma rejects an empty $in, and "any of nothing" would match no chunk anyway
+            raise ValueError(f"filter on {field!r} needs at least one value")
+        if field == "file_type":
+            values = [str(v).lower().lstrip(".") for v in values]
+        clauses.append({field: values[0] if len(values) == 1 else {"$in": values}})
+    if not clauses:
+        return None
+    # Chroma requires $and to combine at least two conditions
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def where_to_sql(where: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    """
+    Translate a Chroma-style `where` filter ({"key": value}, {"key": {"$in": [...]}},
+    {"$and": [...]}, {"$or": [...]}) into a SQL condition over a table with an
+    `origin_path` column and a JSON `metadata` column, as kept by the SQLite sidecars.
+    """
+    if not where:
+        return "1", []
+    clauses, params = [], []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(w) for w in cond]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(p[0] for p in parts) + ")")
+            for p in parts:
+                params.extend(p[1])
+            continue
+        if not key.replace("_", "").isalnum():
+            raise ValueError(f"Unsupported filter field: {key}")
+        column = "origin_path" if key == "origin_path" else f"json_extract(metadata, '$.{key}')"
+        op, value = ("$eq", cond) if not isinstance(cond, dict) else next(iter(cond.items()))
+        if op == "$eq":
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        elif op == "$ne":
+            clauses.append(f"{column} != ?")
+            params.append(value)
+        elif op in ("$in", "$nin"):
+            values = list(value)
+            if not values:
+                clauses.append("0" if op == "$in" else "1")
+                continue
+            negate = "NOT " if op == "$nin" else ""
+            clauses.append(f"{column} {negate}IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(clauses), params
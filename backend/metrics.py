@@ -0,0 +1,171 @@
+# backend/metrics.py
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "1") not in ("0", "false", "False")
+METRICS_PREFIX = "ocean"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, labels: Tuple = (), amount: float = 1.0) -> None:
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label set (Prometheus semantics)."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help_text, labelnames, buckets
+        self._series: Dict[Tuple, List[float]] = {}   # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+request_latency = Histogram(f"{METRICS_PREFIX}_request_duration_seconds",
+                            "HTTP request latency until the response starts.", ("endpoint", "status"))
+stage_latency = Histogram(f"{METRICS_PREFIX}_stage_duration_seconds",
+                          "Latency of one pipeline stage inside a request.", ("endpoint", "stage"))
+requests_in_flight = Gauge(f"{METRICS_PREFIX}_requests_in_flight", "Requests being handled.", ("endpoint",))
+llm_requests = Counter(f"{METRICS_PREFIX}_llm_requests_total", "LLM calls by outcome (ok, cached, error).",
+                       ("outcome",))
+llm_tokens = Counter(f"{METRICS_PREFIX}_llm_tokens_total",
+                     "LLM tokens (prompt, completion); reported usage, else estimated.", ("kind",))
+METRICS = (request_latency, stage_latency, requests_in_flight, llm_requests, llm_tokens)
+
+# Per-request state: endpoint label and the stage timings for the Server-Timing header.
+# The dict is shared with threadpool work (run_in_threadpool copies the context).
+_request: ContextVar[Optional[Dict[str, Any]]] = ContextVar("ocean_request", default=None)
+
+
+def begin_request(endpoint: str):
+    return _request.set({"endpoint": endpoint, "timings": []})
+
+def end_request(token) -> List[Tuple[str, float]]:
+    state = _request.get()
+    _request.reset(token)
+    return state["timings"] if state else []
+
+def record_stage(name: str, seconds: float) -> None:
+    if not METRICS_ENABLED:
+        return
+    state = _request.get()
+    stage_latency.observe((state["endpoint"] if state else "none", name), seconds)
+    if state is not None:
+        state["timings"].append((name, seconds))
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as pipeline stage `name` of the current request."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+def record_llm_call(outcome: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    if not METRICS_ENABLED:
+        return
+    llm_requests.inc((outcome,))
+    if prompt_tokens:
+        llm_tokens.inc(("prompt",), prompt_tokens)
+    if completion_tokens:
+        llm_tokens.inc(("completion",), completion_tokens)
+
+def server_timing(timings: List[Tuple[str, float]], total_s: Optional[float] = None) -> str:
+    """Server-Timing header value; repeated stages (e.g. one per batch query) are summed."""
+    summed: Dict[str, float] = {}
+    for name, seconds in timings:
+        summed[name] = summed.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in summed.items()]
+    if total_s is not None:
+        parts.append(f"total;dur={total_s * 1000:.2f}")
+    return ", ".join(parts)
+
+def render(cache_stats: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4). Cache counters
+       are read from the caches' info() dicts at scrape time."""
+    lines: List[str] = []
+    for metric in METRICS:
+        lines += metric.render()
+    if cache_stats:
+        for key, kind, help_text in (("hits", "counter", "Cache hits."), ("misses", "counter", "Cache misses."),
+                                     ("hit_rate", "gauge", "Cache hit ratio since start."),
+                                     ("size", "gauge", "Entries in the cache.")):
+            name = f"{METRICS_PREFIX}_cache_{key}" + ("_total" if kind == "counter" else "")
+            values = [(cache, info[key]) for cache, info in cache_stats.items()
+                      if isinstance(info, dict) and isinstance(info.get(key), (int, float))]
+            if not values:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f'{name}{{cache="{_escape(cache)}"}} {_number(value)}' for cache, value in values]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,49 @@
+# backend/migrate_chroma_to_faiss.py
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Allow `python backend/migrate_chroma_to_faiss.py ...` from the repo root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from backend.vector_store import get_client, bump_index_generation, COLLECTION_NAME, INGEST_BATCH_SIZE
+from backend.faiss_store import FaissStore, FAISS_DIRECTORY, FAISS_INDEX_TYPE, FAISS_INDEX_TYPES
+
+def migrate(directory=FAISS_DIRECTORY, index_type=FAISS_INDEX_TYPE, page_size=INGEST_BATCH_SIZE):
+    """
+    Copy every chunk (id, embedding, document, metadata) of the Chroma collection into a
+    FAISS store, one page at a time, then build its index. Embeddings are copied, not
+    recomputed. The ingest manifest and lexical index are keyed by the same chunk ids,
+    so they stay valid; afterwards run the API and ingest_runner with VECTOR_STORE=faiss.
+    """
+    if FaissStore.exists(directory):
+        raise SystemExit(f"{directory} already contains a FAISS store; remove it first to migrate again.")
+    try:
+        collection = get_client().get_collection(name=COLLECTION_NAME)
+    except Exception:
+        raise SystemExit(f"No Chroma collection '{COLLECTION_NAME}' found; nothing to migrate.")
+
+    start = time.perf_counter()
+    store = FaissStore(directory=directory, index_type=index_type)
+    total = collection.count()
+    print(f"Migrating {total} chunks from Chroma to {directory} ({index_type}) ...")
+    for offset in range(0, total, page_size):
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        store.upsert(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"],
+                     metadatas=[m or {} for m in page["metadatas"]])
+    store.persist()
+    generation = bump_index_generation()
+    print(f"Migrated {store.count()} chunks in {time.perf_counter() - start:.1f}s "
+          f"(index generation {generation}): {store.info()}")
+
+if __name__ == "__main__":
+    # Example usage:
+    # python backend/migrate_chroma_to_faiss.py --index-type hnsw
+    parser = argparse.ArgumentParser(description="Copy the Chroma knowledge base into a FAISS store.")
+    parser.add_argument("--directory", default=FAISS_DIRECTORY, help="target directory (default: %(default)s)")
+    parser.add_argument("--index-type", choices=FAISS_INDEX_TYPES, default=FAISS_INDEX_TYPE,
+                        help="FAISS index to build (default: %(default)s)")
+    parser.add_argument("--page-size", type=int, default=INGEST_BATCH_SIZE,
+                        help="chunks copied per page (default: %(default)s)")
+    args = parser.parse_args()
+    migrate(directory=args.directory, index_type=args.index_type, page_size=args.page_size)
@@ -0,0 +1,116 @@
+# backend/reranker.py
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.encoder import normalize_query
+from backend.result_cache import TTLCache
+from backend.vector_store import content_hash
+
+# Configuration
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") in ("1", "true", "True")
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = 4       # the cross-encoder scores top_k * RERANK_CANDIDATES retrieved chunks
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))  # per request; vector order is kept past it
+RERANK_BATCH_SIZE = 32
+RERANK_MAX_CHARS = 2000     # chunk text passed to the cross-encoder (it truncates to 512 tokens anyway)
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL = 24 * 3600
+RERANK_MAX_PENDING = 2      # scoring jobs running or queued; requests beyond that skip reranking
+
+# Scores depend only on the query and the chunk text, so they stay valid across re-ingests.
+score_cache = TTLCache(maxsize=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL)
+
+_model = None
+_model_lock = threading.Lock()
+# One scoring thread: requests wait on it with a timeout, so a slow forward pass (cold model,
+# CPU contention) costs the request at most the budget. Work that finishes late still fills
+# the score cache for the next request. Jobs in flight are bounded, so under sustained load
+# requests skip reranking ("busy") instead of queueing behind a growing backlog.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+_pending = threading.BoundedSemaphore(RERANK_MAX_PENDING)
+
+
+def get_reranker():
+    """Return the shared cross-encoder, loading it on first call (thread-safe)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                # imported here so that importing this module does not pull in torch
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL_NAME, device="cpu")
+    return _model
+
+def is_reranker_loaded() -> bool:
+    return _model is not None
+
+def _pair_key(query: str, document: str) -> tuple:
+    return (normalize_query(query), content_hash(document))
+
+def _score_pairs(query: str, documents: List[str]) -> List[float]:
+    """One batched forward pass over (query, document) pairs; results go to the score cache."""
+    pairs = [(query, doc[:RERANK_MAX_CHARS]) for doc in documents]
+    scores = get_reranker().predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+    scores = [float(s) for s in scores]
+    for doc, score in zip(documents, scores):
+        score_cache.put(_pair_key(query, doc), score)
+    return scores
+
+def rerank(query: str, candidates: List[Dict[str, Any]], top_k: int,
+           budget_ms: float = RERANK_BUDGET_MS) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Reorder retrieved chunks by cross-encoder score and keep top_k; each kept dict gets
+    'rerank_score'. Cached (query, chunk) scores are reused and the rest are scored in one
+    batch. If that batch does not finish within `budget_ms` (or the model is still loading,
+    or the scoring thread already has RERANK_MAX_PENDING jobs), the first top_k candidates
+    are returned in retrieval order instead.
+    Returns (chunks, info) with info = {"applied", "reason", "scored", "cached", "ms"}.
+    """
+    t0 = time.perf_counter()
+    info = {"applied": False, "reason": None, "scored": 0, "cached": 0, "ms": 0.0}
+    if not candidates:
+        info["reason"] = "no_candidates"
+        return [], info
+
+    scores: List[Optional[float]] = [score_cache.get(_pair_key(query, c["document"])) for c in candidates]
+    missing = [i for i, s in enumerate(scores) if s is None]
+    info["cached"] = len(candidates) - len(missing)
+    if missing:
+        remaining_s = max(0.0, budget_ms / 1000 - (time.perf_counter() - t0))
+        if not _pending.acquire(blocking=False):
+            info["reason"] = "busy"
+        else:
+            future = _executor.submit(_score_pairs, query, [candidates[i]["document"] for i in missing])
+            # also called when the future is cancelled
+            future.add_done_callback(lambda _: _pending.release())
+            try:
+                for i, score in zip(missing, future.result(timeout=remaining_s)):
+                    scores[i] = score
+                info["scored"] = len(missing)
+            except FutureTimeout:
+                # drop the job if it has not started; a running one still fills the score cache
+                future.cancel()
+                info["reason"] = "over_budget" if is_reranker_loaded() else "model_loading"
+            except Exception as e:
+                print(f"Rerank failed: {e}")
+                info["reason"] = "error"
+        if info["reason"]:
+            info["ms"] = round(1000 * (time.perf_counter() - t0), 2)
+            return [dict(c) for c in candidates[:top_k]], info
+
+    order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:top_k]
+    out = []
+    for i in order:
+        c = dict(candidates[i])
+        c["rerank_score"] = round(scores[i], 4)
+        out.append(c)
+    info["applied"] = True
+    info["ms"] = round(1000 * (time.perf_counter() - t0), 2)
+    return out, info
+
+def warmup_reranker() -> None:
+    """Load the cross-encoder and run one pair, so the first reranked request fits its budget."""
+    get_reranker().predict([("warmup", "warmup")], show_progress_bar=False)
@@ -1,78 +1,346 @@
 # backend/retrieval.py
 import os
-from typing import List, Dict, Any
+import json
+import time
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
-import chromadb
-from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
-import openai
+from backend.encoder import encode_queries, encode_query, normalize_query
+from backend.vector_store import open_collection, get_index_generation
+from backend.result_cache import TTLCache
+from backend import llm_client
+from backend.llm_client import call_llm_sync, OPENAI_MODEL
+from backend.llm_cache import LLMResponseCache, llm_cache_key
+from backend.semantic_cache import SemanticAnswerCache
+from backend.lexical_index import get_lexical_index
+from backend.context_packer import pack_context, count_tokens, PROMPT_TOKEN_BUDGET
+from backend.reranker import rerank as rerank_chunks, RERANK_ENABLED, RERANK_CANDIDATES
+from backend.metrics import stage, record_llm_call
+from backend.tracing import span
 
 # Configuration
 PERSIST_DIRECTORY = "./chroma_db"
 COLLECTION_NAME = "knowledge_base"
 DEFAULT_TOPK = 3
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", None)
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")  # change when you have another model
+# "dense" (embeddings only), "lexical" (BM25 only) or "hybrid" (both, fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+RRF_K = 60                  # reciprocal rank fusion constant
+HYBRID_CANDIDATES = 4       # in hybrid mode each ranker contributes top_k * HYBRID_CANDIDATES candidates
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))  # seconds
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") not in ("0", "false", "False")
+# Maximal marginal relevance: rerank a larger candidate set so the top_k are relevant but not
+# near-copies of each other (adjacent chunks share CHUNK_OVERLAP characters).
+MMR_ENABLED = os.getenv("MMR_ENABLED", "0") in ("1", "true", "True")
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))  # 1.0 = relevance only, 0.0 = diversity only
+MMR_CANDIDATES = 4          # MMR picks top_k out of top_k * MMR_CANDIDATES candidates
 
-# Init Chroma persistent client
-client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
-collection = client.get_collection(name=COLLECTION_NAME)
+# Shared by every endpoint that calls retrieve_topk. Keys include the index generation,
+# which each ingest bumps, so results from an older index are never served.
+retrieval_cache = TTLCache(maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+_cache_generation = {"value": None}
 
-# Init OpenAI if key present
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
-def retrieve_topk(query: str, top_k: int = DEFAULT_TOPK) -> List[Dict[str, Any]]:
+_collection = None
+
+def get_collection():
+    """
+    Return the knowledge_base collection (Chroma or FAISS, per VECTOR_STORE), opening it lazily on first use.
+    Returns None (instead of raising) while nothing has been ingested yet; the lookup
+    is retried on the next call, so a collection created later by ingest is picked up.
+    """
+    global _collection
+    if _collection is None:
+        _collection = open_collection()
+    return _collection
+
+def _cache_key(query: str, top_k: int, mode: str, where: Optional[Dict[str, Any]] = None,
+               mmr: bool = False) -> tuple:
+    generation = get_index_generation()
+    if _cache_generation["value"] != generation:
+        # the index changed: nothing cached so far can be served again
+        retrieval_cache.clear()
+        _cache_generation["value"] = generation
+    where_key = json.dumps(where, sort_keys=True) if where else None
+    return (normalize_query(query), top_k, mode, where_key, mmr, generation)
+
+def retrieve_topk(query: str, top_k: int = DEFAULT_TOPK, use_cache: bool = True,
+                  mode: Optional[str] = None, where: Optional[Dict[str, Any]] = None,
+                  mmr: Optional[bool] = None) -> List[Dict[str, Any]]:
     """
     Query Chroma collection and return a list of dicts:
       [{'doc_id': str, 'document': text, 'metadata': {...}, 'distance': float}, ...]
     Note: Chroma's query include arg must not request 'ids' (new API).
     We reconstruct a stable doc_id from metadata (source + chunk_index).
+    Results are cached per (normalized query, top_k, mode, where, index generation).
+    `mode` is one of RETRIEVAL_MODES (default RETRIEVAL_MODE). Lexical and hybrid results
+    also carry 'bm25_score' / 'rrf_score'; 'distance' is None for chunks only BM25 found.
+    `where` is a Chroma-style metadata filter (see metadata_filter.build_where); it is
+    applied inside the searches, so the top_k are the best matching chunks.
+    With `mmr` (default MMR_ENABLED) the top_k are chosen by maximal marginal relevance
+    from a larger candidate set, skipping chunks that mostly repeat an earlier pick.
+    """
+    return retrieve_topk_batch([query], top_k=top_k, use_cache=use_cache, mode=mode, where=where, mmr=mmr)[0]
+
+def retrieve_topk_batch(queries: List[str], top_k: int = DEFAULT_TOPK, use_cache: bool = True,
+                        mode: Optional[str] = None, where: Optional[Dict[str, Any]] = None,
+                        mmr: Optional[bool] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Batched retrieve_topk: returns one result list per query, in order.
+    Queries that miss the result cache are embedded in a single encoder call and
+    searched with a single multi-query collection.query.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unsupported retrieval mode: {mode} (expected one of {RETRIEVAL_MODES})")
+    mmr = MMR_ENABLED if mmr is None else mmr
+    with span("retrieve_topk", queries=len(queries), top_k=top_k, mode=mode, mmr=mmr,
+              filtered=bool(where)) as current:
+        results: List[Any] = [None] * len(queries)
+        keys = [_cache_key(q, top_k, mode, where, mmr) for q in queries] if use_cache else [None] * len(queries)
+        if use_cache:
+            for i, key in enumerate(keys):
+                results[i] = retrieval_cache.get(key)
+
+        # repeated queries inside one batch are searched once
+        missing: Dict[str, List[int]] = {}
+        for i, r in enumerate(results):
+            if r is None:
+                missing.setdefault(normalize_query(queries[i]), []).append(i)
+        current.set_attribute("cache_misses", len(missing))
+        if missing:
+            fetched = _search(list(missing.keys()), top_k, mode, where, mmr)
+            for positions, docs in zip(missing.values(), fetched):
+                for i in positions:
+                    results[i] = docs
+                if use_cache and docs:
+                    retrieval_cache.put(keys[positions[0]], docs)
+        # callers may annotate the dicts; hand out copies so the cached entries stay intact
+        return [[dict(d) for d in docs] for docs in results]
+
+def retrieve_with_stages(query: str, top_k: int = DEFAULT_TOPK, mode: Optional[str] = None,
+                         where: Optional[Dict[str, Any]] = None, mmr: Optional[bool] = None,
+                         rerank: Optional[bool] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    retrieve_topk followed by the optional cross-encoder stage (default RERANK_ENABLED):
+    top_k * RERANK_CANDIDATES chunks are retrieved and reranked down to top_k within
+    RERANK_BUDGET_MS. Returns (chunks, stages) where stages = {"timings_ms": {"retrieval",
+    ["rerank"]}, ["rerank": reranker info]} so callers can report what each stage cost.
+    """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    t0 = time.perf_counter()
+    pool = top_k * RERANK_CANDIDATES if rerank else top_k
+    docs = retrieve_topk(query, top_k=pool, mode=mode, where=where, mmr=mmr)
+    stages: Dict[str, Any] = {"timings_ms": {"retrieval": round(1000 * (time.perf_counter() - t0), 2)}}
+    if rerank:
+        with stage("rerank"):
+            docs, info = rerank_chunks(query, docs, top_k)
+        stages["timings_ms"]["rerank"] = info["ms"]
+        stages["rerank"] = info
+    return docs, stages
+
+def _search(queries: List[str], top_k: int, mode: str, where: Optional[Dict[str, Any]] = None,
+            mmr: bool = False) -> List[List[Dict[str, Any]]]:
+    if not mmr:
+        return _rank(queries, top_k, mode, where)
+    candidates = _rank(queries, top_k * MMR_CANDIDATES, mode, where, for_mmr=True)
+    _attach_missing_embeddings([d for docs in candidates for d in docs])
+    query_vecs = encode_queries(queries)
+    out = []
+    for q_vec, docs in zip(query_vecs, candidates):
+        if docs:
+            # a candidate whose embedding could not be fetched is kept on relevance alone: its zero
+            # vector has similarity 0 to every pick, so it gets no diversity penalty
+            has_vec = [d.get("_embedding") is not None for d in docs]
+            zero = np.zeros(len(q_vec), dtype=np.float32)
+            vecs = np.vstack([d["_embedding"] if ok else zero for d, ok in zip(docs, has_vec)])
+            relevance = None
+            if mode != "dense":
+                # rank-fusion / BM25 scores, scaled to [0, 1] to be comparable with cosine similarity
+                scores = np.array([d.get("rrf_score") or d.get("bm25_score") or 0.0 for d in docs], dtype=np.float32)
+                relevance = scores / scores.max() if scores.max() > 0 else scores
+            elif not all(has_vec):
+                # cosine similarity from the stored vector, else from the distance (2 - 2 * cosine)
+                q = np.asarray(q_vec, dtype=np.float32) / max(float(np.linalg.norm(q_vec)), 1e-12)
+                relevance = np.array([
+                    float(d["_embedding"] @ q / max(float(np.linalg.norm(d["_embedding"])), 1e-12)) if ok
+                    else (1.0 - d["distance"] / 2 if d.get("distance") is not None else 0.0)
+                    for d, ok in zip(docs, has_vec)], dtype=np.float32)
+            with stage("mmr"):
+                docs = [docs[i] for i in mmr_rerank(q_vec, vecs, top_k, relevance=relevance)]
+        for d in docs:
+            d.pop("_id", None)
+            d.pop("_embedding", None)
+        out.append(docs)
+    return out
+
+def _rank(queries: List[str], top_k: int, mode: str, where: Optional[Dict[str, Any]] = None,
+          for_mmr: bool = False) -> List[List[Dict[str, Any]]]:
+    if mode == "dense":
+        return _query_collection(queries, top_k, where, with_embeddings=for_mmr)
+    lexical = get_lexical_index()
+    if mode == "lexical":
+        return [_lexical_search(lexical, q, top_k, where, keep_id=for_mmr) for q in queries]
+    n_candidates = top_k * HYBRID_CANDIDATES
+    dense = _query_collection(queries, n_candidates, where, with_embeddings=for_mmr)
+    return [reciprocal_rank_fusion([d, _lexical_search(lexical, q, n_candidates, where, keep_id=for_mmr)], top_k)
+            for q, d in zip(queries, dense)]
+
+def _lexical_search(lexical, query: str, top_k: int, where: Optional[Dict[str, Any]] = None,
+                    keep_id: bool = False) -> List[Dict[str, Any]]:
+    with stage("lexical_search"):
+        hits = lexical.search(query, top_k, where=where)
+    for h in hits:
+        chunk_id = h.pop("id", None)
+        if keep_id:
+            h["_id"] = chunk_id
+    return hits
+
+def _attach_missing_embeddings(docs: List[Dict[str, Any]]) -> None:
+    """Fetch stored embeddings for candidates that came only from BM25 (one collection.get)."""
+    missing: Dict[str, List[Dict[str, Any]]] = {}   # the same chunk can be a candidate of several queries
+    for d in docs:
+        if d.get("_embedding") is None and d.get("_id"):
+            missing.setdefault(d["_id"], []).append(d)
+    collection = get_collection()
+    if not missing or not collection:
+        return
+    res = collection.get(ids=list(missing.keys()), include=["embeddings"])
+    embeddings = res.get("embeddings")
+    if embeddings is None:
+        return
+    for chunk_id, emb in zip(res["ids"], embeddings):
+        if emb is None:
+            continue
+        vec = np.asarray(emb, dtype=np.float32)
+        for d in missing.get(chunk_id, []):
+            d["_embedding"] = vec
+
+def mmr_rerank(query_vec: np.ndarray, doc_vecs: np.ndarray, top_k: int, lambda_mult: float = MMR_LAMBDA,
+               relevance: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Maximal marginal relevance: greedily pick the candidate maximising
+        lambda_mult * relevance - (1 - lambda_mult) * max cosine similarity to the picks so far.
+    Relevance defaults to cosine similarity with the query. All pairwise similarities come from
+    one matrix product and each step is a vector update, so reranking ~50 candidates is
+    well under a millisecond. Returns candidate indices in pick order.
+    """
+    vecs = np.asarray(doc_vecs, dtype=np.float32)
+    vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_vec, dtype=np.float32).ravel()
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    rel = vecs @ q if relevance is None else np.asarray(relevance, dtype=np.float32)
+    sim = vecs @ vecs.T
+    n = len(vecs)
+    max_sim = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picks: List[int] = []
+    for _ in range(min(top_k, n)):
+        scores = np.where(available, lambda_mult * rel - (1.0 - lambda_mult) * max_sim, -np.inf)
+        j = int(np.argmax(scores))
+        picks.append(j)
+        available[j] = False
+        max_sim = sim[j] if len(picks) == 1 else np.maximum(max_sim, sim[j])
+    return picks
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], top_k: int, k: int = RRF_K) -> List[Dict[str, Any]]:
     """
-    if not collection:
-        return []
-
-    res = collection.query(
-        query_texts=[query],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]  # no 'ids'
-    )
-
-    docs = []
-    if res and len(res.get("documents", [])) > 0:
-        documents = res["documents"][0]
-        metadatas = res["metadatas"][0]
-        distances = res.get("distances", [[]])[0]
-        for i, doc in enumerate(documents):
-            meta = metadatas[i] if i < len(metadatas) else {}
-            # Reconstruct a stable id using metadata (falls back to index)
-            src = meta.get("source", "unknown_source")
-            idx = meta.get("chunk_index", i)
-            doc_id = f"{src}__{idx}"
-            docs.append({
-                "doc_id": doc_id,
-                "document": doc,
-                "metadata": meta,
-                "distance": distances[i] if i < len(distances) else None
-            })
-    return docs
-
-
-def build_rag_prompt(query: str, retrieved_chunks: List[Dict[str, Any]]) -> str:
+    Fuse ranked result lists: score(doc) = sum over lists of 1 / (k + rank).
+    Chunks are matched by doc_id; the first list's dict is kept (so dense distances survive)
+    and fields only present in later lists (e.g. bm25_score) are merged in.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = doc["doc_id"]
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key not in fused:
+                fused[key] = dict(doc)
+            else:
+                for field, value in doc.items():
+                    if fused[key].get(field) is None:
+                        fused[key][field] = value
+    best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    out = []
+    for key, score in best:
+        doc = fused[key]
+        doc["rrf_score"] = round(score, 6)
+        out.append(doc)
+    return out
+
+def _query_collection(queries: List[str], top_k: int, where: Optional[Dict[str, Any]] = None,
+                      with_embeddings: bool = False) -> List[List[Dict[str, Any]]]:
+    collection = get_collection()
+    if not collection or not queries:
+        return [[] for _ in queries]
+
+    # Embed with the shared encoder used at ingest time (LRU-cached per normalized query)
+    query_embeddings = encode_queries(queries)
+    kwargs = {"where": where} if where else {}
+    # the filter is evaluated by the store before the nearest-neighbour search (pre-filtering)
+    with stage("vector_search"):
+        res = collection.query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"] + (["embeddings"] if with_embeddings else []),  # no 'ids'
+            **kwargs
+        )
+
+    all_docs = []
+    for qi in range(len(queries)):
+        docs = []
+        if res and len(res.get("documents") or []) > qi:
+            documents = res["documents"][qi]
+            metadatas = res["metadatas"][qi]
+            distances = (res.get("distances") or [[]] * len(queries))[qi]
+            embeddings = res.get("embeddings") if with_embeddings else None
+            for i, doc in enumerate(documents):
+                meta = metadatas[i] if i < len(metadatas) else {}
+                # Reconstruct a stable id using metadata (falls back to index)
+                src = meta.get("source", "unknown_source")
+                idx = meta.get("chunk_index", i)
+                doc_id = f"{src}__{idx}"
+                docs.append({
+                    "doc_id": doc_id,
+                    "document": doc,
+                    "metadata": meta,
+                    "distance": distances[i] if i < len(distances) else None
+                })
+                if embeddings is not None:
+                    # private fields for the MMR stage; removed before results leave _search
+                    docs[-1]["_id"] = res["ids"][qi][i]
+                    docs[-1]["_embedding"] = np.asarray(embeddings[qi][i], dtype=np.float32)
+        all_docs.append(docs)
+    return all_docs
+
+
+def build_rag_prompt(query: str, retrieved_chunks: List[Dict[str, Any]], token_budget: int = PROMPT_TOKEN_BUDGET,
+                     packed: Optional[Dict[str, Any]] = None) -> str:
     """
     Build a clear prompt for the LLM containing:
       - a short instruction
       - the retrieved chunks with source metadata
       - the user query
+    The chunks are packed into at most `token_budget` tokens by context_packer.pack_context
+    (contiguous chunks merged, overlap removed, most relevant first). Pass `packed` to reuse
+    a pack_context result, e.g. one whose "used"/"dropped" lists are reported to the caller.
     """
     header = ("You are an assistant that MUST use only the provided context to answer. "
               "If the context does not support an assertion, say 'Insufficient evidence in provided documents.'\n\n")
+    if packed is None:
+        packed = pack_context(retrieved_chunks, token_budget)
     context_lines = []
-    for i, c in enumerate(retrieved_chunks, 1):
-        src = c.get("metadata", {}).get("source", "unknown_source")
-        idx = c.get("metadata", {}).get("chunk_index", "")
-        context_lines.append(f"--- Chunk {i} (source: {src}, chunk_index: {idx}) ---\n{c.get('document')}\n")
+    for i, block in enumerate(packed["blocks"], 1):
+        indexes = block["chunk_indexes"]
+        idx = indexes[0] if len(indexes) == 1 else f"{indexes[0]}-{indexes[-1]}"
+        context_lines.append(f"--- Chunk {i} (source: {block['source']}, chunk_index: {idx}) ---\n{block['text']}\n")
 
     context_str = "\n".join(context_lines) if context_lines else "No context retrieved.\n"
     instruction = ("\n\nInstructions:\n1) Provide a one-line concise answer.\n"
@@ -82,23 +350,114 @@ def build_rag_prompt(query: str, retrieved_chunks: List[Dict[str, Any]]) -> str:
     prompt = header + "CONTEXT:\n" + context_str + "\nUSER QUERY:\n" + query + "\n" + instruction
     return prompt
 
+# -----------------------------
+# LLM calls behind the response cache
+# -----------------------------
+# Answers are generated with temperature=0.0, so identical (model, max_tokens, prompt)
+# triples are served from the disk cache. Entries are dropped when the index generation
+# changes, since the same query may then deserve a different answer.
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+_llm_cache_generation = {"value": None}
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache()
+    return _llm_cache
+
+def _current_llm_generation() -> int:
+    generation = get_index_generation()
+    if _llm_cache_generation["value"] != generation:
+        get_llm_cache().invalidate_generation(generation)
+        _llm_cache_generation["value"] = generation
+    return generation
+
+def cached_llm_answer(prompt: str, max_tokens: int = 400) -> Optional[str]:
+    """Cached answer for this prompt under the current index generation, or None."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    generation = _current_llm_generation()
+    return get_llm_cache().get(llm_cache_key(OPENAI_MODEL, max_tokens, prompt), generation)
+
+def store_llm_answer(prompt: str, answer: str, max_tokens: int = 400) -> None:
+    if not LLM_CACHE_ENABLED or not answer:
+        return
+    generation = _current_llm_generation()
+    get_llm_cache().put(llm_cache_key(OPENAI_MODEL, max_tokens, prompt), answer, generation)
+
 def call_llm(prompt: str, max_tokens: int = 400) -> Dict[str, str]:
     """
-    Call OpenAI ChatCompletion and return {'ok':True, 'answer':str} or error info.
+    Call the OpenAI-compatible chat completions endpoint and return {'ok':True, 'answer':str} or error info.
     If OPENAI_API_KEY is not set, return a helpful message indicating missing key.
+    Blocking; async request handlers use acall_llm instead.
     """
-    if not OPENAI_API_KEY:
-        return {"ok": False, "error": "OPENAI_API_KEY not configured. Set it in .env to get LLM answers."}
+    cached = cached_llm_answer(prompt, max_tokens)
+    if cached is not None:
+        record_llm_call("cached")
+        return {"ok": True, "answer": cached, "cached": True}
+    with stage("llm"), span("call_llm", prompt_chars=len(prompt), max_tokens=max_tokens) as current:
+        res = call_llm_sync(prompt, max_tokens=max_tokens)
+        _annotate_llm_span(current, res)
+    record_llm_usage(prompt, res)
+    if res.get("ok"):
+        store_llm_answer(prompt, res["answer"], max_tokens)
+    return res
 
-    try:
-        resp = openai.ChatCompletion.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "system", "content": "You are a helpful assistant."},
-                      {"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=0.0,
-        )
-        answer = resp["choices"][0]["message"]["content"].strip()
-        return {"ok": True, "answer": answer}
-    except Exception as e:
-        return {"ok": False, "error": str(e)}
+async def acall_llm(prompt: str, max_tokens: int = 400) -> Dict[str, Any]:
+    """Async call_llm (pooled client, concurrency limit, retries) behind the same response cache.
+       Cache reads and writes are SQLite calls (an index generation change also purges
+       entries), so they run in the threadpool, off the event loop."""
+    cached = await run_in_threadpool(cached_llm_answer, prompt, max_tokens)
+    if cached is not None:
+        record_llm_call("cached")
+        return {"ok": True, "answer": cached, "cached": True}
+    with stage("llm"), span("call_llm", prompt_chars=len(prompt), max_tokens=max_tokens) as current:
+        res = await llm_client.acall_llm(prompt, max_tokens=max_tokens)
+        _annotate_llm_span(current, res)
+    record_llm_usage(prompt, res)
+    if res.get("ok"):
+        await run_in_threadpool(store_llm_answer, prompt, res["answer"], max_tokens)
+    return res
+
+def _annotate_llm_span(current, res: Dict[str, Any]) -> None:
+    current.set_attribute("ok", bool(res.get("ok")))
+    usage = res.get("usage") or {}
+    for key in ("prompt_tokens", "completion_tokens"):
+        if usage.get(key) is not None:
+            current.set_attribute(key, usage[key])
+    if not res.get("ok"):
+        current.set_attribute("error", str(res.get("error"))[:300])
+
+def record_llm_usage(prompt: str, res: Dict[str, Any]) -> None:
+    """Count an LLM call and its tokens: the usage the endpoint reported, else an estimate."""
+    if not res.get("ok"):
+        record_llm_call("error")
+        return
+    usage = res.get("usage") or {}
+    record_llm_call("ok", usage.get("prompt_tokens") or count_tokens(prompt),
+                    usage.get("completion_tokens") or count_tokens(res.get("answer") or ""))
+
+
+# -----------------------------
+# Semantic answer cache (paraphrased queries)
+# -----------------------------
+semantic_cache = SemanticAnswerCache()
+
+def semantic_cached_answer(query: str, retrieved_chunks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Answer of a previously answered query that is within SEMANTIC_CACHE_MAX_DISTANCE of `query`
+    and was grounded in exactly the same retrieved chunks, or None.
+    """
+    if not SEMANTIC_CACHE_ENABLED or not retrieved_chunks:
+        return None
+    chunk_ids = [c["doc_id"] for c in retrieved_chunks]
+    return semantic_cache.lookup(encode_query(query), chunk_ids, get_index_generation())
+
+def store_semantic_answer(query: str, retrieved_chunks: List[Dict[str, Any]], answer: str) -> None:
+    if not SEMANTIC_CACHE_ENABLED or not retrieved_chunks or not answer:
+        return
+    chunk_ids = [c["doc_id"] for c in retrieved_chunks]
+    semantic_cache.store(query, encode_query(query), chunk_ids, answer, get_index_generation())
@@ -0,0 +1,100 @@
+# backend/semantic_cache.py
+import os
+import time
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional
+
+import numpy as np
+
+# Configuration
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.15"))  # cosine distance
+
+
+class SemanticAnswerCache:
+    """
+    In-memory answer cache for near-duplicate queries.
+
+    Past query embeddings are kept in a fixed-size float32 matrix (a ring buffer: the oldest
+    entry is overwritten when full) and searched with one matrix-vector product. A lookup
+    hits when a cached query lies within `max_distance` cosine distance of the new one
+    AND was answered from exactly the same set of retrieved chunks. Near matches whose
+    chunk set differs are counted as false hits and not served.
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, max_distance: float = SEMANTIC_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._vectors: Optional[np.ndarray] = None
+        self._entries = [None] * max_entries
+        self._next = 0
+        self._size = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.false_hits = 0
+
+    @staticmethod
+    def _unit(vec: np.ndarray) -> np.ndarray:
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _check_generation(self, generation: int) -> None:
+        # caller holds the lock; a new index generation invalidates every cached answer
+        if self._generation != generation:
+            self._entries = [None] * self.max_entries
+            self._next = 0
+            self._size = 0
+            self._generation = generation
+
+    def lookup(self, query_vec: np.ndarray, chunk_ids: Iterable[str], generation: int) -> Optional[Dict]:
+        """Return the cached entry {"query", "answer", "distance"} for a near-duplicate query, or None."""
+        q = self._unit(query_vec)
+        wanted: FrozenSet[str] = frozenset(chunk_ids)
+        with self._lock:
+            self._check_generation(generation)
+            if self._size == 0 or self._vectors is None:
+                self.misses += 1
+                return None
+            sims = self._vectors[:self._size] @ q
+            candidates = np.flatnonzero(sims >= 1.0 - self.max_distance)
+            rejected = False
+            for idx in candidates[np.argsort(-sims[candidates])]:
+                entry = self._entries[idx]
+                if entry["chunk_ids"] == wanted:
+                    self.hits += 1
+                    return {"query": entry["query"], "answer": entry["answer"],
+                            "distance": round(float(1.0 - sims[idx]), 4)}
+                rejected = True
+            if rejected:
+                self.false_hits += 1
+            self.misses += 1
+            return None
+
+    def store(self, query: str, query_vec: np.ndarray, chunk_ids: Iterable[str], answer: str, generation: int) -> None:
+        q = self._unit(query_vec)
+        with self._lock:
+            self._check_generation(generation)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = q
+            self._entries[slot] = {"query": query, "answer": answer, "chunk_ids": frozenset(chunk_ids),
+                                   "created": time.time()}
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def info(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._size,
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "false_hits": self.false_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
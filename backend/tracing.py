@@ -0,0 +1,115 @@
+# backend/tracing.py
+import os
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Configuration
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") in ("1", "true", "True")
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "console")   # "console", "file" or "otlp"
+TRACING_EXPORTERS = ("console", "file", "otlp")
+TRACING_FILE = os.getenv("TRACING_FILE", "./traces.jsonl")    # one JSON span per line (TRACING_EXPORTER=file)
+# Fraction of traces recorded. Sampling is decided once per trace at its root span and
+# inherited by its children; unsampled spans are not recorded or exported.
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "ocean-ai-backend")
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+_tracer = None
+_provider = None
+_init_lock = threading.Lock()
+_disabled = not TRACING_ENABLED
+
+
+def _exporter():
+    if TRACING_EXPORTER == "otlp":
+        # endpoint, headers etc. come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    if TRACING_EXPORTER == "file":
+        out = open(TRACING_FILE, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    return ConsoleSpanExporter()
+
+def get_tracer():
+    """The process tracer, set up on first use; None when tracing is off or OpenTelemetry
+       is not installed."""
+    global _tracer, _provider, _disabled
+    if _disabled or _tracer is not None:
+        return _tracer
+    with _init_lock:
+        if _tracer is None and not _disabled:
+            try:
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+                if TRACING_EXPORTER not in TRACING_EXPORTERS:
+                    raise ValueError(f"TRACING_EXPORTER must be one of {TRACING_EXPORTERS}, got {TRACING_EXPORTER!r}")
+                _provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+                                           sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)))
+                # spans are exported from a background thread in batches, off the request path
+                _provider.add_span_processor(BatchSpanProcessor(_exporter()))
+                _tracer = _provider.get_tracer("backend")
+            except Exception as e:
+                print(f"Tracing disabled: {e}")
+                _disabled = True
+    return _tracer
+
+@contextmanager
+def span(name: str, context=None, **attributes) -> Iterator[Any]:
+    """
+    Run the enclosed block in a span named `name` (a child of the current span, or of
+    `context` from capture_context()). Yields the span so attributes known only at the
+    end can be added with set_attribute; with tracing off it yields a no-op span.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield _NOOP_SPAN
+        return
+    with tracer.start_as_current_span(name, context=context) as current:
+        if attributes and current.is_recording():
+            current.set_attributes({k: v for k, v in attributes.items() if v is not None})
+        yield current
+
+def traced(name: str, attributes: Optional[Callable[..., Dict[str, Any]]] = None,
+           result_attributes: Optional[Callable[[Any], Dict[str, Any]]] = None):
+    """
+    Decorator: run the function in a span. `attributes(*args, **kwargs)` and
+    `result_attributes(result)` return span attributes; they are only called when tracing is on.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if get_tracer() is None:
+                return fn(*args, **kwargs)
+            with span(name, **(attributes(*args, **kwargs) if attributes else {})) as current:
+                result = fn(*args, **kwargs)
+                if result_attributes and current.is_recording():
+                    current.set_attributes(result_attributes(result))
+                return result
+        return wrapper
+    return decorator
+
+def capture_context():
+    """The current trace context, for continuing a trace in another thread (pass it to span())."""
+    if get_tracer() is None:
+        return None
+    from opentelemetry import context
+    return context.get_current()
+
+def shutdown() -> None:
+    """Flush buffered spans (called on app shutdown)."""
+    if _provider is not None:
+        _provider.shutdown()
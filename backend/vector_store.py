@@ -2,35 +2,84 @@
 import os
 from pathlib import Path
 import json
-import uuid
-from typing import List, Dict, Tuple
+import hashlib
+import queue
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Dict, Tuple, Iterator, Optional, Protocol, Sequence
 
 from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
 import numpy as np
-from tqdm import tqdm
 
-# Configuration
-EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-CHUNK_SIZE = 800            # characters per chunk (tweakable)
-CHUNK_OVERLAP = 200         # overlap between chunks
+from backend.encoder import embed_texts, warmup_encoder, embedding_cache_key, EMBED_MODEL_NAME
+from backend.lexical_index import get_lexical_index
+from backend.fact_index import get_fact_index, FACT_EXTRACTOR_VERSION
+from backend.faiss_store import get_faiss_store
+from backend.tracing import span, capture_context
+
+# Configuration (embedding model and backend settings live in backend/encoder.py)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))         # characters per chunk (tweakable)
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))   # overlap between chunks
 PERSIST_DIRECTORY = "./chroma_db"
 COLLECTION_NAME = "knowledge_base"
+MANIFEST_PATH = os.path.join(PERSIST_DIRECTORY, "ingest_manifest.json")
+INDEX_GENERATION_PATH = os.path.join(PERSIST_DIRECTORY, "index_generation")
+INGEST_BATCH_SIZE = 256     # chunks embedded and written to Chroma per batch
+INGEST_QUEUE_SIZE = 2       # embedded batches allowed to wait for the Chroma writer
+INGEST_WORKERS = 1          # parse/chunk processes; 1 = parse in-process
+WRITER_POLL_S = 1.0         # how often a producer blocked on a full queue checks the writer is alive
+MANIFEST_SAVE_INTERVAL_S = 5.0  # min seconds between manifest saves during ingest; always saved at the end
+# Bumped when the chunk metadata written at ingest changes; files ingested under an older
+# version are re-written in full on the next ingest so every chunk carries the new fields.
+METADATA_VERSION = 2        # 2: + file_type, ingest_batch
+# "chroma" (default) or "faiss" (memory-mapped FAISS index, see backend/faiss_store.py).
+# Switching an existing deployment to FAISS: python backend/migrate_chroma_to_faiss.py
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+VECTOR_STORES = ("chroma", "faiss")
+
+
+class VectorCollection(Protocol):
+    """The collection methods ingest and retrieval rely on. A Chroma collection and a
+       FaissStore both provide them, so either can back the knowledge base."""
+
+    def upsert(self, ids: Sequence[str], embeddings: Any, documents: Sequence[str],
+               metadatas: Sequence[Dict]) -> None: ...
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> None: ...
+    def query(self, query_embeddings: Any, n_results: int = 10, include: Optional[List[str]] = None,
+              where: Optional[Dict] = None) -> Dict: ...
+    def get(self, include: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0) -> Dict: ...
+    def count(self) -> int: ...
 
-# Initialize embedding model and Chroma client
-model = SentenceTransformer(EMBED_MODEL_NAME)
-import chromadb
-from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+# The Chroma client is created lazily on first use (see get_client), so importing this module is cheap.
+_client = None
+_client_lock = threading.Lock()
 
-# Use PersistentClient for local persistent DB (creates PERSIST_DIRECTORY if missing)
-client = chromadb.PersistentClient(
-    path=PERSIST_DIRECTORY,
-    settings=Settings(),
-    tenant=DEFAULT_TENANT,
-    database=DEFAULT_DATABASE,
-)
+def get_client():
+    """Return the shared Chroma PersistentClient, opening it on first call (thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import chromadb
+                from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+                # Use PersistentClient for local persistent DB (creates PERSIST_DIRECTORY if missing)
+                _client = chromadb.PersistentClient(
+                    path=PERSIST_DIRECTORY,
+                    settings=Settings(),
+                    tenant=DEFAULT_TENANT,
+                    database=DEFAULT_DATABASE,
+                )
+    return _client
+
+def warmup() -> Dict:
+    """Load the encoder and open the vector store so the first request does not pay for it.
+       Safe to call more than once."""
+    result = warmup_encoder()
+    open_collection()
+    return result
 
 
 def parse_file(path: str) -> str:
@@ -74,61 +123,417 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
             break
     return chunks
 
-def ensure_collection():
-    """Get or create chroma collection."""
+def ensure_collection() -> VectorCollection:
+    """Get or create the knowledge base collection in the configured VECTOR_STORE."""
+    if VECTOR_STORE not in VECTOR_STORES:
+        raise ValueError(f"Unsupported VECTOR_STORE: {VECTOR_STORE} (expected one of {VECTOR_STORES})")
+    if VECTOR_STORE == "faiss":
+        return get_faiss_store()
+    client = get_client()
     try:
         collection = client.get_collection(name=COLLECTION_NAME)
     except Exception:
         collection = client.create_collection(name=COLLECTION_NAME)
     return collection
 
-def ingest_files(file_paths: List[str]) -> Dict:
-    """Main ingestion function: parse files, chunk, embed, and add to Chroma."""
-    docs = []
-    metadatas = []
-    ids = []
+def open_collection() -> Optional[VectorCollection]:
+    """The existing knowledge base collection, or None while nothing has been ingested yet."""
+    if VECTOR_STORE == "faiss":
+        return get_faiss_store(create=False)
+    try:
+        return get_client().get_collection(name=COLLECTION_NAME)
+    except Exception:
+        return None
 
-    for fp in file_paths:
-        print(f"Parsing: {fp}")
-        try:
+def content_hash(data) -> str:
+    """sha256 hex digest of a str or bytes payload."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_id(origin_path: str, index: int) -> str:
+    """Deterministic Chroma id for chunk `index` of the file at `origin_path`.
+       The same file position always maps to the same id, so re-ingesting upserts
+       in place instead of duplicating."""
+    return f"{Path(origin_path).name}__{index}__{content_hash(str(origin_path))[:8]}"
+
+def load_manifest() -> Dict:
+    """Load the ingest manifest: {origin_path: {"file_hash": str, "chunks": [chunk_hash, ...]}}."""
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest: Dict) -> None:
+    """Atomically write the ingest manifest next to the Chroma files."""
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def prepare_file(fp: str, previous_hash: Optional[str] = None) -> Dict:
+    """
+    Read, hash, parse and chunk a single file. Runs in a worker process in parallel mode,
+    so it only takes and returns plain picklable values:
+      {"path", "status": "ok" | "skipped" | "failed", "file_hash", "chunks", "chunk_hashes"}
+    Files whose hash equals `previous_hash` are reported as skipped without parsing.
+    """
+    result = {"path": fp, "status": "failed", "file_hash": None, "chunks": [], "chunk_hashes": []}
+    try:
+        file_hash = content_hash(Path(fp).read_bytes())
+    except OSError as e:
+        print(f"Failed to read {fp}: {e}")
+        return result
+    result["file_hash"] = file_hash
+    if file_hash == previous_hash:
+        result["status"] = "skipped"
+        return result
+
+    print(f"Parsing: {fp}")
+    try:
+        with span("parse_file", path=fp, bytes=Path(fp).stat().st_size):
             text = parse_file(fp)
-        except Exception as e:
-            print(f"Failed to parse {fp}: {e}")
+    except Exception as e:
+        print(f"Failed to parse {fp}: {e}")
+        return result
+    with span("chunk_text", chars=len(text)) as current:
+        chunks = chunk_text(text)
+        current.set_attribute("chunks", len(chunks))
+    result.update(status="ok", chunks=chunks, chunk_hashes=[content_hash(c) for c in chunks])
+    return result
+
+def get_index_generation() -> int:
+    """Current index generation. Bumped by every ingest that changed the collection, so
+       caches keyed on it (possibly in another process, e.g. the API server) never serve
+       results from an older index."""
+    try:
+        with open(INDEX_GENERATION_PATH, "r", encoding="utf-8") as fh:
+            return int(fh.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_index_generation() -> int:
+    generation = get_index_generation() + 1
+    os.makedirs(os.path.dirname(INDEX_GENERATION_PATH), exist_ok=True)
+    tmp_path = INDEX_GENERATION_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write(str(generation))
+    os.replace(tmp_path, INDEX_GENERATION_PATH)
+    return generation
+
+def _metadata_current(entry: Optional[Dict]) -> bool:
+    # entries written before chunking / the embedding backend were recorded used 800/200 and torch
+    return (bool(entry) and entry.get("metadata_version", 1) >= METADATA_VERSION
+            and entry.get("chunking", [800, 200]) == [CHUNK_SIZE, CHUNK_OVERLAP]
+            and entry.get("embedding", EMBED_MODEL_NAME) == embedding_cache_key())
+
+def chunk_metadata(fp: str, index: int, ingest_batch: Optional[int] = None) -> Dict:
+    """Metadata stored with every chunk; retrieval can be filtered on any of these fields."""
+    meta = {"source": Path(fp).name, "chunk_index": index, "origin_path": fp,
+            "file_type": Path(fp).suffix.lower().lstrip(".")}
+    if ingest_batch is not None:
+        meta["ingest_batch"] = ingest_batch
+    return meta
+
+def iter_prepared_files(file_paths: List[str], manifest: Dict, workers: int = INGEST_WORKERS) -> Iterator[Dict]:
+    """
+    Yield prepare_file() results in input order. With workers > 1 files are parsed in a
+    process pool; at most a few files per worker are in flight, so results never pile up
+    in memory while the embedding stage is busy.
+    """
+    previous = lambda fp: manifest.get(fp, {}).get("file_hash") if _metadata_current(manifest.get(fp)) else None
+    if workers <= 1:
+        for fp in file_paths:
+            yield prepare_file(fp, previous(fp))
+        return
+
+    window = workers * 2
+    # spawn, not fork: ingest_files has already started the writer thread, and a forked child
+    # can inherit locks that thread holds (SQLite, tokenizers, stdout) and deadlock on them
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for fp in file_paths:
+            pending.append(pool.submit(prepare_file, fp, previous(fp)))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_ingest_events(file_paths: List[str], manifest: Dict, stats: Dict, workers: int = INGEST_WORKERS,
+                       ingest_batch: Optional[int] = None) -> Iterator[Tuple[str, object]]:
+    """
+    Stage 1 of the ingest pipeline: parse -> chunk -> diff against the manifest.
+    Yields (kind, payload) events in the order they must be applied:
+      ("delete_ids", [id, ...])        stale chunks to remove
+      ("delete_path", origin_path)     pre-manifest chunks of a file seen for the first time
+      ("chunk", (id, document, metadata))
+      ("file_done", (origin_path, manifest_entry or None))
+    Only a bounded number of files' text is held in memory at a time. Chunks written by
+    this run are tagged with `ingest_batch`.
+    """
+    # Files that were ingested before but have since been deleted from disk
+    for origin_path, entry in manifest.items():
+        if not Path(origin_path).exists():
+            print(f"Removing deleted file from index: {origin_path}")
+            yield "delete_ids", [chunk_id(origin_path, i) for i in range(len(entry.get("chunks", [])))]
+            yield "file_done", (origin_path, None)
+
+    file_paths = [str(fp) for fp in file_paths]
+    for prepared in iter_prepared_files(file_paths, manifest, workers=workers):
+        fp = prepared["path"]
+        if prepared["status"] == "skipped":
+            stats["skipped_files"] += 1
+            continue
+        if prepared["status"] != "ok":
             continue
 
-        chunks = chunk_text(text)
+        if fp not in manifest:
+            yield "delete_path", fp
+        chunks = prepared["chunks"]
+        chunk_hashes = prepared["chunk_hashes"]
+        old_hashes = manifest.get(fp, {}).get("chunks", [])
+        rewrite_all = not _metadata_current(manifest.get(fp))
+        # chunks beyond the new end of the file
+        if len(old_hashes) > len(chunks):
+            yield "delete_ids", [chunk_id(fp, i) for i in range(len(chunks), len(old_hashes))]
         for i, c in enumerate(chunks):
-            doc_id = f"{Path(fp).name}__{i}__{uuid.uuid4().hex[:8]}"
-            docs.append(c)
-            metadatas.append({"source": Path(fp).name, "chunk_index": i, "origin_path": str(fp)})
-            ids.append(doc_id)
+            if not rewrite_all and i < len(old_hashes) and old_hashes[i] == chunk_hashes[i]:
+                continue
+            yield "chunk", (chunk_id(fp, i), c, chunk_metadata(fp, i, ingest_batch))
+        yield "file_done", (fp, {"file_hash": prepared["file_hash"], "chunks": chunk_hashes,
+                                 "metadata_version": METADATA_VERSION, "chunking": [CHUNK_SIZE, CHUNK_OVERLAP],
+                                 "embedding": embedding_cache_key()})
 
-    if not docs:
-        return {"status": "no_documents", "added": 0}
+def _new_batch() -> Dict:
+    return {"delete_ids": [], "delete_paths": [], "ids": [], "documents": [], "metadatas": [],
+            "embeddings": None, "done": [], "failed_paths": set()}
 
-    print(f"Encoding {len(docs)} chunks with model {EMBED_MODEL_NAME} ...")
-    embeddings = model.encode(docs, show_progress_bar=True, convert_to_numpy=True)
+def iter_ingest_batches(events: Iterator[Tuple[str, object]], batch_size: int = INGEST_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Stage 2: group events into batches of at most `batch_size` chunks and embed each batch.
+    Deletes and file completions travel with the batch they precede, so applying batches
+    in order preserves event order.
+    """
+    batch = _new_batch()
 
-    collection = ensure_collection()
+    def _flush(b: Dict) -> Dict:
+        if b["documents"]:
+            try:
+                with span("embed_batch", chunks=len(b["documents"])):
+                    b["embeddings"] = embed_texts(b["documents"])
+            except Exception as e:
+                print(f"Failed to embed batch of {len(b['documents'])} chunks: {e}")
+                b["failed_paths"].update(m["origin_path"] for m in b["metadatas"])
+                b["ids"], b["documents"], b["metadatas"] = [], [], []
+        return b
 
-    # If the collection already has items with same ids, we should remove them first (idempotency)
-    try:
-        existing_ids = [m["id"] for m in collection.get(include=["id"]).get("id", [])] if False else []
-    except Exception:
-        existing_ids = []
+    for kind, payload in events:
+        if kind == "chunk":
+            doc_id, doc, meta = payload
+            batch["ids"].append(doc_id)
+            batch["documents"].append(doc)
+            batch["metadatas"].append(meta)
+            if len(batch["documents"]) >= batch_size:
+                yield _flush(batch)
+                batch = _new_batch()
+        elif kind == "delete_ids":
+            batch["delete_ids"].extend(payload)
+        elif kind == "delete_path":
+            batch["delete_paths"].append(payload)
+        elif kind == "file_done":
+            batch["done"].append(payload)
 
-    print(f"Adding {len(docs)} chunks to Chroma collection '{COLLECTION_NAME}' (persist dir: {PERSIST_DIRECTORY}) ...")
-    collection.add(
-        documents=docs,
-        metadatas=metadatas,
-        ids=ids,
-        embeddings=embeddings.tolist() if isinstance(embeddings, np.ndarray) else embeddings
-    )
+    if batch["documents"] or batch["delete_ids"] or batch["delete_paths"] or batch["done"]:
+        yield _flush(batch)
 
-    # Persist DB to disk
+def _write_batches(batches: "queue.Queue", collection, manifest: Dict, stats: Dict, trace_context=None) -> None:
+    """
+    Stage 3 (writer thread): apply deletes and upserts batch by batch, then commit the
+    manifest entries of files whose chunks are all written. A failed batch only
+    loses its own files; they are left out of the manifest and retried next run.
+    The manifest is rewritten at most every MANIFEST_SAVE_INTERVAL_S seconds and once
+    after the last batch, so large ingests do not serialize it per batch.
+    Spans are parented to `trace_context` (the ingest_files span).
+    """
+    failed_paths = set()
+    dirty = False
+    last_save = time.monotonic()
+    while True:
+        batch = batches.get()
+        if batch is None:
+            if dirty:
+                save_manifest(manifest)
+            return
+        failed_paths |= batch["failed_paths"]
+        try:
+            # the BM25 and fact indexes mirror every collection write, under the same chunk ids
+            lexical = get_lexical_index()
+            facts = get_fact_index()
+            for fp in batch["delete_paths"]:
+                collection.delete(where={"origin_path": fp})
+                lexical.delete_origin(fp)
+                facts.delete_origin(fp)
+            if batch["delete_ids"]:
+                collection.delete(ids=batch["delete_ids"])
+                lexical.delete(batch["delete_ids"])
+                facts.delete(batch["delete_ids"])
+                stats["deleted"] += len(batch["delete_ids"])
+            if batch["ids"]:
+                with span("collection.add", context=trace_context, chunks=len(batch["ids"]), store=VECTOR_STORE):
+                    collection.upsert(
+                        ids=batch["ids"],
+                        documents=batch["documents"],
+                        metadatas=batch["metadatas"],
+                        embeddings=batch["embeddings"].tolist() if isinstance(batch["embeddings"], np.ndarray) else batch["embeddings"],
+                    )
+                with span("lexical_index.upsert", context=trace_context, chunks=len(batch["ids"])):
+                    lexical.upsert(batch["ids"], batch["documents"], batch["metadatas"])
+                with span("fact_index.upsert", context=trace_context, chunks=len(batch["ids"])):
+                    facts.upsert(batch["ids"], batch["documents"], batch["metadatas"])
+                stats["added"] += len(batch["ids"])
+        except Exception as e:
+            print(f"Failed to write batch to the vector store: {e}")
+            stats["failed_batches"] += 1
+            failed_paths.update(m["origin_path"] for m in batch["metadatas"])
+            failed_paths.update(batch["delete_paths"])
+            continue
+
+        for fp, entry in batch["done"]:
+            if fp in failed_paths:
+                continue
+            if entry is None:
+                manifest.pop(fp, None)
+            else:
+                manifest[fp] = entry
+            dirty = True
+        if dirty and time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL_S:
+            save_manifest(manifest)
+            dirty = False
+            last_save = time.monotonic()
+        print(f"Committed batch: {stats['added']} chunks written, {stats['deleted']} deleted so far")
+
+def _run_writer(batches: "queue.Queue", collection, manifest: Dict, stats: Dict, state: Dict,
+                trace_context=None) -> None:
+    """Writer thread body: on an unexpected error (e.g. the manifest cannot be saved), record
+       it in `state` and drain the queue so the producer is not left blocked on put()."""
     try:
-        client.persist()
-    except Exception:
-        pass
+        _write_batches(batches, collection, manifest, stats, trace_context)
+    except BaseException as e:
+        state["error"] = e
+        print(f"Ingest writer failed: {e}")
+        while True:
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                return
+
+def _put_batch(batches: "queue.Queue", item: Optional[Dict], writer: threading.Thread) -> bool:
+    """Hand `item` to the writer; False if the writer thread has died instead of taking it."""
+    while True:
+        try:
+            batches.put(item, timeout=WRITER_POLL_S)
+            return True
+        except queue.Full:
+            if not writer.is_alive():
+                return False
+
+def backfill_lexical_index(collection, page_size: int = INGEST_BATCH_SIZE) -> int:
+    """Build the BM25 index from the collection if it is empty (collections ingested before
+       the lexical index existed). Pages through the collection, so memory stays bounded."""
+    lexical = get_lexical_index()
+    total = collection.count()
+    if total == 0 or lexical.count() > 0:
+        return 0
+    print(f"Building lexical index from {total} existing chunks ...")
+    for offset in range(0, total, page_size):
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        lexical.upsert(page["ids"], page["documents"], [m or {} for m in page["metadatas"]])
+    return total
+
+def backfill_fact_index(collection, page_size: int = INGEST_BATCH_SIZE) -> int:
+    """(Re)extract facts from every chunk of the collection when the fact index is missing
+       chunks (collections ingested before it existed) or was built by an older extractor."""
+    facts = get_fact_index()
+    total = collection.count()
+    if facts.extractor_version() == FACT_EXTRACTOR_VERSION and (total == 0 or facts.count() > 0):
+        return 0
+    facts.clear()
+    if total:
+        print(f"Building fact index from {total} existing chunks ...")
+    for offset in range(0, total, page_size):
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        facts.upsert(page["ids"], page["documents"], [m or {} for m in page["metadatas"]])
+    facts.set_extractor_version()
+    return total
+
+def ingest_files(file_paths: List[str], batch_size: int = INGEST_BATCH_SIZE, workers: int = INGEST_WORKERS) -> Dict:
+    """Main ingestion function: parse files, chunk, embed, and add to Chroma.
+
+    Ingestion is incremental. A manifest of per-file and per-chunk content hashes
+    is kept in MANIFEST_PATH:
+      - files whose bytes are unchanged are skipped without parsing,
+      - changed files only re-embed the chunks whose text changed,
+      - chunks past the end of a shrunk file, and all chunks of files that no
+        longer exist on disk, are deleted from the collection.
+
+    Ingestion is streamed: files are parsed and chunked lazily, chunks are embedded
+    `batch_size` at a time, and a writer thread applies each batch to Chroma while the
+    next one is being embedded. At most INGEST_QUEUE_SIZE embedded batches wait in
+    between, so peak memory does not grow with the corpus, and progress is committed
+    to the manifest every MANIFEST_SAVE_INTERVAL_S seconds and at the end of the run.
+
+    With workers > 1, parsing and chunking run in a pool of `workers` processes; results
+    are consumed in input order, so the embedding stage and chunk ids are deterministic.
+
+    Chunks written by a run carry `ingest_batch` = the index generation the run produces,
+    so retrieval can be scoped to what a given ingest added (see backend/metadata_filter.py).
+    """
+    with span("ingest_files", files=len(file_paths), store=VECTOR_STORE) as current:
+        manifest = load_manifest()
+        stats = {"added": 0, "deleted": 0, "skipped_files": 0, "failed_batches": 0}
+        collection = ensure_collection()
+        if manifest and collection.count() == 0:
+            # e.g. a fresh store after switching VECTOR_STORE: the manifest describes another store
+            print(f"Vector store is empty; ignoring the manifest and re-ingesting {len(manifest)} files")
+            manifest = {}
+        backfill_lexical_index(collection)
+        backfill_fact_index(collection)
+
+        batches: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        writer_state: Dict[str, Any] = {"error": None}
+        # the writer owns `manifest` from here on; stage 1 reads a snapshot
+        writer = threading.Thread(target=_run_writer,
+                                  args=(batches, collection, manifest, stats, writer_state, capture_context()),
+                                  name="chroma-writer", daemon=True)
+        writer.start()
+        try:
+            events = iter_ingest_events(file_paths, dict(manifest), stats, workers=workers,
+                                        ingest_batch=get_index_generation() + 1)
+            for batch in iter_ingest_batches(events, batch_size=batch_size):
+                if not _put_batch(batches, batch, writer):
+                    break
+        finally:
+            _put_batch(batches, None, writer)
+            writer.join()
+        if writer_state["error"] is not None:
+            raise RuntimeError(f"Ingest writer failed: {writer_state['error']}") from writer_state["error"]
+
+        # Persist to disk (FAISS: bring the ANN index up to date with the appended vectors)
+        try:
+            if VECTOR_STORE == "faiss":
+                collection.persist()
+            else:
+                get_client().persist()
+        except Exception as e:
+            if VECTOR_STORE == "faiss":
+                print(f"Failed to update the FAISS index: {e}")
+
+        if stats["added"] or stats["deleted"]:
+            stats["index_generation"] = bump_index_generation()
+        current.set_attributes({f"ingest.{k}": v for k, v in stats.items()})
 
-    return {"status": "ok", "added": len(docs)}
+        if not (stats["added"] or stats["deleted"] or stats["skipped_files"]):
+            return {"status": "no_documents", "added": 0}
+        return {"status": "ok", **stats}
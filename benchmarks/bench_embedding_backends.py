@@ -0,0 +1,154 @@
+# benchmarks/bench_embedding_backends.py
+"""
+Compare the embedding backends in backend/encoder.py (torch fp32, onnx fp32, onnx int8).
+
+For each backend it reports:
+  - encoding throughput (chunks/s) over the corpus chunks
+  - memory growth (max RSS delta) from loading the model and encoding
+  - mean cosine similarity of its vectors to the torch fp32 vectors
+  - recall@k of nearest-neighbour search against the torch fp32 neighbours
+
+Memory figures are peak-RSS deltas, so only the first backend measured in a process is
+isolated. For clean per-backend memory numbers run one backend per process with
+--no-baseline (recall and cosine are then not reported).
+
+Usage (from the repo root):
+  python benchmarks/bench_embedding_backends.py assets/* --repeat 3 --out bench_embeddings.json
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from backend.encoder import EMBED_BACKENDS, load_embedding_model
+from backend.vector_store import parse_file, chunk_text
+
+DEFAULT_QUERIES = [
+    "discount code",
+    "coupon codes available",
+    "free shipping threshold",
+    "SAVE15",
+    "minimum order for discount",
+    "apply coupon button",
+    "invalid coupon message",
+    "checkout subtotal",
+]
+
+
+def max_rss_mb() -> Optional[float]:
+    """Peak RSS of this process in MB (None where the resource module is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def load_corpus(paths: List[str], synthetic: int) -> List[str]:
+    chunks: List[str] = []
+    for p in paths:
+        try:
+            chunks.extend(chunk_text(parse_file(p)))
+        except Exception as e:
+            print(f"Skipping {p}: {e}")
+    rng = np.random.default_rng(0)
+    words = " ".join(chunks).split() or ["discount", "code", "shipping", "order"]
+    for _ in range(synthetic):
+        chunks.append(" ".join(rng.choice(words, size=120)))
+    return chunks
+
+
+def encode(model, texts: List[str]) -> np.ndarray:
+    return np.asarray(model.encode(texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True),
+                      dtype=np.float32)
+
+
+def topk_ids(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    k = min(k, corpus.shape[0])
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def bench_backend(backend: str, chunks: List[str], queries: List[str], repeat: int) -> Dict:
+    rss_before = max_rss_mb()
+    t0 = time.perf_counter()
+    model = load_embedding_model(backend)
+    load_s = time.perf_counter() - t0
+
+    encode(model, chunks[:8])  # warm-up
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        corpus_vecs = encode(model, chunks)
+        timings.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    query_vecs = encode(model, queries)
+    query_s = time.perf_counter() - t0
+    rss_after = max_rss_mb()
+
+    best = min(timings)
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "encode_s": round(best, 4),
+        "chunks_per_s": round(len(chunks) / best, 1) if best > 0 else None,
+        "query_ms": round(1000 * query_s / max(1, len(queries)), 3),
+        "max_rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+        "_corpus": corpus_vecs,
+        "_queries": query_vecs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends against torch fp32.")
+    parser.add_argument("files", nargs="*", default=["assets/example.txt", "assets/checkout.html"])
+    parser.add_argument("--backends", nargs="+", default=list(EMBED_BACKENDS), choices=EMBED_BACKENDS)
+    parser.add_argument("--synthetic", type=int, default=2000, help="extra synthetic chunks to embed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--no-baseline", action="store_true",
+                        help="do not load the torch baseline (skips recall and cosine comparison)")
+    parser.add_argument("--out", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    chunks = load_corpus(args.files, args.synthetic)
+    print(f"Benchmarking {len(args.backends)} backends on {len(chunks)} chunks, {len(DEFAULT_QUERIES)} queries")
+
+    backends = list(args.backends)
+    if not args.no_baseline:
+        if "torch" in backends:  # the baseline goes first
+            backends.remove("torch")
+        backends.insert(0, "torch")
+
+    results = [bench_backend(b, chunks, DEFAULT_QUERIES, args.repeat) for b in backends]
+    base = None if args.no_baseline else results[0]
+    base_ids = topk_ids(base["_queries"], base["_corpus"], args.k) if base else None
+    for r in results:
+        if base is None:
+            continue
+        ids = topk_ids(r["_queries"], r["_corpus"], args.k)
+        overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(ids, base_ids)]
+        r[f"recall@{args.k}_vs_torch"] = round(float(np.mean(overlap)), 4)
+        r["mean_cosine_vs_torch"] = round(float(np.mean(np.sum(r["_corpus"] * base["_corpus"], axis=1))), 5)
+        r["speedup_vs_torch"] = round(base["encode_s"] / r["encode_s"], 2) if r["encode_s"] else None
+        if r["backend"] not in args.backends:
+            r["baseline_only"] = True
+
+    for r in results:
+        del r["_corpus"], r["_queries"]
+        print(json.dumps(r))
+    if args.out:
+        Path(args.out).write_text(json.dumps({"chunks": len(chunks), "k": args.k, "results": results}, indent=2),
+                                  encoding="utf-8")
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
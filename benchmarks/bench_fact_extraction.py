@@ -0,0 +1,162 @@
+# benchmarks/bench_fact_extraction.py
+"""
+Throughput and binding accuracy of the fact extraction in backend/agent_tools.py, on
+synthetic chunks the size of CHUNK_SIZE.
+
+Compares:
+  - legacy:    one regex scan per fact type per chunk, every code getting the chunk's
+               first percent and minimum order (the extraction before the rule engine)
+  - per_chunk: extract_facts() called once per chunk
+  - batched:   extract_facts_batch() over batches of --batch chunks (what ingest does)
+  - batched+1: batched, with one extra rule compiled in, to show that a new fact type
+               does not add another scan over the chunks
+
+A fraction of the chunks carry planted facts. Some of those chunks state two codes with
+different percents and minimum orders in separate sentences, which is where binding by
+proximity differs from binding to the first value of the chunk. Accuracy is the share
+of planted codes extracted with exactly their own percent and minimum order.
+
+Usage (from the repo root):
+  python benchmarks/bench_fact_extraction.py --chunks 100000 --out bench_facts.json
+  python benchmarks/bench_fact_extraction.py --chunks 20000 --fact-ratio 0.2 --batch 1024
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from backend.agent_tools import (FACT_RULES, compile_fact_rules, extract_facts,  # noqa: E402
+                                 extract_facts_batch)
+
+FILLER_WORDS = (
+    "order cart checkout customer payment invoice delivery parcel return refund account "
+    "address billing product item price total tax receipt confirmation email support "
+    "policy window days business week store online page form field button message "
+    "error notice update status tracking number courier package warranty exchange"
+).split()
+
+# The extraction before the rule engine, kept here as the baseline
+LEGACY_CODE_RE = re.compile(r'(?:code|coupon|promo)\s*(?:[:\-]?\s*)?\b((?-i:[A-Z0-9]{3,20}))\b', re.I)
+LEGACY_PERCENT_RE = re.compile(r'(\d{1,2})\s*%\s*(?:off|discount)?', re.I)
+LEGACY_MIN_ORDER_RE = re.compile(r'(?:orders?)\s*(?:above|over|>=)\s*\$?(\d+)', re.I)
+LEGACY_FREE_SHIPPING_RE = re.compile(r'free\s+for\s+orders\s+(?:over|above|>=)\s*\$?(\d+)', re.I)
+
+# An extra fact type, only compiled into the "batched+1" rule set
+RETURN_WINDOW_RULE = {"name": "return_days", "kind": "returns", "role": "anchor", "type": int, "first": "r",
+                      "pattern": r'returns?\s+within\s+(?P<return_days>\d+)\s+days'}
+
+
+def legacy_extract(text: str) -> Dict[str, List[Dict[str, Any]]]:
+    percents = LEGACY_PERCENT_RE.findall(text)
+    mins = LEGACY_MIN_ORDER_RE.findall(text)
+    percent = int(percents[0]) if percents else None
+    min_order = int(mins[0]) if mins else None
+    discount = [{"code": code, "percent": percent, "min_order": min_order} for code in LEGACY_CODE_RE.findall(text)]
+    m = LEGACY_FREE_SHIPPING_RE.search(text)
+    return {"discount": discount, "shipping": [{"free_over": int(m.group(1))}] if m else []}
+
+
+def synthetic_chunks(n: int, chunk_chars: int, fact_ratio: float,
+                     seed: int = 0) -> Tuple[List[str], List[Dict[str, Tuple[int, int]]]]:
+    """`n` chunks of at least `chunk_chars` characters, and per chunk the planted
+       {code: (percent, min_order)} it states."""
+    rng = random.Random(seed)
+    chunks, truth = [], []
+    for i in range(n):
+        sentences, length = [], 0
+        while length < chunk_chars:
+            sentence = " ".join(rng.choices(FILLER_WORDS, k=rng.randint(8, 15))).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        planted: Dict[str, Tuple[int, int]] = {}
+        if rng.random() < fact_ratio:
+            for k in range(2 if rng.random() < 0.5 else 1):
+                planted[f"OCEAN{i:06d}{k}"] = (rng.randint(5, 49), rng.randint(2, 19) * 10)
+            facts = [f"Promo code {code} gives {p}% off on orders above ${m}." for code, (p, m) in planted.items()]
+            if rng.random() < 0.3:
+                facts.append(f"Shipping is free for orders over ${rng.randint(5, 14) * 10}.")
+            for fact in facts:
+                sentences.insert(rng.randint(0, len(sentences)), fact)
+        if rng.random() < 0.1:
+            sentences.insert(rng.randint(0, len(sentences)), f"Returns within {rng.randint(7, 59)} days.")
+        chunks.append(" ".join(sentences))
+        truth.append(planted)
+    return chunks, truth
+
+
+def accuracy(results: List[Dict[str, List[Dict[str, Any]]]], truth: List[Dict[str, Tuple[int, int]]]) -> float:
+    planted = correct = 0
+    for facts, expected in zip(results, truth):
+        found = {f["code"]: (f["percent"], f["min_order"]) for f in facts["discount"]}
+        for code, values in expected.items():
+            planted += 1
+            correct += found.get(code) == values
+    return round(correct / planted, 4) if planted else 1.0
+
+
+def timed(name: str, fn, chunks: List[str], truth, repeats: int) -> Dict[str, Any]:
+    best, results = None, None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        results = fn(chunks)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    mb = sum(len(c) for c in chunks) / (1024 * 1024)
+    n_facts = sum(len(items) for facts in results for items in facts.values())
+    return {"method": name, "seconds": round(best, 3), "chunks_per_s": round(len(chunks) / best),
+            "mb_per_s": round(mb / best, 1), "facts": n_facts, "binding_accuracy": accuracy(results, truth)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fact extraction throughput and binding accuracy.")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--chunk-chars", type=int, default=800, help="characters per chunk (CHUNK_SIZE)")
+    parser.add_argument("--fact-ratio", type=float, default=0.05, help="share of chunks with planted facts")
+    parser.add_argument("--batch", type=int, default=256, help="chunks per extract_facts_batch call")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per method; the fastest is reported")
+    parser.add_argument("--out", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    chunks, truth = synthetic_chunks(args.chunks, args.chunk_chars, args.fact_ratio)
+    print(f"Generated {len(chunks)} chunks ({sum(len(c) for c in chunks) / (1024 * 1024):.1f} MB, "
+          f"{sum(len(t) for t in truth)} planted codes) in {time.perf_counter() - t0:.1f}s")
+
+    extended = compile_fact_rules(FACT_RULES + [RETURN_WINDOW_RULE])
+
+    def batched(ruleset=None):
+        def run(texts: List[str]):
+            out = []
+            for start in range(0, len(texts), args.batch):
+                out.extend(extract_facts_batch(texts[start:start + args.batch], ruleset))
+            return out
+        return run
+
+    methods = [
+        ("legacy", lambda texts: [legacy_extract(t) for t in texts]),
+        ("per_chunk", lambda texts: [extract_facts(t) for t in texts]),
+        ("batched", batched()),
+        ("batched+1", batched(extended)),
+    ]
+    results = []
+    for name, fn in methods:
+        r = timed(name, fn, chunks, truth, args.repeats)
+        results.append(r)
+        print(json.dumps(r))
+
+    if args.out:
+        config = {"chunks": len(chunks), "chunk_chars": args.chunk_chars, "fact_ratio": args.fact_ratio,
+                  "batch": args.batch, "repeats": args.repeats}
+        Path(args.out).write_text(json.dumps({"config": config, "results": results}, indent=2), encoding="utf-8")
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# benchmarks/bench_retrieval.py
+"""
+Retrieval quality and latency benchmark, for comparing CHUNK_SIZE / CHUNK_OVERLAP,
+the embedding backend, the vector store and the retrieval modes between runs.
+
+Every corpus size runs in a fresh process inside a scratch directory, so nothing is
+read from or written to ./chroma_db, and settings given as environment variables
+(CHUNK_SIZE, CHUNK_OVERLAP, EMBED_BACKEND, VECTOR_STORE, ...) apply to that process
+only. The corpus is assets/ plus synthetic .txt files padding it to the requested
+number of chunks. The synthetic files carry planted facts (promo codes, product
+warehouses) that are used as labeled queries next to the hand-labeled asset queries.
+A retrieved chunk is relevant if it contains one of the query's `relevant` strings.
+
+For each corpus size it reports:
+  - ingest throughput of ingest_files (chunks/s) and peak RSS of the process
+  - recall@k and MRR of retrieve_topk per retrieval mode
+  - p50 / p95 / p99 / mean latency of retrieve_topk (result cache bypassed, query
+    vector cache cleared per mode, so every query is embedded)
+  - p50 / p95 / p99 latency of /query_agent end to end with the LLM replaced by a stub
+
+Runs offline: Hugging Face downloads are disabled (the models must already be in the
+local cache) and no LLM request is made.
+
+Usage (from the repo root):
+  python benchmarks/bench_retrieval.py --sizes 0 10000 --out bench_retrieval.json
+  CHUNK_SIZE=500 CHUNK_OVERLAP=100 python benchmarks/bench_retrieval.py --sizes 10000 --out small_chunks.json
+  python benchmarks/bench_retrieval.py --sizes 100000 --modes dense hybrid --queries-file my_queries.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import multiprocessing as mp
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+MODES = ("dense", "lexical", "hybrid")
+
+# Hand-labeled queries over assets/
+ASSET_QUERIES = [
+    {"query": "discount code", "relevant": ["SAVE15"]},
+    {"query": "How much does the SAVE15 coupon take off?", "relevant": ["15% off"]},
+    {"query": "minimum order value for the discount", "relevant": ["orders above $50"]},
+    {"query": "free shipping threshold", "relevant": ["free for orders over"]},
+    {"query": "where do I enter the coupon code", "relevant": ["Coupon code"]},
+    {"query": "cart subtotal on the checkout page", "relevant": ["Subtotal"]},
+]
+
+FILLER_WORDS = (
+    "order cart checkout customer payment invoice delivery parcel return refund account "
+    "address billing product item price total tax receipt confirmation email support "
+    "policy window days business week store online page form field button message "
+    "error notice update status tracking number courier package warranty exchange "
+    "size color stock available limited offer season catalog category brand review"
+).split()
+COLORS = ("red", "blue", "green", "black", "white", "silver", "amber", "violet", "teal", "coral")
+PRODUCTS = ("backpack", "kettle", "lamp", "jacket", "blender", "headset", "umbrella", "toaster",
+            "notebook", "sneaker", "tripod", "monitor")
+CITIES = ("Lisbon", "Oslo", "Denver", "Osaka", "Nairobi", "Lima", "Dublin", "Perth", "Austin", "Seoul")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak RSS of this process in MB (None where the resource module is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_synthetic_corpus(directory: Path, n_chunks: int, planted: int, chunk_size: int, overlap: int,
+                           chunks_per_file: int = 20, seed: int = 0) -> List[Dict]:
+    """
+    Write .txt files that chunk into about `n_chunks` chunks, with `planted` facts spread
+    over them. Returns the labeled queries for the planted facts.
+    """
+    rng = np.random.default_rng(seed)
+    step = max(1, chunk_size - overlap)
+    file_chars = chunks_per_file * step + overlap
+    n_files = max(1, -(-n_chunks // chunks_per_file)) if n_chunks else 0
+    fact_files = set(rng.choice(n_files, size=min(planted, n_files), replace=False).tolist()) if n_files else set()
+    queries = []
+    directory.mkdir(parents=True, exist_ok=True)
+    for f in range(n_files):
+        sentences, length = [], 0
+        while length < file_chars:
+            words = rng.choice(FILLER_WORDS, size=int(rng.integers(8, 16)))
+            sentence = " ".join(words).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        if f in fact_files:
+            code = f"OCEAN{f:06d}"
+            percent, minimum = int(rng.integers(5, 40)), int(rng.integers(2, 20)) * 10
+            color, product, city = rng.choice(COLORS), rng.choice(PRODUCTS), rng.choice(CITIES)
+            sentences.insert(int(rng.integers(0, len(sentences))),
+                             f"Promo code {code} gives {percent}% off on orders above ${minimum}.")
+            sentences.insert(int(rng.integers(0, len(sentences))),
+                             f"The {color} {product} {f} ships from the {city} warehouse.")
+            queries.append({"query": f"What does promo code {code} give?", "relevant": [f"Promo code {code}"]})
+            queries.append({"query": f"Which warehouse ships the {color} {product} {f}?",
+                            "relevant": [f"{color} {product} {f} ships"]})
+        (directory / f"synthetic_{f:06d}.txt").write_text(" ".join(sentences), encoding="utf-8")
+    return queries
+
+
+def relevant_counts(file_paths: List[str], queries: List[Dict]) -> List[int]:
+    """Number of corpus chunks that contain each query's relevant strings."""
+    from backend.vector_store import parse_file, chunk_text
+    counts = [0] * len(queries)
+    for fp in file_paths:
+        for chunk in chunk_text(parse_file(fp)):
+            for i, q in enumerate(queries):
+                if any(r in chunk for r in q["relevant"]):
+                    counts[i] += 1
+    return counts
+
+
+def score(docs: List[Dict], query: Dict, n_relevant: int, k: int):
+    hits = [any(r in (d.get("document") or "") for r in query["relevant"]) for d in docs[:k]]
+    recall = sum(hits) / min(k, n_relevant) if n_relevant else 0.0
+    rr = next((1.0 / (i + 1) for i, h in enumerate(hits) if h), 0.0)
+    return recall, rr
+
+
+def run_size(size: int, args_dict: Dict, scratch: str) -> Dict:
+    """Runs in a fresh process: build the corpus, ingest it, query it."""
+    os.chdir(scratch)
+    from backend import vector_store
+    from backend.vector_store import ingest_files, CHUNK_SIZE, CHUNK_OVERLAP
+    from backend.encoder import query_vector_cache
+    from backend.retrieval import retrieve_topk
+
+    k = args_dict["k"]
+    queries = list(ASSET_QUERIES) + args_dict["extra_queries"]
+    queries += write_synthetic_corpus(Path(scratch) / "corpus", size, args_dict["planted"], CHUNK_SIZE, CHUNK_OVERLAP)
+    files = [str(p) for p in sorted((ROOT / "assets").iterdir()) if p.is_file()]
+    files += sorted(str(p) for p in (Path(scratch) / "corpus").glob("*.txt"))
+    n_relevant = relevant_counts(files, queries)
+    labeled = [(q, n) for q, n in zip(queries, n_relevant) if n]
+    if len(labeled) < len(queries):
+        print(f"{len(queries) - len(labeled)} queries have no relevant chunk in the corpus and are skipped")
+
+    t0 = time.perf_counter()
+    ingest = ingest_files(files)
+    ingest_s = time.perf_counter() - t0
+    chunks = vector_store.open_collection().count()
+    rss_after_ingest = peak_rss_mb()
+
+    retrieve_topk("warmup", top_k=k, use_cache=False)
+    modes = {}
+    for mode in args_dict["modes"]:
+        query_vector_cache.clear()
+        latencies, recalls, rrs = [], [], []
+        for q, n in labeled:
+            t0 = time.perf_counter()
+            docs = retrieve_topk(q["query"], top_k=k, use_cache=False, mode=mode)
+            latencies.append(time.perf_counter() - t0)
+            recall, rr = score(docs, q, n, k)
+            recalls.append(recall)
+            rrs.append(rr)
+        modes[mode] = {f"recall@{k}": round(float(np.mean(recalls)), 4), "mrr": round(float(np.mean(rrs)), 4),
+                       **percentiles(latencies)}
+        print(f"[{size}] {mode}: {json.dumps(modes[mode])}")
+
+    end_to_end = None
+    if not args_dict["no_end_to_end"]:
+        end_to_end = run_end_to_end(labeled, k, args_dict["llm_delay_ms"])
+
+    return {
+        "synthetic_chunks": size,
+        "files": len(files),
+        "chunks": chunks,
+        "queries": len(labeled),
+        "ingest": {"status": ingest.get("status"), "seconds": round(ingest_s, 2),
+                   "chunks_per_s": round(chunks / ingest_s, 1) if ingest_s > 0 else None},
+        "peak_rss_mb_after_ingest": rss_after_ingest,
+        "peak_rss_mb": peak_rss_mb(),
+        "modes": modes,
+        "end_to_end": end_to_end,
+    }
+
+
+def run_end_to_end(labeled: List, k: int, llm_delay_ms: float) -> Dict:
+    """/query_agent through the ASGI app, with the LLM call replaced by a stub."""
+    import asyncio
+    from fastapi.testclient import TestClient
+    from backend import app as app_module
+    from backend.encoder import query_vector_cache
+
+    async def stub_llm(prompt: str, max_tokens: int = 400) -> Dict:
+        if llm_delay_ms:
+            await asyncio.sleep(llm_delay_ms / 1000)
+        return {"ok": True, "answer": f"stub answer ({len(prompt)} prompt chars)"}
+
+    app_module.acall_llm = stub_llm
+    query_vector_cache.clear()
+    latencies = []
+    with TestClient(app_module.app) as client:
+        for q, _ in labeled:
+            t0 = time.perf_counter()
+            res = client.post("/query_agent", json={"query": q["query"], "top_k": k, "use_llm": True})
+            latencies.append(time.perf_counter() - t0)
+            res.raise_for_status()
+    return {"llm_delay_ms": llm_delay_ms, **percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality, latency and ingest throughput.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[0, 10000],
+                        help="synthetic chunks added to assets/, one run per size")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--planted", type=int, default=50, help="synthetic files with planted facts (2 queries each)")
+    parser.add_argument("--queries-file", default=None,
+                        help='extra labeled queries: JSON list of {"query": ..., "relevant": [substring, ...]}')
+    parser.add_argument("--llm-delay-ms", type=float, default=0.0, help="simulated LLM latency of the stub")
+    parser.add_argument("--no-end-to-end", action="store_true", help="skip the /query_agent measurement")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directories")
+    parser.add_argument("--out", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Offline: models come from the local cache, and the LLM is never called
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    os.environ["OPENAI_API_KEY"] = ""
+    # every query must hit retrieval and the (stub) LLM, not an answer cache
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "0"
+    os.environ["WARMUP_ON_STARTUP"] = "0"
+
+    from backend.vector_store import CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_STORE
+    from backend.encoder import EMBED_MODEL_NAME, EMBED_BACKEND
+    from backend.retrieval import RETRIEVAL_MODE, MMR_ENABLED
+    from backend.reranker import RERANK_ENABLED
+
+    extra = json.loads(Path(args.queries_file).read_text(encoding="utf-8")) if args.queries_file else []
+    args_dict = {"k": args.k, "modes": args.modes, "planted": args.planted, "extra_queries": extra,
+                 "llm_delay_ms": args.llm_delay_ms, "no_end_to_end": args.no_end_to_end}
+    config = {"git_commit": git_commit(), "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+              "embed_model": EMBED_MODEL_NAME, "embed_backend": EMBED_BACKEND, "vector_store": VECTOR_STORE,
+              "default_mode": RETRIEVAL_MODE, "mmr": MMR_ENABLED, "rerank": RERANK_ENABLED, "k": args.k}
+    print(f"Config: {json.dumps(config)}")
+
+    runs = []
+    ctx = mp.get_context("spawn")
+    for size in args.sizes:
+        scratch = tempfile.mkdtemp(prefix=f"bench_retrieval_{size}_")
+        try:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(run_size, (size, args_dict, scratch))
+        finally:
+            if args.keep:
+                print(f"Kept {scratch}")
+            else:
+                shutil.rmtree(scratch, ignore_errors=True)
+        runs.append(result)
+        print(json.dumps(result))
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({"config": config, "runs": runs}, indent=2), encoding="utf-8")
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# benchmarks/bench_vector_stores.py
+"""
+Compare query latency, recall and memory of the vector stores: Chroma and the FAISS
+store (flat, ivf, hnsw) from backend/faiss_store.py.
+
+Every store is built from the same vectors in a scratch directory, then opened and
+queried in a fresh process, so the memory figures are not polluted by the build:
+  - p50 / p95 / mean latency of single-query searches, and throughput of batched searches
+  - recall@k against exact (brute-force) cosine neighbours
+  - RSS after opening the store and after the queries, split into anonymous memory
+    (private to the process) and file-backed memory (memory-mapped files, shared with
+    other workers through the page cache) where /proc is available
+
+Vectors are synthetic (clustered, unit-normalized, 384-d like all-MiniLM-L6-v2) unless
+--from-chroma is given, in which case the embeddings of the existing collection are used.
+
+Usage (from the repo root):
+  python benchmarks/bench_vector_stores.py --n 100000 --queries 500 --out bench_stores.json
+  python benchmarks/bench_vector_stores.py --from-chroma --stores chroma faiss-hnsw
+"""
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+STORES = ("chroma", "faiss-flat", "faiss-ivf", "faiss-hnsw")
+PAGE_SIZE = 5000
+
+
+def rss_mb() -> Dict[str, Optional[float]]:
+    """Current RSS of this process in MB, split into anonymous and file-backed pages on Linux."""
+    out = {"rss_mb": None, "rss_anon_mb": None, "rss_file_mb": None}
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as fh:
+            fields = dict(line.split(":", 1) for line in fh if ":" in line)
+        for key, name in (("rss_mb", "VmRSS"), ("rss_anon_mb", "RssAnon"), ("rss_file_mb", "RssFile")):
+            if name in fields:
+                out[key] = round(int(fields[name].split()[0]) / 1024, 1)
+    except OSError:
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            out["rss_mb"] = round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+        except ImportError:
+            pass
+    return out
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 200), dim)).astype(np.float32)
+    vecs = centers[rng.integers(0, len(centers), size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def chroma_vectors() -> np.ndarray:
+    from backend.vector_store import get_client, COLLECTION_NAME
+    collection = get_client().get_collection(name=COLLECTION_NAME)
+    pages = [np.asarray(collection.get(include=["embeddings"], limit=PAGE_SIZE, offset=o)["embeddings"],
+                        dtype=np.float32) for o in range(0, collection.count(), PAGE_SIZE)]
+    vecs = np.vstack(pages)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    out = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start:start + 256] @ corpus.T
+        out.append(np.argsort(-scores, axis=1)[:, :k])
+    return np.vstack(out)
+
+
+def build_store(store: str, directory: str, vectors: np.ndarray) -> float:
+    ids = [f"v{i}" for i in range(len(vectors))]
+    t0 = time.perf_counter()
+    if store == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=directory)
+        collection = client.create_collection(name="bench")
+        for start in range(0, len(vectors), PAGE_SIZE):
+            end = start + PAGE_SIZE
+            collection.add(ids=ids[start:end], embeddings=vectors[start:end].tolist(),
+                           documents=ids[start:end], metadatas=[{"i": i} for i in range(start, min(end, len(ids)))])
+    else:
+        from backend.faiss_store import FaissStore
+        faiss_store = FaissStore(directory=directory, index_type=store.split("-", 1)[1])
+        for start in range(0, len(vectors), PAGE_SIZE):
+            end = start + PAGE_SIZE
+            faiss_store.upsert(ids=ids[start:end], embeddings=vectors[start:end], documents=ids[start:end],
+                               metadatas=[{"i": i} for i in range(start, min(end, len(ids)))])
+        faiss_store.persist()
+    return time.perf_counter() - t0
+
+
+def measure_store(store: str, directory: str, queries: np.ndarray, k: int, batch: int) -> Dict:
+    """Runs in a fresh process: open the store, time queries, report memory and neighbours."""
+    before = rss_mb()
+    t0 = time.perf_counter()
+    if store == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=directory).get_collection(name="bench")
+    else:
+        from backend.faiss_store import FaissStore
+        collection = FaissStore(directory=directory, index_type=store.split("-", 1)[1])
+    collection.query(query_embeddings=queries[:1].tolist(), n_results=k, include=["metadatas", "distances"])
+    open_s = time.perf_counter() - t0
+    opened = rss_mb()
+
+    latencies, found = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        res = collection.query(query_embeddings=[q.tolist()], n_results=k, include=["metadatas", "distances"])
+        latencies.append(time.perf_counter() - t0)
+        found.append([m["i"] for m in res["metadatas"][0]])
+    t0 = time.perf_counter()
+    for start in range(0, len(queries), batch):
+        collection.query(query_embeddings=queries[start:start + batch].tolist(), n_results=k,
+                         include=["metadatas", "distances"])
+    batch_s = time.perf_counter() - t0
+    after = rss_mb()
+
+    ms = np.array(latencies) * 1000
+    return {
+        "open_s": round(open_s, 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "batched_qps": round(len(queries) / batch_s, 1) if batch_s > 0 else None,
+        "rss_before_open": before,
+        "rss_after_open": opened,
+        "rss_after_queries": after,
+        "_found": found,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma against the FAISS vector store.")
+    parser.add_argument("--stores", nargs="+", default=list(STORES), choices=STORES)
+    parser.add_argument("--n", type=int, default=50000, help="synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--from-chroma", action="store_true", help="use the embeddings of the existing collection")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=32, help="queries per batched search")
+    parser.add_argument("--out", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    vectors = chroma_vectors() if args.from_chroma else synthetic_vectors(args.n, args.dim)
+    # queries: perturbed corpus vectors, so they have real near neighbours
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    truth = exact_neighbours(vectors, queries, args.k)
+    print(f"Benchmarking {len(args.stores)} stores on {len(vectors)} vectors ({vectors.shape[1]}-d), "
+          f"{len(queries)} queries, k={args.k}")
+
+    results = []
+    ctx = mp.get_context("spawn")
+    for store in args.stores:
+        scratch = tempfile.mkdtemp(prefix=f"bench_{store}_")
+        try:
+            build_s = build_store(store, scratch, vectors)
+            with ctx.Pool(1) as pool:
+                r = pool.apply(measure_store, (store, scratch, queries, args.k, args.batch))
+            found = r.pop("_found")
+            recall = [len(set(f) & set(t.tolist())) / len(t) for f, t in zip(found, truth)]
+            size_mb = sum(p.stat().st_size for p in Path(scratch).rglob("*") if p.is_file()) / (1024 * 1024)
+            r = {"store": store, "build_s": round(build_s, 2), "disk_mb": round(size_mb, 1),
+                 f"recall@{args.k}": round(float(np.mean(recall)), 4), **r}
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        results.append(r)
+        print(json.dumps(r))
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k,
+                                              "queries": len(queries), "results": results}, indent=2),
+                                  encoding="utf-8")
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -108,6 +108,52 @@ with col2:
         else:
             st.info("No testcases in last response")
 
+st.markdown("---")
+st.header("Ask the Agent (streaming answer)")
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a server-sent-events response."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+ask_query = st.text_input("Question", "What discount codes are available?")
+if st.button("Ask (stream)"):
+    payload = {"query": ask_query, "top_k": int(top_k), "use_llm": True}
+    answer_box = st.empty()
+    chunks_box = st.container()
+    answer = ""
+    try:
+        with requests.post(f"{BACKEND_URL}/query_agent_stream", json=payload, stream=True, timeout=120) as r:
+            r.raise_for_status()
+            for event, data in iter_sse(r):
+                if event == "retrieved":
+                    with chunks_box.expander(f"Retrieved {len(data.get('retrieved', []))} chunk(s)"):
+                        for item in data.get("retrieved", []):
+                            st.markdown(f"**{item.get('metadata', {}).get('source')}** — distance {item.get('distance')}")
+                            st.code(item.get("document", ""))
+                elif event == "token":
+                    answer += data.get("text", "")
+                    answer_box.markdown(answer + "▌")
+                elif event == "done":
+                    answer_box.markdown(data.get("answer") or answer or data.get("message", ""))
+                    if data.get("timings_ms"):
+                        st.caption(f"Timings (ms): {data['timings_ms']}")
+                elif event == "error":
+                    answer_box.markdown(answer)
+                    st.error(f"LLM error: {data.get('error')}")
+    except Exception as e:
+        st.error(f"Failed to call backend: {e}")
+
 st.markdown("---")
 st.header("Generate Selenium Script from Selected Testcase")
 
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# Selenium scripts written by /generate_selenium_script; they drive a browser and are not unit tests
+collect_ignore_glob = ["generated_test*.py"]
@@ -0,0 +1,38 @@
+# tests/test_bulk_testcases.py
+import pytest
+
+from backend import bulk_testcases, fact_index
+from backend.fact_index import FactIndex
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = FactIndex(str(tmp_path / "facts.sqlite3"))
+    chunks = {
+        "a__0": ("docs/a.md", "Use code SAVE15 for 15% off on orders above $50."),
+        "a__1": ("docs/a.md", "Promo code WELCOME10 gives 10% off."),
+        "b__0": ("docs/b.md", "Use code SAVE15 for 15% off on orders above $50. "
+                              "Shipping is free for orders over $100."),
+    }
+    index.upsert(list(chunks), [doc for _, doc in chunks.values()],
+                 [{"source": path.split("/")[-1], "origin_path": path, "chunk_index": int(chunk_id[-1])}
+                  for chunk_id, (path, _) in chunks.items()])
+    monkeypatch.setattr(fact_index, "_index", index)
+    return index
+
+
+def test_testcases_are_numbered_across_pages_and_deduplicated(index):
+    out = list(bulk_testcases.iter_testcases(page_size=1))
+    summary = out.pop()
+    assert [tc["Test_ID"] for tc in out] == ["TC-DISCOUNT-001", "TC-DISCOUNT-001-NEG", "TC-DISCOUNT-002",
+                                             "TC-DISCOUNT-002-NEG", "TC-SHIP-001", "TC-SHIP-001-NEG"]
+    assert out[0]["Grounded_In"] == ["a.md"] and out[4]["Grounded_In"] == ["b.md"]
+    assert summary == {"status": "done", "facts_from": "index", "testcases": 6, "discount_facts": 2,
+                       "shipping_facts": 1, "chunk_facts": 4, "duplicates": 1}
+
+
+def test_testcases_scoped_by_where(index):
+    out = list(bulk_testcases.iter_testcases(where={"source": "b.md"}))
+    assert [tc["Test_Scenario"] for tc in out[:-1] if tc["Type"] == "Positive"] == [
+        "Valid discount code SAVE15 applies correct discount", "Free shipping for orders over $100"]
+    assert out[-1]["duplicates"] == 0
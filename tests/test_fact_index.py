@@ -0,0 +1,68 @@
+# tests/test_fact_index.py
+import pytest
+
+from backend import fact_index
+from backend.fact_index import FactIndex, facts_for_query
+
+CHUNKS = {
+    "a__0": ("docs/a.md", "Use code SAVE15 for 15% off on orders above $50."),
+    "a__1": ("docs/a.md", "Promo code WELCOME10 gives 10% off."),
+    "b__0": ("docs/b.md", "Use code SAVE15 for 15% off on orders above $50. Shipping is free for orders over $100."),
+    "c__0": ("other/b.md", "Shipping is free for orders over $75."),
+}
+
+
+def meta(chunk_id):
+    path = CHUNKS[chunk_id][0]
+    return {"source": path.split("/")[-1], "origin_path": path, "chunk_index": int(chunk_id[-1])}
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = FactIndex(str(tmp_path / "facts.sqlite3"))
+    index.upsert(list(CHUNKS), [doc for _, doc in CHUNKS.values()], [meta(c) for c in CHUNKS])
+    monkeypatch.setattr(fact_index, "_index", index)
+    return index
+
+
+@pytest.mark.parametrize("field, values", [
+    ("origin_path", ["docs/a.md"]),
+    ("origin_path", ["docs/a.md", "docs/b.md"]),
+    ("source", ["b.md"]),
+    ("source", ["a.md", "b.md", "missing.md"]),
+])
+def test_facts_in_files_matches_the_sql_lookup(index, field, values):
+    assert index.facts_in_files(field, values) == index.facts({field: {"$in": values}})
+
+
+def test_snapshot_is_reloaded_only_after_a_write(index):
+    assert index.count() == 4
+    snapshot = index._snapshot
+    index.facts_in_files("source", ["a.md"])
+    assert index._snapshot is snapshot
+    index.delete(["c__0"])
+    assert index.count() == 3
+    assert index._snapshot is not snapshot
+    assert index.facts_in_files("source", ["b.md"])["shipping"][0]["free_over"] == 100
+
+
+def test_returned_facts_are_copies(index):
+    index.facts_in_files("origin_path", ["docs/a.md"])["discount"][0]["sources"].append("x.md")
+    assert index.facts()["discount"][0]["sources"] == ["a.md", "b.md"]
+
+
+def test_facts_for_query_is_scoped_to_retrieved_files_and_kinds(index):
+    retrieved = [{"id": "c__0", "metadata": meta("c__0")}]
+    assert facts_for_query("free shipping threshold", retrieved) == {
+        "discount": [], "shipping": [{"free_over": 75, "source": "b.md", "sources": ["b.md"], "chunk_ids": ["c__0"]}]}
+    facts = facts_for_query("discounts", [{"id": "a__1", "metadata": meta("a__1")}])
+    assert [f["code"] for f in facts["discount"]] == ["SAVE15", "WELCOME10"] and facts["shipping"] == []
+    # a named code comes from any file, a where filter still applies
+    assert [f["code"] for f in facts_for_query("WELCOME10 at checkout", retrieved)["discount"]] == ["WELCOME10"]
+    facts = facts_for_query("shipping", [{"id": "b__0", "metadata": meta("b__0")}], where={"source": "a.md"})
+    assert facts == {"discount": [], "shipping": []}
+
+
+def test_facts_for_query_without_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(fact_index, "_index", FactIndex(str(tmp_path / "empty.sqlite3")))
+    assert facts_for_query("discounts", [{"id": "a__0", "metadata": meta("a__0")}]) is None
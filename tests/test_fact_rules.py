@@ -0,0 +1,91 @@
+# tests/test_fact_rules.py
+import pytest
+
+from backend.agent_tools import (FACT_RULES, compile_fact_rules, extract_facts, extract_facts_batch,
+                                 generate_test_cases_from_facts)
+
+
+def test_extracts_discount_and_shipping_facts():
+    facts = extract_facts("Use code SAVE15 for 15% off on orders above $50. Shipping is free for orders over $100.")
+    assert facts == {"discount": [{"code": "SAVE15", "percent": 15, "min_order": 50}],
+                     "shipping": [{"free_over": 100}]}
+
+
+def test_binds_values_to_the_code_in_the_same_sentence():
+    text = ("Promo code SAVE10 gives 10% off on orders above $30. "
+            "Promo code SAVE25 gives 25% off on orders above $120.")
+    assert extract_facts(text)["discount"] == [
+        {"code": "SAVE10", "percent": 10, "min_order": 30},
+        {"code": "SAVE25", "percent": 25, "min_order": 120},
+    ]
+
+
+def test_value_before_the_code_and_missing_values():
+    facts = extract_facts("Get 20% off with coupon WELCOME20. Also try promo FREESHIP.")
+    assert facts["discount"] == [
+        {"code": "WELCOME20", "percent": 20, "min_order": None},
+        {"code": "FREESHIP", "percent": None, "min_order": None},
+    ]
+
+
+def test_value_in_another_codes_sentence_is_not_borrowed():
+    assert extract_facts("Code SAVE10: 10% off. Code SAVE20 applies too.")["discount"] == [
+        {"code": "SAVE10", "percent": 10, "min_order": None},
+        {"code": "SAVE20", "percent": None, "min_order": None},
+    ]
+
+
+def test_percent_is_a_whole_number_up_to_100():
+    assert extract_facts("Code FULL100: 100% off.")["discount"][0]["percent"] == 100
+    # not the "00%" of "100%", nor the "50%" of "150%"
+    assert extract_facts("Code VIP10 with 100% satisfaction.")["discount"][0]["percent"] == 100
+    assert extract_facts("Code BIG150: 150% bonus points.")["discount"][0]["percent"] is None
+
+
+def test_lower_case_words_are_not_codes():
+    assert extract_facts("Enter the coupon code: Apply it at checkout.")["discount"] == []
+
+
+def test_repeated_code_with_same_values_is_one_fact():
+    facts = extract_facts("Code SAVE15: 15% off. Remember, code SAVE15: 15% off.")
+    assert facts["discount"] == [{"code": "SAVE15", "percent": 15, "min_order": None}]
+
+
+def test_batch_keeps_chunks_apart():
+    texts = ["Use code SAVE15 today", "15% off on orders above $50.", None, "Shipping is free for orders over $75."]
+    assert extract_facts_batch(texts) == [
+        {"discount": [{"code": "SAVE15", "percent": None, "min_order": None}], "shipping": []},
+        {"discount": [], "shipping": []},
+        {"discount": [], "shipping": []},
+        {"discount": [], "shipping": [{"free_over": 75}]},
+    ]
+    assert extract_facts_batch(texts) == [extract_facts(t or "") for t in texts]
+
+
+def test_extra_rule_adds_a_fact_kind():
+    rule = {"name": "return_days", "kind": "returns", "role": "anchor", "type": int, "first": "r",
+            "pattern": r'returns?\s+within\s+(?P<return_days>\d+)\s+days'}
+    ruleset = compile_fact_rules(FACT_RULES + [rule])
+    facts = extract_facts_batch(["Returns within 30 days. Code SAVE15: 15% off."], ruleset)[0]
+    assert facts["returns"] == [{"return_days": 30}]
+    assert facts["discount"] == [{"code": "SAVE15", "percent": 15, "min_order": None}]
+
+
+def test_compile_rejects_malformed_rules():
+    with pytest.raises(ValueError):
+        compile_fact_rules(FACT_RULES + [dict(FACT_RULES[0])])
+    with pytest.raises(ValueError):
+        compile_fact_rules([{"name": "x", "kind": "k", "role": "value", "type": int, "pattern": r'(?P<x>\d)'}])
+    with pytest.raises(ValueError):
+        compile_fact_rules([{"name": "x", "kind": "k", "role": "anchor", "type": int, "pattern": r'(\d)'}])
+
+
+def test_testcases_are_numbered_from_the_given_start():
+    discount = [{"code": "SAVE15", "percent": 15, "min_order": 50, "source": "a.md", "sources": ["a.md", "b.md"]}]
+    shipping = [{"free_over": 100, "source": "b.md"}]
+    testcases = generate_test_cases_from_facts(discount, shipping, discount_start=3, shipping_start=7)
+    assert [tc["Test_ID"] for tc in testcases] == ["TC-DISCOUNT-003", "TC-DISCOUNT-003-NEG",
+                                                   "TC-SHIP-007", "TC-SHIP-007-NEG"]
+    assert testcases[0]["Grounded_In"] == ["a.md", "b.md"]
+    assert testcases[0]["Expected_Result"] == "Order total is reduced by 15%."
+    assert testcases[2]["Grounded_In"] == ["b.md"]
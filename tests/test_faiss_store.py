@@ -0,0 +1,99 @@
+# tests/test_faiss_store.py
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from backend.faiss_store import FaissStore  # noqa: E402
+
+DIM = 8
+
+
+def vec(i: int) -> np.ndarray:
+    v = np.zeros(DIM, dtype=np.float32)
+    v[i % DIM] = 1.0
+    return v
+
+
+def add(store, ids, origin_path="docs/a.md"):
+    store.upsert(ids, np.stack([vec(int(i.split("__")[1])) for i in ids]), [f"text of {i}" for i in ids],
+                 [{"source": os.path.basename(origin_path), "origin_path": origin_path,
+                   "chunk_index": int(i.split("__")[1])} for i in ids])
+
+
+@pytest.fixture(params=["flat", "hnsw"])
+def store(request, tmp_path):
+    return FaissStore(str(tmp_path / "faiss"), index_type=request.param)
+
+
+def test_upsert_tombstones_the_replaced_row(store):
+    add(store, ["a__0", "a__1", "a__2"])
+    store.upsert(["a__1"], np.stack([vec(1)]), ["new text"], [{"origin_path": "docs/a.md", "chunk_index": 1}])
+    assert store.count() == 3
+    assert store.info()["vectors"] == 4 and store.info()["deleted"] == 1
+    result = store.query([vec(1)], n_results=1, include=["documents", "distances"])
+    assert result["ids"] == [["a__1"]] and result["documents"] == [["new text"]]
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert store.get(ids=["a__1"])["documents"] == ["new text"]
+
+
+def test_deleted_rows_are_never_returned(store):
+    add(store, ["a__0", "a__1"])
+    add(store, ["b__2", "b__3"], origin_path="docs/b.md")
+    store.delete(ids=["a__0"])
+    store.delete(where={"origin_path": "docs/b.md"})
+    assert store.count() == 1
+    result = store.query([vec(0)], n_results=4)
+    assert result["ids"] == [["a__1"]]
+    assert store.get()["ids"] == ["a__1"]
+
+
+def test_where_filter_is_applied_before_top_k(store):
+    add(store, ["a__0", "a__1"])
+    add(store, ["b__2"], origin_path="docs/b.md")
+    result = store.query([vec(0)], n_results=1, where={"origin_path": "docs/b.md"})
+    assert result["ids"] == [["b__2"]]
+    assert store.query([vec(0)], n_results=1, where={"source": {"$in": []}})["ids"] == [[]]
+
+
+def test_persist_compacts_when_enough_rows_are_deleted(store):
+    add(store, [f"a__{i}" for i in range(8)])
+    store.persist()
+    store.delete(ids=["a__1"])
+    store.persist()
+    # 1 of 8 deleted is below FAISS_COMPACT_RATIO: the files are kept
+    assert store.info()["epoch"] == 0 and store.info()["deleted"] == 1
+
+    store.delete(ids=["a__2", "a__3"])
+    store.persist()
+    info = store.info()
+    assert (info["epoch"], info["vectors"], info["deleted"]) == (1, 5, 0)
+    if store.index_type == "hnsw":
+        assert info["indexed"] == 5
+    files = sorted(os.listdir(store.directory))
+    assert not [f for f in files if f.split(".")[1:2] == ["0"]]
+    assert store.get()["ids"] == ["a__0", "a__4", "a__5", "a__6", "a__7"]
+    for i in (0, 4, 7):
+        assert store.query([vec(i)], n_results=1)["ids"] == [[f"a__{i}"]]
+    embeddings = store.get(ids=["a__5"], include=["embeddings"])["embeddings"]
+    assert np.allclose(embeddings[0], vec(5))
+
+
+def test_writes_after_persist_are_searched_exactly(store):
+    add(store, [f"a__{i}" for i in range(4)])
+    store.persist()
+    add(store, ["b__5"], origin_path="docs/b.md")
+    assert store.info()["vectors"] == 5
+    assert store.query([vec(5)], n_results=1)["ids"] == [["b__5"]]
+
+
+def test_store_reopens_with_its_own_index_type(tmp_path):
+    directory = str(tmp_path / "faiss")
+    add(FaissStore(directory, index_type="flat"), ["a__0", "a__1"])
+    reopened = FaissStore(directory, index_type="hnsw")
+    assert reopened.index_type == "flat"
+    assert reopened.count() == 2
+    with pytest.raises(ValueError):
+        FaissStore(directory, index_type="lsh")
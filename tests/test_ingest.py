@@ -0,0 +1,161 @@
+# tests/test_ingest.py
+import hashlib
+
+import numpy as np
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+from backend import fact_index, lexical_index, vector_store as vector_store_module  # noqa: E402
+
+# ~2000 characters: four chunks of CHUNK_SIZE 800 with CHUNK_OVERLAP 200
+LONG_TEXT = " ".join(f"word{i:04d}" for i in range(222))
+
+
+class StubEncoder:
+    """Deterministic stand-in for backend.encoder.embed_texts that records every text it embeds."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, texts, show_progress_bar=False):
+        self.embedded.extend(texts)
+        return np.stack([np.frombuffer(hashlib.sha256(t.encode("utf-8")).digest(), dtype=np.uint8)
+                         .astype(np.float32) for t in texts])
+
+
+@pytest.fixture
+def vector_store(tmp_path, monkeypatch):
+    """backend.vector_store working in an empty directory, on its own Chroma store, BM25 index
+       and fact index, with a stub encoder."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vector_store_module, "_client", chromadb.PersistentClient(path=str(tmp_path / "chroma_db")))
+    monkeypatch.setattr(vector_store_module, "embed_texts", StubEncoder())
+    monkeypatch.setattr(lexical_index, "_index", None)
+    monkeypatch.setattr(fact_index, "_index", None)
+    return vector_store_module
+
+
+def ingest(vector_store, *paths):
+    vector_store.embed_texts.embedded.clear()
+    return vector_store.ingest_files([str(p) for p in paths])
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def test_first_ingest_writes_chunks_and_manifest(tmp_path, vector_store):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+    b = write(tmp_path / "b.md", "Use code SAVE15 for 15% off on orders above $50.")
+    result = ingest(vector_store, a, b)
+    assert result["status"] == "ok" and result["added"] == 5
+    assert result["index_generation"] == vector_store.get_index_generation() == 1
+
+    manifest = vector_store.load_manifest()
+    assert len(manifest[str(a)]["chunks"]) == 4 and len(manifest[str(b)]["chunks"]) == 1
+    collection = vector_store.ensure_collection()
+    assert collection.count() == 5
+    meta = collection.get(ids=[vector_store.chunk_id(str(a), 3)])["metadatas"][0]
+    assert (meta["chunk_index"], meta["file_type"], meta["ingest_batch"]) == (3, "txt", 1)
+    # the BM25 and fact indexes mirror the collection
+    assert lexical_index.get_lexical_index().count() == 5
+    assert [r["id"] for r in lexical_index.get_lexical_index().search("save15")] == [vector_store.chunk_id(str(b), 0)]
+    assert fact_index.get_fact_index().facts()["discount"][0]["code"] == "SAVE15"
+
+
+def test_unchanged_files_are_skipped(tmp_path, vector_store):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+    ingest(vector_store, a)
+    result = ingest(vector_store, a)
+    assert result == {"status": "ok", "added": 0, "deleted": 0, "skipped_files": 1, "failed_batches": 0}
+    assert vector_store.embed_texts.embedded == []
+    assert vector_store.get_index_generation() == 1
+
+
+def test_changed_file_only_reembeds_changed_chunks(tmp_path, vector_store):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+    ingest(vector_store, a)
+    # the end of the text is in the last two (overlapping) chunks only
+    write(a, LONG_TEXT[:-4] + "XXXX")
+    result = ingest(vector_store, a)
+    assert result["added"] == 2 and result["deleted"] == 0
+    embedded = vector_store.embed_texts.embedded
+    assert len(embedded) == 2 and all(t.endswith("XXXX") for t in embedded)
+    assert vector_store.ensure_collection().count() == 4
+    assert vector_store.get_index_generation() == 2
+
+
+def test_shrunk_and_removed_files_are_deleted(tmp_path, vector_store):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+    b = write(tmp_path / "b.md", "Shipping is free for orders over $100.")
+    ingest(vector_store, a, b)
+
+    write(a, LONG_TEXT[:700])
+    b.unlink()
+    result = ingest(vector_store, a)
+    assert result["deleted"] == 3 + 1 and result["added"] == 1
+    manifest = vector_store.load_manifest()
+    assert list(manifest) == [str(a)] and len(manifest[str(a)]["chunks"]) == 1
+    assert vector_store.ensure_collection().get()["ids"] == [vector_store.chunk_id(str(a), 0)]
+    assert lexical_index.get_lexical_index().search("free shipping") == []
+    assert fact_index.get_fact_index().facts()["shipping"] == []
+
+
+def test_file_of_a_failed_batch_is_retried(tmp_path, vector_store, monkeypatch):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+
+    def fail(texts, show_progress_bar=False):
+        raise RuntimeError("encoder down")
+
+    with monkeypatch.context() as m:
+        m.setattr(vector_store, "embed_texts", fail)
+        vector_store.ingest_files([str(a)])
+    assert str(a) not in vector_store.load_manifest()
+    result = ingest(vector_store, a)
+    assert result["added"] == 4 and len(vector_store.embed_texts.embedded) == 4
+    assert str(a) in vector_store.load_manifest()
+
+
+def test_manifest_saves_are_throttled(tmp_path, vector_store, monkeypatch):
+    paths = [write(tmp_path / f"{i}.md", f"Document number {i}.") for i in range(4)]
+    saves = []
+    save_manifest = vector_store.save_manifest
+
+    def counting_save(manifest):
+        saves.append(len(manifest))
+        save_manifest(manifest)
+
+    monkeypatch.setattr(vector_store, "save_manifest", counting_save)
+    vector_store.ingest_files([str(p) for p in paths], batch_size=1)
+    # one save at the end of the run, not one per batch
+    assert saves == [4]
+
+    monkeypatch.setattr(vector_store, "MANIFEST_SAVE_INTERVAL_S", 0)
+    saves.clear()
+    for p in paths:
+        write(p, p.read_text(encoding="utf-8") + " Changed.")
+    vector_store.ingest_files([str(p) for p in paths], batch_size=1)
+    assert saves == [4, 4, 4, 4]
+
+
+def test_embedding_backend_change_reembeds_everything(tmp_path, vector_store, monkeypatch):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+    ingest(vector_store, a)
+    assert vector_store.load_manifest()[str(a)]["embedding"] == vector_store.embedding_cache_key()
+    monkeypatch.setattr(vector_store, "embedding_cache_key", lambda: "all-MiniLM-L6-v2/onnx-int8")
+    result = ingest(vector_store, a)
+    assert result["added"] == 4 and len(vector_store.embed_texts.embedded) == 4
+    assert vector_store.load_manifest()[str(a)]["embedding"] == "all-MiniLM-L6-v2/onnx-int8"
+    assert ingest(vector_store, a)["skipped_files"] == 1
+
+
+def test_manifest_without_embedding_counts_as_torch(tmp_path, vector_store, monkeypatch):
+    a = write(tmp_path / "a.txt", LONG_TEXT)
+    ingest(vector_store, a)
+    manifest = vector_store.load_manifest()
+    del manifest[str(a)]["embedding"]
+    vector_store.save_manifest(manifest)
+    monkeypatch.setattr(vector_store, "embedding_cache_key", lambda: vector_store.EMBED_MODEL_NAME)
+    assert ingest(vector_store, a)["skipped_files"] == 1
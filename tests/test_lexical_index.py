@@ -0,0 +1,66 @@
+# tests/test_lexical_index.py
+import pytest
+
+from backend.lexical_index import LexicalIndex, tokenize
+from backend.retrieval import reciprocal_rank_fusion
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    docs = {
+        "a__0": ("Use code SAVE15 for 15% off orders above $50.", "docs/a.md"),
+        "a__1": ("Shipping is free for orders over $100.", "docs/a.md"),
+        "b__0": ("The checkout page has a coupon_input field and a pay button.", "docs/b.html"),
+        "b__1": ("Orders ship within two days. Orders can be returned.", "docs/b.html"),
+    }
+    index.upsert(list(docs), [d for d, _ in docs.values()],
+                 [{"source": p.split("/")[-1], "origin_path": p, "chunk_index": int(i[-1])}
+                  for i, (_, p) in docs.items()])
+    return index
+
+
+def test_tokenize_keeps_codes_amounts_and_ids():
+    assert tokenize("Apply SAVE15 on $50 in #coupon_input") == ["apply", "save15", "on", "50", "in", "coupon_input"]
+
+
+def test_search_ranks_matching_chunk_first(index):
+    results = index.search("save15 discount", top_k=2)
+    assert [r["id"] for r in results] == ["a__0"]
+    assert results[0]["doc_id"] == "a.md__0"
+    assert results[0]["distance"] is None and results[0]["bm25_score"] > 0
+
+
+def test_search_skips_terms_in_most_chunks(index):
+    # "orders" is in 3 of 4 chunks: with an informative term present it does not add matches
+    assert [r["id"] for r in index.search("orders coupon_input")] == ["b__0"]
+
+
+def test_search_with_where(index):
+    assert {r["id"] for r in index.search("orders")} == {"a__0", "a__1", "b__1"}
+    assert {r["id"] for r in index.search("orders", where={"origin_path": "docs/a.md"})} == {"a__0", "a__1"}
+    assert index.search("orders", where={"source": {"$in": []}}) == []
+
+
+def test_upsert_replaces_and_delete_origin(index):
+    assert index.count() == 4
+    index.upsert(["a__0"], ["Use code WELCOME10 now."], [{"source": "a.md", "origin_path": "docs/a.md"}])
+    assert index.count() == 4
+    assert index.search("save15") == []
+    assert [r["id"] for r in index.search("welcome10")] == ["a__0"]
+    index.delete_origin("docs/a.md")
+    assert index.count() == 2
+    assert index.search("welcome10") == []
+    index.delete(["b__0"])
+    assert index.count() == 1
+
+
+def test_reciprocal_rank_fusion_merges_rankings():
+    dense = [{"doc_id": "x", "distance": 0.1}, {"doc_id": "y", "distance": 0.2}]
+    lexical = [{"doc_id": "y", "distance": None, "bm25_score": 3.0}, {"doc_id": "z", "distance": None, "bm25_score": 1.0}]
+    fused = reciprocal_rank_fusion([dense, lexical], top_k=3)
+    assert [d["doc_id"] for d in fused] == ["y", "x", "z"]
+    # the dense distance survives and the BM25 score is merged in
+    assert fused[0]["distance"] == 0.2 and fused[0]["bm25_score"] == 3.0
+    assert fused[0]["rrf_score"] > fused[1]["rrf_score"]
+    assert len(reciprocal_rank_fusion([dense, lexical], top_k=1)) == 1
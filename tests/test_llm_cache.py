@@ -0,0 +1,47 @@
+# tests/test_llm_cache.py
+from backend.llm_cache import LLMResponseCache, llm_cache_key
+
+
+def test_llm_cache_key_covers_model_tokens_and_prompt():
+    key = llm_cache_key("gpt-4o-mini", 512, "prompt")
+    assert key == llm_cache_key("gpt-4o-mini", 512, "prompt")
+    assert key != llm_cache_key("gpt-4o", 512, "prompt")
+    assert key != llm_cache_key("gpt-4o-mini", 256, "prompt")
+    assert key != llm_cache_key("gpt-4o-mini", 512, "prompt ")
+
+
+def test_llm_cache_hit_and_generation_miss(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"))
+    cache.put("k", "answer", generation=1)
+    assert cache.get("k", generation=1) == "answer"
+    # an answer from another index generation is dropped, not served
+    assert cache.get("k", generation=2) is None
+    assert cache.get("k", generation=1) is None
+    assert cache.info()["size"] == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_llm_cache_invalidate_generation(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"))
+    cache.put("old", "a", generation=1)
+    cache.put("new", "b", generation=2)
+    assert cache.invalidate_generation(2) == 1
+    assert cache.info()["size"] == 1
+    assert cache.get("new", generation=2) == "b"
+    # entries survive reopening the file
+    assert LLMResponseCache(str(tmp_path / "llm.sqlite3")).get("new", generation=2) == "b"
+
+
+def test_llm_cache_expiry_and_eviction(tmp_path):
+    expired = LLMResponseCache(str(tmp_path / "expired.sqlite3"), ttl=-1)
+    expired.put("k", "a", generation=0)
+    assert expired.get("k", generation=0) is None
+
+    cache = LLMResponseCache(str(tmp_path / "lru.sqlite3"), max_entries=2)
+    cache.put("a", "1", generation=0)
+    cache.put("b", "2", generation=0)
+    cache.put("b", "2", generation=0)   # replacing a key does not grow the cache
+    cache.put("c", "3", generation=0)
+    assert cache.info()["size"] == 2
+    assert cache.get("a", generation=0) is None
+    assert cache.get("c", generation=0) == "3"
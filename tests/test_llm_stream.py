@@ -0,0 +1,87 @@
+# tests/test_llm_stream.py
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.app as app_module
+from backend import llm_client
+
+
+def _sse_body(*events):
+    return "".join(f"data: {e}\n\n" for e in events)
+
+
+def _stream(monkeypatch, body):
+    def handler(request):
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+    monkeypatch.setattr(llm_client, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm_client, "_async_client",
+                        httpx.AsyncClient(base_url="http://llm.test", transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm_client, "_async_semaphore", None)
+
+    async def collect():
+        return [delta async for delta in llm_client.astream_llm("prompt")]
+    return asyncio.run(collect())
+
+
+def test_astream_llm_yields_deltas(monkeypatch):
+    body = _sse_body(json.dumps({"choices": [{"delta": {"content": "Hel"}}]}),
+                     json.dumps({"choices": [{"delta": {"content": "lo"}}]}), "[DONE]")
+    assert _stream(monkeypatch, body) == ["Hel", "lo"]
+
+
+def test_astream_llm_raises_llm_error_on_malformed_event(monkeypatch):
+    body = _sse_body(json.dumps({"choices": [{"delta": {"content": "Hel"}}]}), "{not json", "[DONE]")
+    with pytest.raises(llm_client.LLMError, match="malformed stream event: JSONDecodeError: {not json"):
+        _stream(monkeypatch, body)
+
+
+def _events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_query_agent_stream_sends_error_event_for_malformed_stream(monkeypatch):
+    retrieved = [{"id": "a", "document": "doc", "metadata": {"source": "a.md"}, "distance": 0.1}]
+
+    async def broken_stream(prompt, max_tokens=400):
+        yield "partial "
+        raise llm_client.LLMError("malformed stream event: JSONDecodeError: {not json")
+
+    monkeypatch.setattr(app_module, "retrieve_with_stages", lambda *a, **kw: (retrieved, {"timings_ms": {}}))
+    monkeypatch.setattr(app_module, "semantic_cached_answer", lambda query, docs: None)
+    monkeypatch.setattr(app_module, "cached_llm_answer", lambda prompt: None)
+    monkeypatch.setattr(app_module, "record_llm_usage", lambda prompt, result: None)
+    monkeypatch.setattr(app_module, "astream_llm", broken_stream)
+
+    # no lifespan: warmup would open the on-disk collection
+    resp = TestClient(app_module.app).post("/query_agent_stream", json={"query": "discount", "top_k": 1})
+    events = _events(resp.text)
+    assert [e for e, _ in events] == ["retrieved", "token", "error"]
+    assert events[-1][1] == {"error": "malformed stream event: JSONDecodeError: {not json",
+                             "partial_answer": "partial "}
+
+
+def test_query_agent_stream_semantic_hit_skips_the_prompt(monkeypatch):
+    retrieved = [{"id": "a", "document": "doc", "metadata": {"source": "a.md"}, "distance": 0.1}]
+
+    def no_prompt(query, docs):
+        raise AssertionError("prompt built for a semantic cache hit")
+
+    monkeypatch.setattr(app_module, "retrieve_with_stages", lambda *a, **kw: (retrieved, {"timings_ms": {}}))
+    monkeypatch.setattr(app_module, "semantic_cached_answer",
+                        lambda query, docs: {"answer": "15% off", "query": "discount?", "distance": 0.02})
+    monkeypatch.setattr(app_module, "_build_prompt", no_prompt)
+
+    resp = TestClient(app_module.app).post("/query_agent_stream", json={"query": "discount", "top_k": 1})
+    events = _events(resp.text)
+    assert [e for e, _ in events] == ["retrieved", "token", "done"]
+    done = events[-1][1]
+    assert done["answer"] == "15% off"
+    assert done["cache"] == {"type": "semantic", "matched_query": "discount?", "distance": 0.02}
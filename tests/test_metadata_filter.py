@@ -0,0 +1,75 @@
+# tests/test_metadata_filter.py
+import json
+import sqlite3
+
+import pytest
+
+from backend.metadata_filter import build_where, where_to_sql
+
+ROWS = [
+    ("docs/a.md", {"source": "a.md", "file_type": "md", "ingest_batch": 1}),
+    ("docs/b.html", {"source": "b.html", "file_type": "html", "ingest_batch": 2}),
+    ("other/b.html", {"source": "b.html", "file_type": "html", "ingest_batch": 3}),
+]
+
+
+@pytest.fixture
+def conn():
+    # same columns as the SQLite sidecars: origin_path plus JSON metadata
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE chunks (origin_path TEXT, metadata TEXT)")
+    conn.executemany("INSERT INTO chunks VALUES (?, ?)", [(p, json.dumps(m)) for p, m in ROWS])
+    return conn
+
+
+def matching(conn, where):
+    condition, params = where_to_sql(where)
+    return [r[0] for r in conn.execute(f"SELECT origin_path FROM chunks WHERE {condition} ORDER BY rowid", params)]
+
+
+def test_build_where_single_and_lists():
+    assert build_where() is None
+    assert build_where(source="a.md") == {"source": "a.md"}
+    assert build_where(source=["a.md", "b.html"]) == {"source": {"$in": ["a.md", "b.html"]}}
+    assert build_where(source="a.md", ingest_batch=[1, 2]) == {
+        "$and": [{"source": "a.md"}, {"ingest_batch": {"$in": [1, 2]}}]}
+
+
+def test_build_where_normalizes_file_types():
+    assert build_where(file_type=[".HTML", "md"]) == {"file_type": {"$in": ["html", "md"]}}
+
+
+def test_build_where_rejects_empty_lists():
+    with pytest.raises(ValueError):
+        build_where(source=[])
+    with pytest.raises(ValueError):
+        build_where(source="a.md", origin_path=())
+
+
+def test_where_to_sql_no_filter(conn):
+    assert where_to_sql(None) == ("1", [])
+    assert matching(conn, {}) == ["docs/a.md", "docs/b.html", "other/b.html"]
+
+
+def test_where_to_sql_operators(conn):
+    assert matching(conn, {"source": "b.html"}) == ["docs/b.html", "other/b.html"]
+    assert matching(conn, {"origin_path": "docs/a.md"}) == ["docs/a.md"]
+    assert matching(conn, {"ingest_batch": {"$in": [1, 3]}}) == ["docs/a.md", "other/b.html"]
+    assert matching(conn, {"ingest_batch": {"$nin": [1, 3]}}) == ["docs/b.html"]
+    assert matching(conn, {"file_type": {"$ne": "html"}}) == ["docs/a.md"]
+    assert matching(conn, {"source": {"$in": []}}) == []
+    assert matching(conn, {"source": {"$nin": []}}) == ["docs/a.md", "docs/b.html", "other/b.html"]
+
+
+def test_where_to_sql_and_or(conn):
+    assert matching(conn, {"$and": [{"source": "b.html"}, {"ingest_batch": 3}]}) == ["other/b.html"]
+    assert matching(conn, {"$or": [{"file_type": "md"}, {"ingest_batch": 3}]}) == ["docs/a.md", "other/b.html"]
+    # build_where output is accepted as is
+    assert matching(conn, build_where(file_type=".HTML", origin_path=["docs/b.html", "docs/a.md"])) == ["docs/b.html"]
+
+
+def test_where_to_sql_rejects_unsafe_input():
+    with pytest.raises(ValueError):
+        where_to_sql({"source') OR 1=1 --": "x"})
+    with pytest.raises(ValueError):
+        where_to_sql({"ingest_batch": {"$gt": 1}})
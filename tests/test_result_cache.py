@@ -0,0 +1,58 @@
+# tests/test_result_cache.py
+from backend import retrieval
+from backend.result_cache import TTLCache
+
+
+def test_ttl_cache_lru_and_expiry():
+    cache = TTLCache(maxsize=2, ttl=300)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1          # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.info()["evictions"] == 1
+
+    expired = TTLCache(maxsize=2, ttl=-1)
+    expired.put("a", 1)
+    assert expired.get("a") is None
+
+
+def test_retrieval_cache_keyed_by_normalized_query_and_generation(monkeypatch):
+    generation = {"value": 1}
+    searched = []
+
+    def search(queries, top_k, where=None, with_embeddings=False):
+        searched.extend(queries)
+        return [[{"doc_id": f"a.md__{len(searched)}"}] for _ in queries]
+
+    monkeypatch.setattr(retrieval, "get_index_generation", lambda: generation["value"])
+    monkeypatch.setattr(retrieval, "_query_collection", search)
+    monkeypatch.setattr(retrieval, "retrieval_cache", TTLCache(maxsize=8, ttl=300))
+    monkeypatch.setattr(retrieval, "_cache_generation", {"value": None})
+
+    first = retrieval.retrieve_topk("Discount  codes?", top_k=3)
+    assert retrieval.retrieve_topk("discount codes?", top_k=3) == first
+    assert len(searched) == 1
+    retrieval.retrieve_topk("discount codes?", top_k=5)
+    assert len(searched) == 2
+    # callers get copies: annotating a result does not change the cached entry
+    first[0]["score"] = 1.0
+    assert "score" not in retrieval.retrieve_topk("discount codes?", top_k=3)[0]
+
+    # a new index generation empties the cache
+    generation["value"] = 2
+    assert retrieval.retrieve_topk("discount codes?", top_k=3) != first
+    assert len(searched) == 3
+    assert retrieval.retrieval_cache.info()["size"] == 1
+
+    # a batch searches each distinct normalized query once
+    searched.clear()
+    batch = retrieval.retrieve_topk_batch(["shipping", "Shipping ", "discount codes?"], top_k=3)
+    assert searched == ["shipping"]
+    assert batch[0] == batch[1]
+
+    # filtered and unfiltered searches are cached apart
+    searched.clear()
+    retrieval.retrieve_topk("shipping", top_k=3, where={"source": "a.md"})
+    assert searched == ["shipping"]
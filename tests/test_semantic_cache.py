@@ -0,0 +1,32 @@
+# tests/test_semantic_cache.py
+import numpy as np
+
+from backend.semantic_cache import SemanticAnswerCache
+
+
+def test_semantic_cache_near_duplicate_hit():
+    cache = SemanticAnswerCache(max_entries=4, max_distance=0.05)
+    cache.store("discount for SAVE15", np.array([1.0, 0.0, 0.0]), ["c1", "c2"], "15% off", generation=1)
+    hit = cache.lookup(np.array([0.99, 0.05, 0.0]), ["c2", "c1"], generation=1)
+    assert hit["answer"] == "15% off" and hit["query"] == "discount for SAVE15"
+    assert cache.lookup(np.array([0.0, 1.0, 0.0]), ["c1", "c2"], generation=1) is None
+
+
+def test_semantic_cache_rejects_other_chunks_and_generations():
+    cache = SemanticAnswerCache(max_entries=4, max_distance=0.05)
+    cache.store("q", np.array([1.0, 0.0]), ["c1"], "a", generation=1)
+    assert cache.lookup(np.array([1.0, 0.0]), ["c1", "c2"], generation=1) is None
+    assert cache.false_hits == 1
+    # a new index generation empties the cache
+    assert cache.lookup(np.array([1.0, 0.0]), ["c1"], generation=2) is None
+    assert cache.info()["size"] == 0
+    assert cache.lookup(np.array([1.0, 0.0]), ["c1"], generation=1) is None
+
+
+def test_semantic_cache_ring_buffer_overwrites_oldest():
+    cache = SemanticAnswerCache(max_entries=2, max_distance=0.01)
+    for i, vec in enumerate(np.eye(3)):
+        cache.store(f"q{i}", vec, ["c"], f"a{i}", generation=0)
+    assert cache.info()["size"] == 2
+    assert cache.lookup(np.eye(3)[0], ["c"], generation=0) is None
+    assert cache.lookup(np.eye(3)[2], ["c"], generation=0)["answer"] == "a2"